@@ -0,0 +1 @@
+default_app_config = 'orchid_app.apps.OrchidAppConfig'
@@ -2,6 +2,8 @@ from django.contrib import admin
 
 from .models import Sensors
 from .models import Actions
+from .models import SensorsSpread
 
 admin.site.register(Sensors)
 admin.site.register(Actions)
+admin.site.register(SensorsSpread)
@@ -1,7 +1,12 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class OrchidAppConfig(AppConfig):
     name = 'orchid_app'
+
+    def ready(self):
+        from orchid_app import checks, db  # Import of checks registers them.
+        connection_created.connect(db.on_connection_created, dispatch_uid='orchid_app.db.pragmas')
@@ -0,0 +1,331 @@
+'''
+In-memory caches of DB derived data.
+Minimize DB round-trips of the control loop and page loading time.
+
+ActionsCache keeps everything the controller asks about the Actions table:
+last action, last automated action, last timer, and last automated on/off per actuator.
+The cache is write-through: controller.activate() pushes every new record into it.
+Records written by other processes (web vs. runner) are caught up by sync(), which is a single indexed query.
+
+SensorsWindows keeps running sums and counts of Sensors records per averaging window.
+The runner pushes every saved record into it, records older than the window are evicted on read.
+
+Snapshot keeps JSON data in a file shared by the processes. The control loop of the runner builds it,
+the web reads it. Writer invalidates it explicitly, data older than max_age is ignored.
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from collections import defaultdict, deque
+from django.db import DatabaseError
+from django.conf import settings
+from django.core import exceptions
+from django.utils import timezone
+
+from orchid_app import models
+
+# Kind of action is indexed. Reasons are free text: timer on and off are told apart by case insensitive contains.
+KIND_AUTOMATE = models.Actions.AUTOMATE
+KIND_TIMER = models.Actions.TIMER
+TIMER_ON = 'with timer'
+TIMER_OFF = 'timer off'
+
+
+def _has(reason, word):
+    return word in (reason or '').lower()
+
+
+def _aware(date):
+    '''Keep all dates in the same form as read from the DB.'''
+    if settings.USE_TZ and timezone.is_naive(date):
+        return timezone.make_aware(date).astimezone(timezone.utc)
+    return date
+
+
+def _now():
+    return timezone.now() if settings.USE_TZ else datetime.now()
+
+
+class ActionsCache(object):
+    '''Keep last known actuators state.
+    All lookups are O(1) and don't touch the DB. Only load() and sync() read the DB.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.loaded = False
+        self.last_id = 0
+        self.last = None              # Last Actions record.
+        self.last_automated = None    # Last record of 'automate' kind.
+        self.last_timer_off = None    # Last record of 'timer' kind with 'timer off' reason.
+        self.last_timer = None        # Last record of 'timer' kind with 'with timer' reason.
+        self.timer_off = set()        # Actuators turned off after last_timer record.
+        self.automated_on = {}        # actuator: date of last automated turn on.
+        self.automated_off = {}       # actuator: date of first automated turn off after automated_on.
+
+    @staticmethod
+    def actuators():
+        return models.Actions().get_all_fields().keys()
+
+    def load(self):
+        '''Rebuild the cache from the Actions table. Call on startup.'''
+
+        with self._lock:
+            self.reset()
+            try:
+                qs = models.Actions.objects
+                self.last = qs.order_by('id').last()
+                if not self.last:
+                    self.loaded = True
+                    return
+
+                self.last_id = self.last.id
+                self.last_automated = qs.filter(kind=KIND_AUTOMATE).order_by('id').last()
+                # Few timer records: the reason is checked on (kind, id) index range only.
+                timers = qs.filter(kind=KIND_TIMER).order_by('id')
+                self.last_timer_off = timers.filter(reason__icontains=TIMER_OFF).last()
+                self.last_timer = timers.filter(reason__icontains=TIMER_ON).last()
+                if self.last_timer:
+                    for k, v in self.last_timer.get_all_fields().iteritems():
+                        if v and qs.filter(**{k: False, 'id__gt': self.last_timer.id}).exists():
+                            self.timer_off.add(k)
+
+                for k in self.actuators():
+                    # Served by (actuator, kind, date) index.
+                    on = qs.filter(**{k: True, 'kind': KIND_AUTOMATE}).order_by('date').last()
+                    if not on:
+                        continue
+                    self.automated_on[k] = on.date
+                    off = qs.filter(**{k: False, 'kind': KIND_AUTOMATE, 'date__gt': on.date}).order_by('date').first()
+                    if off:
+                        self.automated_off[k] = off.date
+
+                self.loaded = True
+            except (exceptions.FieldError, ValueError, KeyError, DatabaseError) as e:
+                sys.stderr.write('On Actions cache load: %s (%s)' % (e.message, type(e)))
+
+    def sync(self):
+        '''Catch up records written by other processes. Load the cache on first call.'''
+
+        with self._lock:
+            if not self.loaded:
+                return self.load()
+
+            try:
+                for a in models.Actions.objects.filter(id__gt=self.last_id).order_by('id'):
+                    self._apply(a)
+            except (exceptions.FieldError, ValueError, KeyError, DatabaseError) as e:
+                sys.stderr.write('On Actions cache sync: %s (%s)' % (e.message, type(e)))
+
+    def update(self, action):
+        '''Write-through: add a just saved Actions record.'''
+
+        with self._lock:
+            if action.id is None or action.id <= self.last_id:
+                return
+            action.date = _aware(action.date)
+            self._apply(action)
+
+    def _apply(self, a):
+        self.last = a
+        self.last_id = a.id
+        fields = a.get_all_fields()
+
+        timer = a.kind == KIND_TIMER
+        if timer and _has(a.reason, TIMER_ON):
+            self.last_timer = a
+            self.timer_off = set()
+        elif self.last_timer:
+            self.timer_off.update(k for k, v in fields.iteritems() if not v)
+
+        if timer and _has(a.reason, TIMER_OFF):
+            self.last_timer_off = a
+
+        if a.kind == KIND_AUTOMATE:
+            self.last_automated = a
+            for k, v in fields.iteritems():
+                if v:
+                    self.automated_on[k] = a.date
+                    self.automated_off.pop(k, None)
+                elif k in self.automated_on and k not in self.automated_off:
+                    self.automated_off[k] = a.date
+
+    def get_timer_on(self):
+        '''Return tuple of (last record with timer, list of actuators it turned on and still on).'''
+
+        with self._lock:
+            if not self.last_timer:
+                return None, []
+            was_on = [k for k, v in self.last_timer.get_all_fields().iteritems() if v and k not in self.timer_off]
+            return self.last_timer, was_on
+
+
+class SensorsWindows(object):
+    '''Keep running sum and count of Sensors records for every averaging window (in hours).
+    Averages are calculated exactly as summing the records from the DB: Decimal fields stay Decimal, integer fields stay integer.
+    Records must come in order of date, as the runner writes them.
+    '''
+
+    FIELDS = ('wind', 'hpa', 't_amb', 't_obj', 'rh', 'lux')
+
+    def __init__(self, hours):
+        self._lock = threading.RLock()
+        self.hours = sorted(set(hours))
+        self.reset()
+
+    def reset(self):
+        self.loaded = False
+        self.last_id = 0
+        self.last = None          # Last Sensors record.
+        self._rows = deque()      # (date, values) of the longest window, oldest first.
+        self._first = 0           # Sequence number of self._rows[0].
+        self._windows = dict((h, {'start': 0, 'count': 0, 'sums': defaultdict(int)}) for h in self.hours)
+
+    def load(self):
+        '''Seed the windows from the Sensors table. Call on startup.'''
+
+        with self._lock:
+            self.reset()
+            try:
+                since = _now() - timedelta(hours=self.hours[-1])
+                for s in models.Sensors.objects.filter(date__gte=since).order_by('date'):
+                    self._add(s)
+                last = models.Sensors.objects.order_by('id').last()
+                if last and last.id > self.last_id:
+                    self.last = last
+                    self.last_id = last.id
+                self.loaded = True
+            except (exceptions.FieldError, ValueError, KeyError, DatabaseError) as e:
+                sys.stderr.write('On Sensors cache load: %s (%s)' % (e.message, type(e)))
+
+    def sync(self):
+        '''Catch up records written by other processes. Load the windows on first call.'''
+
+        with self._lock:
+            if not self.loaded:
+                return self.load()
+
+            try:
+                for s in models.Sensors.objects.filter(id__gt=self.last_id).order_by('id'):
+                    self._add(s)
+            except (exceptions.FieldError, ValueError, KeyError, DatabaseError) as e:
+                sys.stderr.write('On Sensors cache sync: %s (%s)' % (e.message, type(e)))
+
+    def update(self, sensors):
+        '''Write-through: add a just saved Sensors record.'''
+
+        with self._lock:
+            if sensors.id is None or sensors.id <= self.last_id:
+                return
+            sensors.date = _aware(sensors.date)
+            self._add(sensors)
+
+    def average(self, hours, now=None):
+        '''Return defaultdict of averages in the same form as controller.calc_avg().
+        Return last record if no records in the window (system was off long time).
+        Return only duration if no records at all (new database).
+        '''
+
+        ed = defaultdict(int)
+        with self._lock:
+            if not self.loaded:
+                self.load()
+            self._evict(now or _now())
+            w = self._windows[hours]
+
+            if w['count']:
+                for k, v in w['sums'].iteritems():
+                    ed[k] = v / w['count']
+            elif self.last:
+                ed.update(self.last.get_all_fields())
+
+        ed['duration'] = hours
+        return ed
+
+    def _add(self, s):
+        values = dict((f, getattr(s, f)) for f in self.FIELDS)
+        self._rows.append((s.date, values))
+        for w in self._windows.itervalues():
+            w['count'] += 1
+            for k, v in values.iteritems():
+                w['sums'][k] += v
+        if s.id > self.last_id:
+            self.last = s
+            self.last_id = s.id
+
+    def _evict(self, now):
+        end = self._first + len(self._rows)
+        for h, w in self._windows.iteritems():
+            cutoff = now - timedelta(hours=h)
+            while w['start'] < end and self._rows[w['start'] - self._first][0] < cutoff:
+                for k, v in self._rows[w['start'] - self._first][1].iteritems():
+                    w['sums'][k] -= v
+                w['count'] -= 1
+                w['start'] += 1
+            if not w['count']:
+                w['sums'] = defaultdict(int)
+
+        # The longest window starts first. Drop records which are out of all windows.
+        while self._first < self._windows[self.hours[-1]]['start']:
+            self._rows.popleft()
+            self._first += 1
+
+
+class Snapshot(object):
+    '''JSON data in a file. Read once per file change.'''
+
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = None
+
+    def get(self):
+        '''Return the data. Return None if there is no data or it's older than max_age.'''
+
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    with open(self.path) as f:
+                        self._data = json.load(f)
+                    self._mtime = mtime
+            except (IOError, OSError, ValueError):
+                self._mtime = self._data = None
+                return None
+
+            if time.time() - self._data.get('built', 0) > self.max_age:
+                return None
+            return self._data
+
+    def put(self, data):
+        '''Keep the data with build time. Replace the file atomically: readers never see partial data.'''
+
+        data['built'] = time.time()
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            sys.stderr.write('On snapshot write: %s (%s)' % (e, type(e)))
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._mtime = self._data = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+actions = ActionsCache()
@@ -0,0 +1,20 @@
+'''
+System checks of the app, run by manage.py check, runserver and migrate.
+'''
+
+from django.core import checks
+
+
+@checks.register()
+def state_criteria(app_configs, **kwargs):
+    '''Warn about overlaps and gaps in criteria of controller.state_list.'''
+
+    from orchid_app import controller
+
+    overlaps, gaps = controller.state_index.check()
+    errors = []
+    for title, items, id in (('overlap', overlaps, 'orchid_app.W001'), ('gap', gaps, 'orchid_app.W002')):
+        for cell, names in items:
+            errors.append(checks.Warning('State criteria %s: %s %s' % (title, ', '.join('%s [%s, %s)' % c for c in cell),
+                                                                      ', '.join(names)), obj='controller.state_list', id=id))
+    return errors
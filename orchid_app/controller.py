@@ -1,19 +1,27 @@
 import os
 import re
 import sys
-import time
 import copy
+import time
+from django.conf import settings
 from django.core import exceptions
+from django.db import DatabaseError
+from django.db.models import Case, Count, F, Sum, Value, When
 from collections import defaultdict
 from datetime import datetime, timedelta
 
-from orchid_app import actuators, models, utils
-from orchid_app.utils import sendmail, pushb, memoize
+from orchid_app import actuators, cache, metrics, models, utils
+from orchid_app.scheduler import Scheduler, MAX_SLEEP
+from orchid_app.state_index import StateIndex
+from orchid_app.utils import notify, memoize
 
 MIN_AVG_HOURS = 0.4   # TODO: reconsider the value
+RECOVERY_AVG_HOURS = 2
+AVG_IN_MEMORY = True  # Average sensors data by rolling sums in memory. False: by single aggregation query in the DB.
 MAX_TIMEOUT = 999999  # Very long time indicated no action was found
 MANUAL_TIMEOUT = 3600
 NO_DATA = -1          # Used in get_current_state()
+STATE_TIMEOUT = 600   # seconds. Recalculate current state not more often.
 VERSION = '0.1.6'
 
 # Global variables:
@@ -93,7 +101,29 @@ state_list = [
      'action': {'mix': {'mist': [30, 30], 'fan': [30, 30]}, 'ac': [60, 0], 'shade': [400, 0]}},  # When t_amb > 36 or t_obj > 25
 ]
 
+# Compiled state_list criteria. Overlaps and gaps are reported by manage.py check (see orchid_app/checks.py).
+state_index = StateIndex(state_list)
+
+# Rolling sums of sensors data for every averaging window in use. Saves re-reading of up to 24 hours of data.
+sensor_windows = cache.SensorsWindows([s['avg'] for s in state_list] + [RECOVERY_AVG_HOURS])
+
+def _last_action_id():
+    try:
+        return models.Actions.objects.order_by('-id').values_list('id', flat=True).first()
+    except DatabaseError as e:
+        sys.stderr.write('On last action read: %s (%s)' % (e.message, type(e)))
+        return None
+
+
+# Wakes the control loop when next action is due, new data or new action arrives.
+scheduler = Scheduler(marker=_last_action_id)
+
+# Dashboard data: built by the control loop once per tick, read by the views. Older than 2 ticks is rebuilt by reader.
+dashboard = cache.Snapshot(getattr(settings, 'DASHBOARD_SNAPSHOT', os.path.join(settings.BASE_DIR, 'dashboard.json')),
+                           max_age=2 * MAX_SLEEP)
+
 
+@metrics.timed('controller.activate')
 def activate(reason='unknown', force=False, **kwargs):
     '''Control the actuators.
     Actuator is changed only if it's current state is different from requested.
@@ -105,6 +135,8 @@ def activate(reason='unknown', force=False, **kwargs):
 
     msg = []
     a = models.Actions()
+    # Compare with the really last action, even if it was done by another process.
+    cache.actions.sync()
     la = get_last_action()
 
     for k, v in kwargs.iteritems():
@@ -145,6 +177,8 @@ def activate(reason='unknown', force=False, **kwargs):
         sys.stdout.flush()
         try:
             a.save()
+            cache.actions.update(a)
+            dashboard.invalidate()
         except Exception as e:
             sys.stderr.write('On DB write: %s (%s)' % (e.message, type(e)))
     else:
@@ -204,7 +238,7 @@ def is_action_automated(id=None, reason=None):
         if id:
             a = models.Actions.objects.all()[id]
         else:
-            a = models.Actions.objects.last()
+            a = cache.actions.last
 
         return is_manual(a.reason)
 
@@ -216,18 +250,12 @@ def get_last_action(with_reason=False):
     '''
     :return: Dictionary of statuses of all actuators. Does not contain non-actuator data (ID, date, reason)
     '''
-    a = {}
-    try:
-        # Avoid exception in case of empty database.
-        a = models.Actions.objects.last()
-    except (exceptions.FieldError, ValueError, KeyError) as e:
-        sys.stderr.write('%s -- On Action DB read: %s (%s)' % (a, e.message, type(e)))
-        return a
+    a = cache.actions.last
 
     if not a:
         # Simulate empty default last automated action
         a = models.Actions()
-        a['date'] = datetime(1, 1, 1)
+        a.date = datetime(1, 1, 1)
 
     if with_reason:
         return a.get_all_fields(exclude=('id', 'date'))
@@ -235,27 +263,9 @@ def get_last_action(with_reason=False):
 
 
 def get_last_automated_action(with_reason=False):
-    # Try to read last automated action.
-    la = {}
-    try:
-        # Avoid exception in case of empty database.
-        # Find last record generated automatically
-        filt = {'reason__icontains': 'automate'}
-        la = models.Actions.objects.filter(**filt).last()
-    except (exceptions.FieldError, ValueError, KeyError) as e:
-        sys.stderr.write('Error DB query: %s (%s)' % (e.message, type(e)))
-        return la
-
-    # Try to read last timer action.
-    lt = {}
-    try:
-        # Avoid exception in case of empty database.
-        # Find last record generated automatically
-        filt = {'reason__icontains': 'timer off'}
-        lt = models.Actions.objects.filter(**filt).last()
-    except (exceptions.FieldError, ValueError, KeyError) as e:
-        sys.stderr.write('Error DB query: %s (%s)' % (e.message, type(e)))
-        return lt
+    # Read last automated action and last timer action.
+    la = cache.actions.last_automated
+    lt = cache.actions.last_timer_off
 
     if la and lt:
         if lt.id > la.id:
@@ -266,7 +276,7 @@ def get_last_automated_action(with_reason=False):
     if not la:
         # Simulate empty default last automated action
         la = models.Actions()
-        la['date'] = datetime(1, 1, 1)
+        la.date = datetime(1, 1, 1)
 
     if with_reason:
         return la.get_all_fields(exclude=('id'))
@@ -281,8 +291,8 @@ def get_current_state():
         read_current_state()
 
     # Refresh current state calculation if data is obsolete
-    dt = (datetime.now() - current_state[2]).total_seconds() / 60
-    if current_state and dt >= 10:
+    dt = (datetime.now() - current_state[2]).total_seconds()
+    if current_state and dt >= STATE_TIMEOUT:
         read_current_state()
 
     # Return empty dict and -1 if failed to retrieve current_state
@@ -295,7 +305,7 @@ def get_current_state():
     return current_state
 
 
-@memoize(keep=600)
+@memoize(keep=STATE_TIMEOUT)
 def read_current_state():
     '''Calculate averages for all possible states. Choose the most appropriate state.
     Update current_state status as full record of state_list and its index.
@@ -303,96 +313,177 @@ def read_current_state():
     Return False if recovery procedure used or no state received.
     '''
 
-    # Read first the status with minimal averaging to catch emergency state (lowest and highest temperatures).
-    status = calc_avg(MIN_AVG_HOURS)
     flag = False
     global current_state
 
-    for state in reversed(state_list):
-        duration = state['avg']
-        # Skip repeating status calculation
-        if status['duration'] != duration:
-            status = calc_avg(duration)
-            status['duration'] = duration
-
+    # Each state is checked with status averaged by its own window. The last matching state in the list wins.
+    statuses = calc_avgs(state_index.windows.keys())
+    for status in statuses.itervalues():
         # Abort current_state update if no meaningful data in the DB.
         if len(status.keys()) <= 2:
             return flag
 
-        cr = state['criteria']
-        if cr['tmin'] <= status['t_amb'] < cr['tmax'] and cr['hmin'] <= status['rh'] < cr['hmax'] and cr['wmin'] <= status['wind'] < cr['wmax']:
-            current_state = (state, state_list.index(state), datetime.now())
-            flag = True
-            break
+    state, i = state_index.classify(statuses)
+    if state:
+        current_state = (state, i, datetime.now())
+        flag = True
 
     # Recovery procedure: when temperature is close to changing threshold there is a case when recalculation with
     # new average time brings result from previous state. In such conditions the status becomes None.
-    # TODO: Optimize this.
     if not flag:
-        status = calc_avg(2)
+        status = calc_avg(RECOVERY_AVG_HOURS)
         # Abort current_state update if no meaningful data in the DB.
         if len(status.keys()) <= 2:
             return flag
 
-        for state in reversed(state_list):
-            cr = state['criteria']
-            if cr['tmin'] <= status['t_amb'] < cr['tmax'] and cr['hmin'] <= status['rh'] < cr['hmax'] and cr['wmin'] <= status['wind'] < cr['wmax']:
-                current_state = (state, state_list.index(state), datetime.now())
-                break
+        state, i = state_index.lookup(status)
+        if state:
+            current_state = (state, i, datetime.now())
 
     # sys.stdout.write('Read status: %s' % repr(current_state))
     return flag
 
 
+@metrics.timed('controller.calc_avgs')
+def calc_avgs(durations):
+    '''Return dictionary of {duration: averages} for all given durations in hours.
+    Averages are read from rolling sums in memory or, if AVG_IN_MEMORY is off, by single query to the DB.
+    '''
+
+    if AVG_IN_MEMORY:
+        # Catch up sensors data written by the runner.
+        sensor_windows.sync()
+        return dict((d, calc_avg(d)) for d in durations)
+
+    return calc_avg_db(durations)
+
+
+@metrics.timed('controller.calc_avg')
 def calc_avg(duration):
+    '''Return averages of sensors data for last duration hours.
+    Averaging windows in use by state_list are served from memory, others are read from the DB.
+    '''
 
-    # Acquire relevant range of the data from the DB.
-    ml = models.Sensors.objects.filter(date__gte=datetime.now() - timedelta(hours=duration)).values('wind', 'hpa', 't_amb', 't_obj', 'rh', 'lux')
-    ed = defaultdict(int)  # Allow automatic adding of key is the key is not present in the dict.
-    ed['duration'] = duration
+    if AVG_IN_MEMORY and duration in sensor_windows.hours:
+        return sensor_windows.average(duration)
 
-    if ml.count() == 0:
-        # Return last record if system was off long time.
-        try:
-            ml = [models.Sensors.objects.last().get_all_fields()]
-        except:
-            ml = []
-        # Return empty dictionary if no records found (new database).
-        if not ml:
-            return ed
-
-    # Sum all values for each parameter.
-    count = 0
-    for d in ml:
-        count += 1
-        for k, v in d.iteritems():
-            ed[k] += v
-
-    # Return empty dict if somehow (how?) no items were counted.
-    if count == 0:
-        ed = defaultdict(int)  # Allow automatic adding of key is the key is not present in the dict.
-        ed['duration'] = duration
-        return ed
+    return calc_avg_db([duration])[duration]
+
+
+@metrics.timed('controller.calc_avg_db')
+def calc_avg_db(durations):
+    '''Average sensors data for all durations (in hours) by single SELECT with conditional SUM and COUNT per duration.
+    The query scans only the longest duration range by the date index.
+    Return dictionary of {duration: averages} in the same form as calc_avg().
+    Averages are sum / count of the model values: Decimal fields stay Decimal, integer fields are floor divided.
+    SQL AVG is not used, it returns a float.
+    '''
+
+    now = datetime.now()
+    aggregates = {}
+    for i, d in enumerate(durations):
+        since = {'date__gte': now - timedelta(hours=d)}
+        aggregates['count_%s' % i] = Count(Case(When(then=Value(1), **since)))
+        for k in cache.SensorsWindows.FIELDS:
+            field = models.Sensors._meta.get_field(k)
+            aggregates['%s_%s' % (k, i)] = Sum(Case(When(then=F(k), **since), output_field=field))
+
+    try:
+        r = models.Sensors.objects.filter(date__gte=now - timedelta(hours=max(durations))).aggregate(**aggregates)
+    except (exceptions.FieldError, ValueError, KeyError) as e:
+        sys.stderr.write('Error DB query: %s (%s)' % (e.message, type(e)))
+        r = {}
 
-    # Calc the avg
-    for k, v in ed.iteritems():
-        ed[k] = ed[k] / count
+    result = {}
+    last = None
+    for i, d in enumerate(durations):
+        ed = defaultdict(int)  # Allow automatic adding of key is the key is not present in the dict.
+        count = r.get('count_%s' % i)
+        if count:
+            for k in cache.SensorsWindows.FIELDS:
+                ed[k] = r['%s_%s' % (k, i)] / count
+        else:
+            # Return last record if system was off long time. Return empty dictionary if no records found (new database).
+            last = last or models.Sensors.objects.last()
+            if last:
+                ed.update(last.get_all_fields())
+        ed['duration'] = d
+        result[d] = ed
 
-    return ed
+    return result
 
 
 def act_current_state():
     '''Run this function in a thread. Do not join! It's never ending.
     This function just calls really working function in a loop.
+    Sleep till next action is due, new sensors data or manual action arrives.
     '''
 
     while True:
-        ts = time.time()
+        scheduler.begin()
         _run_state_action()
-        # Sleep rest of time till end of minute
-        time.sleep(60 - (time.time() - ts))
+        build_dashboard()
+        scheduler.plan(get_transitions())
+        scheduler.wait()
+
+
+def get_dashboard():
+    '''Return dashboard data built by the control loop. Build it here if missing, invalidated or obsolete.'''
+
+    return dashboard.get() or build_dashboard()
+
+
+@metrics.timed('controller.build_dashboard')
+def build_dashboard():
+    '''Collect data of dashboard pages and keep it in the snapshot. Return the data:
+    {'actuators': {actuator: status},
+     'state': index of current state or NO_DATA,
+     'next': [(actuator, due_time, action), ...],   # Next actions of current state.
+     'timer': [(actuator, due_time, action), ...],  # Actions of manual timer.
+    }
+    Due times are in seconds since epoch. Remaining time is calculated on display.
+    '''
+
+    cache.actions.sync()
+    now = time.time()
+    data = {'actuators': dict(get_last_action()),
+            'state': get_current_state()[1],
+            'next': [(act, now + t * 60, todo) for act, t, todo in get_next_action() or []],
+            'timer': [],
+            }
+
+    tr = get_timer_order(seconds=True)
+    if tr and tr[1] > 0:
+        data['timer'] = [(act, now + tr[1], not on) for act, on in tr[0].iteritems() if on]
+
+    return dashboard.put(data)
+
+
+def get_transitions():
+    '''Get list of planned changes in format:
+    ((time_to_change_in_seconds, actuator_or_event, action),
+    ...,
+    )
+    Besides actuators of current state, include manual timer off, current state recalculation and alert on manual action.
+    '''
+
+    result = [(t * 60, act, todo) for act, t, todo in get_next_action() or []]
+
+    tr = get_timer_order(seconds=True)
+    if tr:
+        result.append((tr[1], 'timer', False))
+
+    if current_state:
+        result.append((STATE_TIMEOUT - (datetime.now() - current_state[2]).total_seconds(), 'state', None))
+
+    la = cache.actions.last
+    if la and la.kind == models.Actions.MANUAL and any(la.get_all_fields().values()):
+        result.append((MANUAL_TIMEOUT - (datetime.utcnow() - la.date.replace(tzinfo=None)).total_seconds(), 'alert', None))
+
+    return result
 
 
+@metrics.timed('controller.get_next_action')
 def get_next_action():
     '''Get list of actuators in next planned state (on/off) in format.
     ((actuator, time_to_action_in_minutes, action),
@@ -435,6 +526,7 @@ def get_next_action():
     return result
 
 
+@metrics.timed('controller.run_state_action')
 def _run_state_action():
     '''Set actuators in appropriate position, which defined by current state.
     Actuator is eligible to turn on if:
@@ -446,13 +538,15 @@ def _run_state_action():
     I.e. check eligibility of actuator to change state.
     '''
 
+    # Catch up actions done by other processes (manual actions from web).
+    cache.actions.sync()
+
     # Process timer first.
     tr = get_timer_order()
     if tr:
         ad, t_rem = tr  # Unpack timer results
-        filt = {'reason__icontains': 'timer off'}
-        qs = models.Actions.objects.filter(**filt).last()
-        dt = (datetime.now() - qs.date.replace(tzinfo=None)).total_seconds() / 60
+        qs = cache.actions.last_timer_off
+        dt = (datetime.now() - qs.date.replace(tzinfo=None)).total_seconds() / 60 if qs else 0
         if t_rem < 0.5:  # Approximate to zero time. If statement t_rem <= 0 then it looks like 1 minute delay.
             activate(reason='Manual timer off', **ad)
 
@@ -462,12 +556,12 @@ def _run_state_action():
 
     # Process time-less manual action
     try:
-        ma = models.Actions.objects.last()
-        if ma.reason.lower() == 'manual' and any(ma.get_all_fields().values()):
+        ma = cache.actions.last
+        if ma.kind == models.Actions.MANUAL and any(ma.get_all_fields().values()):
             if (datetime.utcnow() - ma.date.replace(tzinfo=None)).total_seconds() > MANUAL_TIMEOUT:
                 alert_actuator_on()
             return
-    except (exceptions.FieldError, ValueError, KeyError) as e:
+    except (exceptions.FieldError, ValueError, KeyError, AttributeError) as e:
         # In case of no data in DB or network failure (unable to send alert), return to normal automatic work.
         print "ERROR occurred during access to Actions DB or during attempt to send 'Too long manual on' alert.", str(datetime.now())
 
@@ -480,10 +574,7 @@ def _run_state_action():
     act_name = state['name']        # Keep name for reporting.
     reason = 'Automate for state: %s' % act_name
 
-    try:
-        lm = models.Actions.objects.last().get_all_fields()
-    except (exceptions.FieldError, ValueError, KeyError) as e:
-        lm = {}
+    lm = cache.actions.last.get_all_fields() if cache.actions.last else {}
 
     la = get_last_automated_action()
     al = get_next_action()
@@ -542,29 +633,17 @@ def get_timer_order(seconds=False):
 
     # Process timer
     try:
-        # Find last record with Timer enable
-        filt = {'reason__icontains': 'with timer'}
-        qs = models.Actions.objects.filter(**filt).last()
+        # Find last record with Timer enable.
+        # Collect what was on in list. Actions that were disabled later (manually or automatically) are filtered out.
+        qs, was_on = cache.actions.get_timer_on()
 
         if qs:
-            # Validate whether the action was disabled automatically already. Skip changes if found.
-            last_on_id = qs.id
             min_l = re.findall('(\d+) min', qs.reason.lower())
             secs = int(min_l[0]) * 60 if min_l else 0
 
-            # Collect what was on in list
-            was_on = [k for k, v in qs.get_all_fields().iteritems() if v]
-
-            # Filter out from was_on all actions that were disabled later (manually or automatically)
-            for action in was_on:
-                filt = {action: False, 'id__gt': last_on_id}
-                qs1 = models.Actions.objects.filter(**filt).first()
-                if qs1:
-                    was_on.remove(action)
-
             # Time gone. Check if needed action.
             t_diff = secs - ((datetime.utcnow() - qs.date.replace(tzinfo=None)).total_seconds())
-            la = models.Actions.objects.last().get_all_fields()
+            la = cache.actions.last.get_all_fields()
             if t_diff <= 0 and was_on:
                 for i in was_on:
                     if la[i]:
@@ -583,31 +662,29 @@ def get_last_change_minutes(actuator, is_on):
     Return 0 if looking for 'off' state and actuator is currently "on".
     '''
 
-    # Find last record with True value AND generated automatically
-    filt = {'%s' % actuator: True, 'reason__icontains': 'automate'}
-    try:  # Return -1 if no such field in the DB.
-        qs = models.Actions.objects.filter(**filt).last()
-    except (exceptions.FieldError, ValueError, KeyError) as e:
+    # Return -1 if no such field in the DB.
+    if actuator not in cache.actions.actuators():
         return -1
 
-    if not qs:
+    # Find last record with True value AND generated automatically
+    on = cache.actions.automated_on.get(actuator)
+    if not on:
         return MAX_TIMEOUT
 
     if is_on:
-        return _diff_datetime_mins(datetime.utcnow(), qs.date.replace(tzinfo=None))
+        return _diff_datetime_mins(datetime.utcnow(), on.replace(tzinfo=None))
     else:
         # Find last record with False value AFTER True value AND generated automatically
-        filt = {'%s__%s' % ('date', 'gt'): qs.date, '%s' % actuator: False, 'reason__icontains': 'automate'}
-        qs1 = models.Actions.objects.filter(**filt).first()
+        off = cache.actions.automated_off.get(actuator)
         # If no records then actuator is on now.
-        if not qs1:
+        if not off:
             la = get_last_action()
             if la and la[actuator]:
                 return 0
             else:
                 return MAX_TIMEOUT
 
-        return _diff_datetime_mins(datetime.utcnow(), qs1.date.replace(tzinfo=None))
+        return _diff_datetime_mins(datetime.utcnow(), off.replace(tzinfo=None))
 
 
 def _diff_datetime_mins(t1, t2):
@@ -623,7 +700,7 @@ def _diff_datetime_mins(t1, t2):
 def alert_actuator_on():
     ''' Send alert/reminder once in hour. '''
 
-    a = models.Actions.objects.last()
+    a = cache.actions.last
     on = ', '.join([k.capitalize() for k, v in a.get_all_fields().iteritems() if v])
     t = str(round((datetime.utcnow() - a.date.replace(tzinfo=None)).total_seconds() / 3600.0, 1))
 
@@ -637,10 +714,8 @@ def alert_actuator_on():
 
 
 def send_message(subj, msg):
-    # Send emergency mail
-    sendmail.sendmail(subj, msg)
-    # Send emergency IM
-    pushb.send_note(subj, msg)
+    # Send emergency mail and IM in background. Don't wait for the servers.
+    notify.get_dispatcher().send(subj, msg)
 
 
 def update_firmware():
@@ -0,0 +1,41 @@
+'''
+SQLite tuning at connection setup.
+The runner, its control loop thread and the web write the same DB file. Default rollback journal locks the whole file
+for the write and fails concurrent writers with "database is locked".
+
+PRAGMAS are applied to every new connection:
+- journal_mode=WAL: readers don't block the writer and vice versa. Commit appends to the -wal file.
+- busy_timeout: wait for the lock instead of failing.
+- synchronous=NORMAL: with WAL, fsync only on checkpoint, not on every commit. Saves SD card wear.
+  Last commits could be lost on power failure, the DB stays consistent.
+- mmap_size, cache_size: read by memory mapping, keep more pages in memory.
+The defaults aren't in settings. To override them, define SQLITE_PRAGMAS in settings as a list of (pragma, value).
+Measure by: python manage.py bench_sqlite
+'''
+
+from django.conf import settings
+
+# Order matters: journal mode first.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),          # milliseconds
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 64 * 1024 * 1024),  # bytes
+    ('cache_size', -8000),           # Negative is KiB.
+)
+
+
+def get_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas=None):
+    '''Execute list of (pragma, value) by DB API cursor.'''
+    for k, v in (get_pragmas() if pragmas is None else pragmas):
+        cursor.execute('PRAGMA %s = %s' % (k, v))
+
+
+def on_connection_created(sender, connection, **kwargs):
+    '''Handler of django.db.backends.signals.connection_created.'''
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.cursor())
@@ -0,0 +1,181 @@
+'''
+Streaming export of Sensors and Actions records.
+Records are read by chunks of the date index and written by generators.
+Memory stays flat for any time range: only one chunk of rows is kept at a time.
+
+Formats:
+    csv: header line and a line per record. Dates are ISO 8601 in UTC.
+    col: compact columnar binary. MAGIC, schema, then blocks of up to BLOCK rows, column after column:
+         schema: uint16 number of columns, per column: uint8 name length, name, struct type code.
+         block:  uint32 rows (0 ends the stream), per column: packed array of values,
+                 strings ('s') are uint16 length and UTF-8 bytes per value.
+         Types: 'q' date as microseconds since epoch, 'f' float32, 'i' int32, '?' boolean.
+    read_columns() reads the col format back into {column: list of values}.
+
+Usage as module:
+    for chunk in export.generate('sensors', 'csv', since, until):
+        f.write(chunk)
+'''
+
+import csv
+import struct
+import cStringIO
+from operator import itemgetter
+from datetime import datetime, timedelta
+from django.db import models as db_models
+from django.utils import timezone
+
+from orchid_app import models
+
+MODELS = {'sensors': models.Sensors, 'actions': models.Actions}
+FORMATS = ('csv', 'col')
+BLOCK = 1000      # Rows per chunk.
+MAGIC = b'ORCHCOL1'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CONTENT_TYPES = {'csv': 'text/csv', 'col': 'application/octet-stream'}
+
+
+def columns(model):
+    '''Return list of (name, struct type code) of exported fields.'''
+
+    res = []
+    for f in model._meta.fields:
+        if f.name == 'id':
+            continue
+        if isinstance(f, db_models.DateTimeField):
+            code = 'q'
+        elif isinstance(f, (db_models.DecimalField, db_models.FloatField)):
+            code = 'f'
+        elif isinstance(f, db_models.BooleanField):
+            code = '?'
+        elif isinstance(f, db_models.IntegerField):
+            code = 'i'
+        else:
+            code = 's'
+        res.append((f.name, code))
+    return res
+
+
+def chunked(qs, size=BLOCK, date=lambda r: r.date):
+    '''Yield lists of up to size rows of QuerySet qs ordered by its unique date field.
+    SQLite backend of Django reads whole result into memory even by iterator(). Read by chunks of date index instead.
+    date: function returning the date of a row, for values_list() rows.
+    '''
+
+    qs = qs.order_by('date')
+    last = None
+    while True:
+        block = list((qs.filter(date__gt=last) if last else qs)[:size])
+        if block:
+            yield block
+        if len(block) < size:
+            return
+        last = date(block[-1])
+
+
+def _blocks(model, since=None, until=None, size=None):
+    '''Yield lists of up to size (BLOCK by default) tuples of values, ordered by date.'''
+
+    names = [c for c, _ in columns(model)]
+    qs = model.objects.all()
+    if since:
+        qs = qs.filter(date__gte=since)
+    if until:
+        qs = qs.filter(date__lt=until)
+    return chunked(qs.values_list(*names), size or BLOCK, itemgetter(names.index('date')))
+
+
+def generate(name, fmt, since=None, until=None):
+    '''Return generator of chunks of exported records of model name ('sensors' or 'actions') in format fmt.'''
+
+    model = MODELS[name]
+    if fmt == 'csv':
+        return _csv(model, since, until)
+    elif fmt == 'col':
+        return _col(model, since, until)
+    raise ValueError('Wrong format: %s' % fmt)
+
+
+def _csv_value(v, code):
+    if code == 'q':
+        return v.isoformat()
+    elif code == 's':
+        return v.encode('utf-8')
+    elif code == '?':
+        return int(v)
+    return v
+
+
+def _csv(model, since, until):
+    cols = columns(model)
+    buf = cStringIO.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([c for c, _ in cols])
+    for block in _blocks(model, since, until):
+        for r in block:
+            writer.writerow([_csv_value(v, code) for v, (_, code) in zip(r, cols)])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _micros(date):
+    d = date - EPOCH
+    return (d.days * 86400 + d.seconds) * 10 ** 6 + d.microseconds
+
+
+def _col(model, since, until):
+    cols = columns(model)
+    head = [MAGIC, struct.pack('<H', len(cols))]
+    for c, code in cols:
+        head.append(struct.pack('<B', len(c)) + str(c) + str(code))
+    yield b''.join(head)
+
+    for block in _blocks(model, since, until):
+        out = [struct.pack('<I', len(block))]
+        for i, (_, code) in enumerate(cols):
+            values = [r[i] for r in block]
+            if code == 's':
+                for v in values:
+                    v = (v or u'').encode('utf-8')[:0xFFFF]
+                    out.append(struct.pack('<H', len(v)) + v)
+            else:
+                if code == 'q':
+                    values = [_micros(v) for v in values]
+                elif code == 'f':
+                    values = [float(v) for v in values]
+                out.append(struct.pack('<%d%s' % (len(values), code), *values))
+        yield b''.join(out)
+
+    yield struct.pack('<I', 0)
+
+
+def read_columns(f):
+    '''Read col format from file object. Return dictionary of {column: list of values}. Dates are aware datetimes.'''
+
+    def read(fmt):
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, f.read(size))
+
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a columnar export')
+
+    cols = []
+    for _ in range(read('<H')[0]):
+        name = f.read(read('<B')[0])
+        cols.append((name, f.read(1)))
+
+    data = dict((c, []) for c, _ in cols)
+    while True:
+        rows = read('<I')[0]
+        if not rows:
+            return data
+        for c, code in cols:
+            if code == 's':
+                data[c].extend(f.read(read('<H')[0]).decode('utf-8') for _ in range(rows))
+            elif code == 'q':
+                data[c].extend(EPOCH + timedelta(microseconds=v) for v in read('<%dq' % rows))
+            else:
+                data[c].extend(read('<%d%s' % (rows, code)))
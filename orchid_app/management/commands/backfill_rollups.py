@@ -0,0 +1,24 @@
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orchid_app import rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds hourly and daily rollups of sensors data from the Sensors table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Rebuild since the date (YYYY-MM-DD, local time). Default: all records.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError as e:
+                raise CommandError('Wrong date "%s": %s' % (options['since'], e))
+
+        rollup.backfill(since, stdout=self.stdout)
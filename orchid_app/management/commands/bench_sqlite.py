@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+
+import os
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orchid_app import db
+
+SCHEMA = 'CREATE TABLE sensors (id INTEGER PRIMARY KEY, date TEXT UNIQUE, t_amb REAL, rh INTEGER, lux INTEGER)'
+
+
+def _connect(path, pragmas):
+    # No busy timeout of Python sqlite3 module (5 s by default): the default run is untuned SQLite.
+    conn = sqlite3.connect(path, timeout=0)
+    db.apply_pragmas(conn.cursor(), pragmas)
+    return conn
+
+
+def _writer(path, pragmas, n, seconds, result):
+    '''Insert a record per transaction, like Sensors and Actions saves.'''
+    conn = _connect(path, pragmas)
+    ops = errors = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        try:
+            conn.execute('INSERT INTO sensors (date, t_amb, rh, lux) VALUES (?, ?, ?, ?)',
+                         ('%d-%d-%f' % (n, ops, time.time()), random.uniform(10, 40), random.randint(0, 100), random.randint(0, 60000)))
+            conn.commit()
+            ops += 1
+        except sqlite3.OperationalError:  # database is locked
+            conn.rollback()
+            errors += 1
+    result.put(('write', ops, errors))
+
+
+def _reader(path, pragmas, seconds, result):
+    '''Read a page and the total, like the list view.'''
+    conn = _connect(path, pragmas)
+    ops = errors = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        try:
+            conn.execute('SELECT * FROM sensors ORDER BY date DESC LIMIT 30').fetchall()
+            conn.execute('SELECT COUNT(*) FROM sensors').fetchone()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    result.put(('read', ops, errors))
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent SQLite readers and writers throughput with SQLite defaults (no busy timeout) and configured pragmas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--rows', type=int, default=10000, help='Records in the DB before the test.')
+        parser.add_argument('--path', help='Directory of test DB. Default: directory of the real DB (same storage).')
+
+    def handle(self, *args, **options):
+        path = options['path'] or os.path.dirname(settings.DATABASES['default']['NAME'])
+        for name, pragmas in (('default', ()), ('configured', db.get_pragmas())):
+            tmp = tempfile.mkdtemp(dir=path)
+            try:
+                res = self._run(os.path.join(tmp, 'bench.sqlite3'), pragmas, options)
+            finally:
+                shutil.rmtree(tmp)
+            self.stdout.write('%-10s writes: %7.1f/s (%d locked), reads: %7.1f/s (%d locked)' % (
+                name, res['write'][0] / options['seconds'], res['write'][1],
+                res['read'][0] / options['seconds'], res['read'][1]))
+
+    @staticmethod
+    def _run(dbfile, pragmas, options):
+        conn = _connect(dbfile, pragmas)
+        conn.execute(SCHEMA)
+        conn.executemany('INSERT INTO sensors (date, t_amb, rh, lux) VALUES (?, ?, ?, ?)',
+                         (('seed-%d' % i, 25.0, 50, 1000) for i in xrange(options['rows'])))
+        conn.commit()
+        conn.close()
+
+        result = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_writer, args=(dbfile, pragmas, i, options['seconds'], result))
+                 for i in range(options['writers'])]
+        procs += [multiprocessing.Process(target=_reader, args=(dbfile, pragmas, options['seconds'], result))
+                  for _ in range(options['readers'])]
+        for p in procs:
+            p.start()
+
+        totals = {'write': [0, 0], 'read': [0, 0]}
+        for _ in procs:
+            kind, ops, errors = result.get()
+            totals[kind][0] += ops
+            totals[kind][1] += errors
+        for p in procs:
+            p.join()
+        return totals
@@ -0,0 +1,39 @@
+from __future__ import unicode_literals
+
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orchid_app import export
+
+
+class Command(BaseCommand):
+    help = 'Exports Sensors or Actions records in CSV or compact columnar binary format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(export.MODELS.keys()))
+        parser.add_argument('--format', default='csv', choices=export.FORMATS)
+        parser.add_argument('--since', help='Records since the date (YYYY-MM-DD, local time). Default: all records.')
+        parser.add_argument('--until', help='Records before the date (YYYY-MM-DD, local time). Default: till now.')
+        parser.add_argument('--output', '-o', help='Output file. Default: standard output.')
+
+    def handle(self, *args, **options):
+        since, until = [self._date(options[k]) for k in ('since', 'until')]
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            for chunk in export.generate(options['model'], options['format'], since, until):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    @staticmethod
+    def _date(value):
+        if not value:
+            return None
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError as e:
+            raise CommandError('Wrong date "%s": %s' % (value, e))
@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from orchid_app import metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows latency of runner and controller hot paths dumped by the runner, slowest total first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prometheus', action='store_true', help='Print Prometheus text format, as /metrics does.')
+
+    def handle(self, *args, **options):
+        processes = metrics.collect('command')
+        processes.pop('command')
+        if options['prometheus']:
+            self.stdout.write(metrics.render(processes), ending='')
+            return
+        if not processes:
+            self.stderr.write('No fresh metrics. Is the runner running with METRICS_ENABLED?')
+            return
+
+        self.stdout.write('%-8s %-32s %8s %10s %10s %10s %10s %10s' % (
+            'process', 'name', 'count', 'total s', 'avg ms', 'p50 ms', 'p95 ms', 'max ms'))
+        rows = [(p, name, h) for p, m in processes.iteritems() for name, h in m.iteritems()]
+        for p, name, h in sorted(rows, key=lambda r: -r[2].total):
+            self.stdout.write('%-8s %-32s %8d %10.2f %10.2f %10.2f %10.2f %10.2f' % (
+                p, name, h.count, h.total, 1000 * h.total / max(h.count, 1),
+                1000 * h.quantile(0.5), 1000 * h.quantile(0.95), 1000 * h.max))
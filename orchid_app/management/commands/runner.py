@@ -9,24 +9,31 @@ from datetime import datetime, timedelta
 from threading import Thread
 from decimal import Decimal
 
-import paho.mqtt.subscribe as subscribe
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 import orchid_app.sensors.anemometer as anemometer
 import orchid_app.sensors.max44009 as light
 import orchid_app.sensors.yf_201s as water
 import orchid_app.sensors.mlx90614 as mlx
 import orchid_app.sensors.bme280 as bme
+from orchid_app.sensors.sampler import Sampler
 
 import orchid_app.controller as controller
-from orchid_app.models import Sensors, Actions
-from orchid_app.utils import sysinfo
+from orchid_app import cache, metrics, rawstore, rollup, rrd
+from orchid_app.models import Sensors, SensorsSpread, Actions
+from orchid_app.utils import mqtt, sysinfo
+from orchid_app.utils.stats import Accumulator
 
 import warnings
 warnings.filterwarnings('ignore')
 
 POLL_PERIOD = 600  # seconds = 10 minutes
 POLL_PERIOD_MIN = POLL_PERIOD / 60  # minutes
+SHORT_PERIOD = 60  # seconds. Sensors publish MQTT data once in minute.
+SENSOR_TIMEOUT = 5  # seconds. Deadline of i2c sensor read.
+WIND_TOPIC = 'shm/orchid/wind/last_min'
+WATER_TOPIC = 'shm/orchid/water/last_min'
 MAX_FLOW_RATE = 2.5  # L/minute.  This is threshold for emergency water leakage detection. If more than the threshold then close the valves.
 MAX_LEAK_RATE = 0.02
 MAX_SEND_COUNT = POLL_PERIOD / 10  # Send leakage message once in hour
@@ -34,14 +41,46 @@ send_counter_leak = 0
 send_counter_flow = 0
 water_trigger = False
 
-def avg(l):
-    '''Convert values of list from str to float if needed. Return average of the collected values.'''
+AVERAGED = ('wind', 't_amb', 't_obj', 'hpa', 'rh', 'lux')
 
-    if not l:
+
+def avg(a):
+    '''Return average of the values collected by Accumulator.'''
+
+    if not a.count:
         return 0.0
 
-    pre = [float(i) for i in l]
-    return round(sum(pre)/len(pre), 2)
+    return round(a.mean, 2)
+
+
+def new_data():
+    '''Return empty structure for preliminary data of poll period. Water is summed, other fields are averaged.'''
+
+    data = dict((k, Accumulator()) for k in AVERAGED)
+    data['water'] = 0.0
+    return data
+
+
+def save_spread(s, data):
+    '''Write spread of the readings averaged into Sensors record s.'''
+
+    SensorsSpread.objects.bulk_create([
+        SensorsSpread(sensors=s, field=k, count=data[k].count, min=data[k].min, max=data[k].max, stddev=data[k].stddev)
+        for k in AVERAGED if data[k].count])
+
+
+def save_sensors(s, data):
+    '''Write Sensors record s with its spread and rollups in one transaction: all of them or nothing.
+    Update the in-memory averages and wake the control loop after commit only.
+    '''
+
+    with metrics.timer('runner.db_write'):
+        with transaction.atomic():
+            s.save()
+            save_spread(s, data)
+            rollup.update(s)
+    controller.sensor_windows.update(s)
+    controller.scheduler.notify()
 
 
 class Command(BaseCommand):
@@ -69,8 +108,21 @@ class Command(BaseCommand):
             t.setDaemon(True)
             t.start()
 
+        # Keep single connection to MQTT broker. Data is collected in background.
+        subscriber = mqtt.Subscriber('shm/orchid/#')
+        subscriber.start()
+
+        # Keep single I2C device instead of new one per read.
+        melexis = mlx.Melexis()
+        # Read i2c sensors in parallel, each with own deadline.
+        readers = {'bme280': bme.readBME280All, 'mlx90614': melexis.readObject1, 'max44009': light.readLight}
+        sampler = Sampler(dict((k, metrics.timed('i2c.' + k)(v)) for k, v in readers.iteritems()), timeout=SENSOR_TIMEOUT)
+
         # Keep preliminary data for averaging
-        data = {'wind': [], 'water': 0.0, 't_amb': [], 't_obj': [], 'hpa': [], 'rh': [], 'lux': []}
+        data = new_data()
+        # Keep per-minute readings if enabled in settings.
+        raw_store = rawstore.get_store()
+        health = rrd.get_rrd()
         ts = time.time()
 
         #######################################################################################
@@ -82,29 +134,64 @@ class Command(BaseCommand):
                 #######################################################################################
                 ##################     SHORT CYCLE ACTIONS, DATA AVERAGING     ########################
                 #######################################################################################
+                tc = time.time()
+                sample = {}  # Readings of this cycle.
                 try:  # Catch sensor reading data, stay running
-                    # Wait for MQTT data
-                    topic = "shm/orchid/wind/last_min"
-                    data['wind'].append(float(subscribe.simple(topic, keepalive=65, will={'topic': topic, 'payload': 0.0}).payload))
-                    topic = "shm/orchid/water/last_min"
-                    last_water = float(subscribe.simple(topic, keepalive=65, will={'topic': topic, 'payload': 0.0}).payload)
-                    check_water_flow(last_water)
-                    data['water'] += last_water
-                    # Read i2c sensors
-                    a, b, c = bme.readBME280All()
-                    data['t_amb'].append(a)
-                    data['hpa'].append(b)
-                    data['rh'].append(c)
-                    data['t_obj'].append(mlx.Melexis().readObject1())
-                    data['lux'].append(light.readLight())
+                    # Take MQTT data arrived since last cycle
+                    with metrics.timer('runner.mqtt'):
+                        wind = [float(v) for v in subscriber.pop(WIND_TOPIC)]
+                        data['wind'].extend(wind)
+                        if wind:
+                            sample['wind'] = wind[-1]
+                        for last_water in subscriber.pop(WATER_TOPIC):
+                            last_water = float(last_water)
+                            check_water_flow(last_water)
+                            data['water'] += last_water
+                            sample['water'] = sample.get('water', 0.0) + last_water
                 except Exception as e:
                     self.stderr.write('On sensors read: %s (%s)' % (e.message, type(e)))
-                    time.sleep(60)  # Wait 1 minute before retry.
 
-                t_cpu = sysinfo.read_cpu()['temp']['current']
+                # Read i2c sensors. Keep values of healthy sensors, report missing ones.
+                with metrics.timer('runner.i2c'):
+                    values, missing = sampler.sample()
+                if 'bme280' in values:
+                    sample['t_amb'], sample['hpa'], sample['rh'] = values['bme280']
+                if 'mlx90614' in values:
+                    sample['t_obj'] = values['mlx90614']
+                if 'max44009' in values:
+                    sample['lux'] = values['max44009']
+                for k in AVERAGED:
+                    if k in sample and k != 'wind':
+                        data[k].add(sample[k])
+                for k, v in missing.iteritems():
+                    self.stderr.write('On %s read: %s' % (k, v))
+
+                # Keep raw readings of the minute for diagnostics.
+                if raw_store:
+                    try:
+                        with metrics.timer('runner.raw_write'):
+                            raw_store.append(sample, tc)
+                    except Exception as e:
+                        self.stderr.write('On raw store write: %s (%s)' % (e.message, type(e)))
+
+                snapshot = sysinfo.get_snapshot()
+                if health:
+                    try:
+                        with metrics.timer('runner.health_write'):
+                            health.update(snapshot.data, snapshot.time)
+                    except Exception as e:
+                        self.stderr.write('On health write: %s (%s)' % (e.message, type(e)))
+
+                t_cpu = snapshot.data['cpu']['temp']['current']
                 if int(t_cpu) > 80:
                     os.system('logger orchid_runner CPU temperature %s' % str(t_cpu))
 
+                if metrics.enabled:
+                    metrics.observe('runner.short_cycle', time.time() - tc)
+
+                # Sleep rest of time till end of minute. Next MQTT data arrives meanwhile.
+                time.sleep(max(0, SHORT_PERIOD - (time.time() - tc)))
+
             else:
                 #######################################################################################
                 ##################      LONG CYCLE ACTIONS, SD-CARD WRITE      ########################
@@ -123,15 +210,18 @@ class Command(BaseCommand):
                 # self.stdout.write(str(s))
                 try:  # Catch sensor reading data, stay running
                     # Write data to the DB
-                    s.save()
+                    save_sensors(s, data)
                     # self.stdout.write('Sensor Records: ' + repr(Sensors.objects.count()))
                 except Exception as e:
                     self.stderr.write('On DB write: %s (%s)' % (e.message, type(e)))
                     time.sleep(60)  # Wait 1 minute before retry.
                 # Reset the data structure
-                data = {'wind': [], 'water': 0.0, 't_amb': [], 't_obj': [], 'hpa': [], 'rh': [], 'lux': []}
+                data = new_data()
                 ts = time.time()
 
+                # Publish timings for the web and the metrics command. Once in long cycle, not to wear the SD card.
+                metrics.dump('runner')
+
                 # # Calculate current state
                 # controller.read_current_state()
 
@@ -145,7 +235,8 @@ class Command(BaseCommand):
 
 def check_water_flow(liters):
     # Take emergency actions
-    # Find out which valve is open
+    # Find out which valve is open. Manual actions could be done by web, catch them up.
+    cache.actions.sync()
     la = controller.get_last_action()
     if (la.mist or la.water) and liters > MAX_FLOW_RATE:
         if is_alert_eligible(is_leak=False):
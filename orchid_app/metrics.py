@@ -0,0 +1,158 @@
+'''
+Timing instrumentation of hot paths of the runner and the controller.
+Per name: count, total time, max and histogram of latency.
+
+Instrumentation is enabled by settings.METRICS_ENABLED (off by default). When disabled, decorated functions and timed blocks
+cost one check of a module flag.
+
+The runner and the web server are separate processes. The runner dumps its metrics into settings.METRICS_FILE
+once in long cycle (10 minutes) to spare the SD card, the /metrics view and the metrics command read them from there.
+
+Usage as module:
+    @metrics.timed('controller.activate')
+    def activate(...):
+
+    with metrics.timer('runner.db_write'):
+        s.save()
+
+    metrics.dump('runner')                      # Write metrics of this process.
+    print metrics.render(metrics.collect())     # Prometheus text format of all processes.
+'''
+
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+from django.conf import settings
+
+from orchid_app import cache
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)  # seconds. Upper bounds of histogram buckets.
+
+enabled = getattr(settings, 'METRICS_ENABLED', False)
+_metrics = {}  # name: Histogram
+_lock = threading.Lock()
+_dump = cache.Snapshot(getattr(settings, 'METRICS_FILE', os.path.join(settings.BASE_DIR, 'metrics.json')),
+                       max_age=2 * 10 * 60)  # Two long cycles of the runner.
+
+
+class Histogram(object):
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self, count=0, total=0.0, max=0.0, buckets=None):
+        self.count = count
+        self.total = total
+        self.max = max
+        self.buckets = buckets or [0] * (len(BUCKETS) + 1)  # The last one is above all BUCKETS.
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        '''Return upper bound of the bucket of q quantile (0..1). Return max if it's above all buckets.'''
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max, 'buckets': list(self.buckets)}
+
+
+def observe(name, seconds):
+    with _lock:
+        h = _metrics.get(name)
+        if h is None:
+            h = _metrics[name] = Histogram()
+        h.observe(seconds)
+
+
+def timed(name):
+    '''Decorator: record latency of every call of the function under name.'''
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.time() - t)
+        return wrapper
+    return decorator
+
+
+class timer(object):
+    '''Context manager: record latency of the block under name.'''
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            observe(self.name, time.time() - self.started)
+
+
+def snapshot():
+    '''Return {name: Histogram} copy of metrics of this process.'''
+    with _lock:
+        return dict((k, Histogram(**v.to_dict())) for k, v in _metrics.iteritems())
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+def dump(process):
+    '''Write metrics of this process for other processes. Metrics of one process are kept in the file at a time.'''
+    if enabled:
+        _dump.put({'process': process, 'pid': os.getpid(),
+                   'metrics': dict((k, v.to_dict()) for k, v in snapshot().iteritems())})
+
+
+def collect(process='web'):
+    '''Return {process: {name: Histogram}} of this process and of the dumped one if it's fresh.'''
+    res = {process: snapshot()}
+    d = _dump.get()
+    if d and d.get('pid') != os.getpid():
+        res[d['process']] = dict((k, Histogram(**v)) for k, v in d['metrics'].iteritems())
+    return res
+
+
+def render(processes):
+    '''Return Prometheus text exposition of {process: {name: Histogram}}.'''
+    lines = ['# HELP orchid_latency_seconds Latency of instrumented functions and blocks.',
+             '# TYPE orchid_latency_seconds histogram']
+    peaks = []
+    for process, metrics in sorted(processes.iteritems()):
+        for name, h in sorted(metrics.iteritems()):
+            labels = 'process="%s",name="%s"' % (process, name)
+            seen = 0
+            for bound, n in zip(BUCKETS, h.buckets):
+                seen += n
+                lines.append('orchid_latency_seconds_bucket{%s,le="%s"} %d' % (labels, bound, seen))
+            lines.append('orchid_latency_seconds_bucket{%s,le="+Inf"} %d' % (labels, h.count))
+            lines.append('orchid_latency_seconds_sum{%s} %.6f' % (labels, h.total))
+            lines.append('orchid_latency_seconds_count{%s} %d' % (labels, h.count))
+            peaks.append('orchid_latency_seconds_max{%s} %.6f' % (labels, h.max))
+    lines.append('# HELP orchid_latency_seconds_max Maximal latency since process start.')
+    lines.append('# TYPE orchid_latency_seconds_max gauge')
+    lines.extend(peaks)
+    return '\n'.join(lines) + '\n'
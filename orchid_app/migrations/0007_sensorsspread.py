@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 20:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchid_app', '0006_actions_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorsSpread',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=8)),
+                ('count', models.PositiveIntegerField()),
+                ('min', models.FloatField(null=True)),
+                ('max', models.FloatField(null=True)),
+                ('stddev', models.FloatField(null=True)),
+                ('sensors', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spread', to='orchid_app.Sensors')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='sensorsspread',
+            unique_together=set([('sensors', 'field')]),
+        ),
+    ]
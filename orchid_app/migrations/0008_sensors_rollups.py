@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 20:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchid_app', '0007_sensorsspread'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorsDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('t_amb_avg', models.FloatField(null=True)),
+                ('t_amb_min', models.FloatField(null=True)),
+                ('t_amb_max', models.FloatField(null=True)),
+                ('t_obj_avg', models.FloatField(null=True)),
+                ('t_obj_min', models.FloatField(null=True)),
+                ('t_obj_max', models.FloatField(null=True)),
+                ('rh_avg', models.FloatField(null=True)),
+                ('rh_min', models.FloatField(null=True)),
+                ('rh_max', models.FloatField(null=True)),
+                ('hpa_avg', models.FloatField(null=True)),
+                ('hpa_min', models.FloatField(null=True)),
+                ('hpa_max', models.FloatField(null=True)),
+                ('lux_avg', models.FloatField(null=True)),
+                ('lux_min', models.FloatField(null=True)),
+                ('lux_max', models.FloatField(null=True)),
+                ('wind_avg', models.FloatField(null=True)),
+                ('wind_min', models.FloatField(null=True)),
+                ('wind_max', models.FloatField(null=True)),
+                ('water_avg', models.FloatField(null=True)),
+                ('water_min', models.FloatField(null=True)),
+                ('water_max', models.FloatField(null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SensorsHourly',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('t_amb_avg', models.FloatField(null=True)),
+                ('t_amb_min', models.FloatField(null=True)),
+                ('t_amb_max', models.FloatField(null=True)),
+                ('t_obj_avg', models.FloatField(null=True)),
+                ('t_obj_min', models.FloatField(null=True)),
+                ('t_obj_max', models.FloatField(null=True)),
+                ('rh_avg', models.FloatField(null=True)),
+                ('rh_min', models.FloatField(null=True)),
+                ('rh_max', models.FloatField(null=True)),
+                ('hpa_avg', models.FloatField(null=True)),
+                ('hpa_min', models.FloatField(null=True)),
+                ('hpa_max', models.FloatField(null=True)),
+                ('lux_avg', models.FloatField(null=True)),
+                ('lux_min', models.FloatField(null=True)),
+                ('lux_max', models.FloatField(null=True)),
+                ('wind_avg', models.FloatField(null=True)),
+                ('wind_min', models.FloatField(null=True)),
+                ('wind_max', models.FloatField(null=True)),
+                ('water_avg', models.FloatField(null=True)),
+                ('water_min', models.FloatField(null=True)),
+                ('water_max', models.FloatField(null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 20:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchid_app', '0008_sensors_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actions',
+            name='kind',
+            field=models.CharField(choices=[('manual', 'Manual'), ('automate', 'Automate'), ('timer', 'Timer'), ('emergency', 'Emergency'), ('startup', 'Startup')], default='', editable=False, max_length=10),
+        ),
+        migrations.AlterIndexTogether(
+            name='actions',
+            index_together=set([('mist', 'kind', 'date'), ('kind', 'id'), ('water', 'kind', 'date'), ('fan', 'kind', 'date'), ('heat', 'kind', 'date'), ('light', 'kind', 'date')]),
+        ),
+    ]
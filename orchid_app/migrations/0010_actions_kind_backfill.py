@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Same classification as Actions.kind_of(). Later words win: "Manual timer off" is a timer action.
+KINDS = (
+    ('startup', 'startup'),
+    ('emergency', 'emergency'),
+    ('automate', 'automate'),
+    ('timer', 'timer'),
+)
+
+
+def backfill_kind(apps, schema_editor):
+    Actions = apps.get_model('orchid_app', 'Actions')
+    Actions.objects.update(kind='manual')
+    for word, kind in KINDS:
+        Actions.objects.filter(reason__icontains=word).update(kind=kind)
+
+
+def clear_kind(apps, schema_editor):
+    apps.get_model('orchid_app', 'Actions').objects.update(kind='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchid_app', '0009_actions_kind'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_kind, clear_kind),
+    ]
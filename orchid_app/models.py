@@ -40,8 +40,92 @@ class Sensors(models.Model):
         return get_diff(self.get_all_fields(), action)
 
 
+@python_2_unicode_compatible
+class SensorsSpread(models.Model):
+    '''Spread of readings averaged into Sensors record: one row per averaged field.'''
+    sensors = models.ForeignKey(Sensors, on_delete=models.CASCADE, related_name='spread')
+    field = models.CharField(max_length=8)
+    count = models.PositiveIntegerField()
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+    stddev = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('sensors', 'field')
+
+    def __str__(self):
+        return "[{}] {}: count:{}, min:{}, max:{}, stddev:{}".format(
+            self.sensors_id,
+            self.field,
+            self.count,
+            self.min,
+            self.max,
+            self.stddev,
+        )
+
+
+@python_2_unicode_compatible
+class SensorsRollup(models.Model):
+    '''Average, min and max of Sensors records in a period starting at date. Maintained by orchid_app.rollup.'''
+    date = models.DateTimeField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+    t_amb_avg = models.FloatField(null=True)
+    t_amb_min = models.FloatField(null=True)
+    t_amb_max = models.FloatField(null=True)
+    t_obj_avg = models.FloatField(null=True)
+    t_obj_min = models.FloatField(null=True)
+    t_obj_max = models.FloatField(null=True)
+    rh_avg = models.FloatField(null=True)
+    rh_min = models.FloatField(null=True)
+    rh_max = models.FloatField(null=True)
+    hpa_avg = models.FloatField(null=True)
+    hpa_min = models.FloatField(null=True)
+    hpa_max = models.FloatField(null=True)
+    lux_avg = models.FloatField(null=True)
+    lux_min = models.FloatField(null=True)
+    lux_max = models.FloatField(null=True)
+    wind_avg = models.FloatField(null=True)
+    wind_min = models.FloatField(null=True)
+    wind_max = models.FloatField(null=True)
+    water_avg = models.FloatField(null=True)
+    water_min = models.FloatField(null=True)
+    water_max = models.FloatField(null=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return "[@{}] count:{}, t_amb:{}, t_obj:{}, rh:{}, hpa:{}, lux:{}, water:{}, wind:{}".format(
+            self.date,
+            self.count,
+            self.t_amb_avg,
+            self.t_obj_avg,
+            self.rh_avg,
+            self.hpa_avg,
+            self.lux_avg,
+            self.water_avg,
+            self.wind_avg,
+        )
+
+
+class SensorsHourly(SensorsRollup):
+    pass
+
+
+class SensorsDaily(SensorsRollup):
+    pass
+
+
 @python_2_unicode_compatible
 class Actions(models.Model):
+    # Kinds of action. Derived from free text reason on save, indexed for the controller lookups.
+    MANUAL = 'manual'
+    AUTOMATE = 'automate'
+    TIMER = 'timer'          # Manual action with timer and timer off.
+    EMERGENCY = 'emergency'
+    STARTUP = 'startup'
+    KINDS = ((MANUAL, 'Manual'), (AUTOMATE, 'Automate'), (TIMER, 'Timer'), (EMERGENCY, 'Emergency'), (STARTUP, 'Startup'))
+
     date = models.DateTimeField(unique=True)
     mist = models.BooleanField(default=False)
     fan = models.BooleanField(default=False)
@@ -49,6 +133,17 @@ class Actions(models.Model):
     water = models.BooleanField(default=False)
     light = models.BooleanField(default=False)
     reason = models.TextField(default='')
+    kind = models.CharField(max_length=10, choices=KINDS, default='', editable=False)
+
+    class Meta:
+        index_together = [
+            ('kind', 'id'),
+            ('mist', 'kind', 'date'),
+            ('fan', 'kind', 'date'),
+            ('heat', 'kind', 'date'),
+            ('water', 'kind', 'date'),
+            ('light', 'kind', 'date'),
+        ]
 
     def __str__(self):
         return "[@{}] mist:{} fan:{} water:{} light:{} heat:{} reason:{}".format(
@@ -61,6 +156,21 @@ class Actions(models.Model):
             self.reason,
         )
 
+    def save(self, *args, **kwargs):
+        if not self.kind:
+            self.kind = self.kind_of(self.reason)
+        super(Actions, self).save(*args, **kwargs)
+
+    @classmethod
+    def kind_of(cls, reason):
+        '''Classify free text reason. The order matters: "Manual timer off" is a timer action.'''
+        reason = (reason or '').lower()
+        for word, kind in (('timer', cls.TIMER), ('automate', cls.AUTOMATE), ('emergency', cls.EMERGENCY),
+                           ('startup', cls.STARTUP)):
+            if word in reason:
+                return kind
+        return cls.MANUAL
+
     def equals(self, action):
         return self.get_all_fields() == action
 
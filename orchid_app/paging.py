@@ -0,0 +1,111 @@
+'''
+Keyset pagination on unique date column.
+Page is read by "WHERE date < cursor ORDER BY date DESC LIMIT n" by the date index instead of OFFSET,
+deep pages cost the same as the first one. Total is approximate: COUNT(*) is kept in memory for TOTAL_TIMEOUT.
+
+Query string of the page:
+    before=<cursor>   Older page than the cursor.
+    after=<cursor>    Newer page than the cursor.
+    last=1            The oldest page.
+    page=<number>     Number of the page for display only.
+Cursor is the date of edge record in microseconds since epoch.
+'''
+
+from datetime import datetime, timedelta
+from django.utils import timezone
+
+from orchid_app.utils import memoize
+
+PER_PAGE = 30
+TOTAL_TIMEOUT = 600  # seconds. Sensors are written once in 10 minutes.
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@memoize(keep=TOTAL_TIMEOUT)
+def approx_total(model):
+    '''Return number of records of the model. Counted once in TOTAL_TIMEOUT.'''
+    return model.objects.count()
+
+
+def to_cursor(date):
+    d = date - EPOCH
+    return str((d.days * 86400 + d.seconds) * 10 ** 6 + d.microseconds)
+
+
+def from_cursor(cursor):
+    '''Return aware datetime of the cursor. Raise ValueError on wrong cursor.'''
+    return EPOCH + timedelta(microseconds=int(cursor))
+
+
+class KeysetPage(object):
+
+    def __init__(self, qs, params, per_page=PER_PAGE, total=None):
+        '''
+        :param qs: QuerySet of model with unique date field.
+        :param params: request.GET
+        :param total: number of records, approx_total() of the model if None.
+        '''
+
+        self.per_page = per_page
+        self.total = approx_total(qs.model) if total is None else total
+        self.num_pages = max(1, (self.total + per_page - 1) // per_page)
+        try:
+            self.number = max(1, int(params.get('page', 1)))
+        except ValueError:
+            self.number = 1
+
+        try:
+            before = params.get('before')
+            after = params.get('after')
+            if before:
+                rows = list(qs.filter(date__lt=from_cursor(before)).order_by('-date')[:per_page + 1])
+                self.has_previous = True
+                self.has_next = len(rows) > per_page
+                rows = rows[:per_page]
+            elif after:
+                rows = list(qs.filter(date__gt=from_cursor(after)).order_by('date')[:per_page + 1])
+                self.has_previous = len(rows) > per_page
+                self.has_next = True
+                rows = rows[:per_page][::-1]
+            elif params.get('last'):
+                rows = list(qs.order_by('date')[:per_page + 1])
+                self.has_previous = len(rows) > per_page
+                self.has_next = False
+                rows = rows[:per_page][::-1]
+                self.number = self.num_pages
+            else:
+                rows = None
+        except (ValueError, OverflowError):  # Wrong cursor, show the first page.
+            rows = None
+
+        if rows is None:
+            rows = list(qs.order_by('-date')[:per_page + 1])
+            self.has_previous = False
+            self.has_next = len(rows) > per_page
+            rows = rows[:per_page]
+
+        if not self.has_previous:
+            self.number = 1
+        # Total is approximate, don't show page number above it.
+        self.num_pages = max(self.num_pages, self.number)
+        self.object_list = rows
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_query(self):
+        '''Query string of older page.'''
+        if not self.object_list:
+            return 'last=1'
+        return 'before=%s&page=%d' % (to_cursor(self.object_list[-1].date), self.number + 1)
+
+    @property
+    def previous_query(self):
+        '''Query string of newer page.'''
+        if not self.object_list:
+            return ''
+        return 'after=%s&page=%d' % (to_cursor(self.object_list[0].date), max(1, self.number - 1))
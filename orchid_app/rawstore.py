@@ -0,0 +1,186 @@
+'''
+Store of raw sensor samples.
+Sensors table keeps 10 minutes averages. Per-minute readings are kept here for diagnostics of fast events (leaks etc.).
+
+The store is append-only, one file per day (UTC), old files are removed after keep_days.
+File is a header followed by fixed-width records: timestamp (epoch seconds) and float per field, NaN for missing value.
+Records are appended in time order, so the file is its own time index: a range is found by binary search of
+the timestamps in memory mapped file. Writes go to the end of file only and aren't synced,
+this doesn't add write amplification of SQLite on the SD card.
+
+Usage as module:
+    store = rawstore.get_store()       # None if disabled by settings.RAW_STORE_DIR.
+    store.append({'t_amb': 24.1, 'water': 0.02})
+    store.read(time.time() - 3600)     # List of (timestamp, {field: value}) for last hour.
+'''
+
+import os
+import sys
+import time
+import mmap
+import struct
+import calendar
+import threading
+from datetime import datetime, timedelta
+from django.conf import settings
+
+FIELDS = ('t_amb', 't_obj', 'rh', 'hpa', 'lux', 'wind', 'water')
+RECORD = struct.Struct('<d%df' % len(FIELDS))
+MAGIC = b'ORCHRAW1'  # File header. Change it together with the RECORD format.
+KEEP_DAYS = 30
+NAN = float('nan')
+
+
+def _ts(t):
+    '''Return epoch seconds of datetime (naive is local time) or number.'''
+    if isinstance(t, datetime):
+        if t.tzinfo is None:
+            return time.mktime(t.timetuple()) + t.microsecond / 1e6
+        return calendar.timegm(t.utctimetuple()) + t.microsecond / 1e6
+    return float(t)
+
+
+def _day(ts):
+    return datetime.utcfromtimestamp(ts).date()
+
+
+def _float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class RawStore(object):
+
+    def __init__(self, path, keep_days=KEEP_DAYS):
+        self.path = path
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._last = 0  # Timestamp of last record. Keeps records in order when the clock steps back.
+
+    def filename(self, day):
+        return os.path.join(self.path, 'raw-%s.bin' % day.strftime('%Y%m%d'))
+
+    def append(self, values, ts=None):
+        '''Append record of {field: value}. Unknown fields are ignored, missing ones are stored as NaN.'''
+
+        with self._lock:
+            ts = max(ts or time.time(), self._last)
+            self._open(_day(ts))
+            self._file.write(RECORD.pack(ts, *[_float(values.get(k)) for k in FIELDS]))
+            self._file.flush()
+            self._last = ts
+
+    def read(self, start, end=None, fields=FIELDS):
+        '''Return list of (timestamp, {field: value}) for records in range [start, end), oldest first.
+        start and end are datetimes or epoch seconds. Missing values are None.
+        '''
+
+        start = _ts(start)
+        end = _ts(end) if end is not None else time.time() + 1
+        idx = [FIELDS.index(f) + 1 for f in fields]
+        res = []
+        day = _day(start)
+        while day <= _day(end):
+            for r in self._read_file(self.filename(day), start, end):
+                res.append((r[0], dict((f, None if r[i] != r[i] else r[i]) for f, i in zip(fields, idx))))
+            day += timedelta(days=1)
+        return res
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = None
+            self._day = None
+
+    def _open(self, day):
+        if day == self._day:
+            return
+        if self._file:
+            self._file.close()
+            self._file = None
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        name = self.filename(day)
+        size = os.path.getsize(name) if os.path.exists(name) else 0
+        if size >= len(MAGIC):
+            with open(name, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    # Other format or garbage. Keep it aside for the purge, appended records would be unreadable.
+                    os.rename(name, name[:-len('.bin')] + '.bad.bin')
+                    sys.stderr.write('Raw store file %s has bad header, kept as .bad.bin\n' % name)
+                    size = 0
+        self._file = open(name, 'ab')
+        if size < len(MAGIC):
+            self._file.truncate(0)
+            self._file.write(MAGIC)
+        elif (size - len(MAGIC)) % RECORD.size:
+            # Cut partial record of interrupted write.
+            self._file.truncate(size - (size - len(MAGIC)) % RECORD.size)
+        self._day = day
+        self._purge(day)
+
+    def _purge(self, today):
+        if not self.keep_days:
+            return
+        oldest = self.filename(today - timedelta(days=self.keep_days))
+        for f in os.listdir(self.path):
+            f = os.path.join(self.path, f)
+            if f.endswith('.bin') and os.path.basename(f).startswith('raw-') and f < oldest:
+                try:
+                    os.remove(f)
+                except OSError as e:
+                    sys.stderr.write('On raw store purge: %s (%s)' % (e, type(e)))
+
+    @staticmethod
+    def _read_file(name, start, end):
+        try:
+            f = open(name, 'rb')
+        except IOError:
+            return []
+
+        with f:
+            count = (os.fstat(f.fileno()).st_size - len(MAGIC)) // RECORD.size
+            if count <= 0:
+                return []
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if m[:len(MAGIC)] != MAGIC:
+                    return []
+
+                def ts(i):
+                    return RECORD.unpack_from(m, len(MAGIC) + i * RECORD.size)[0]
+
+                def bisect(t):
+                    lo, hi = 0, count
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if ts(mid) < t:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+                    return lo
+
+                return [RECORD.unpack_from(m, len(MAGIC) + i * RECORD.size) for i in xrange(bisect(start), bisect(end))]
+            finally:
+                m.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    '''Return RawStore shared by the process. Return None if the store is disabled in settings.'''
+    global _store
+    path = getattr(settings, 'RAW_STORE_DIR', None)
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = RawStore(path, getattr(settings, 'RAW_STORE_KEEP_DAYS', KEEP_DAYS))
+        return _store
@@ -0,0 +1,140 @@
+'''
+Hourly and daily rollups of Sensors records.
+Every new Sensors record is merged into its hour and day rows: running average, min and max per field.
+Periods start at local time (settings.TIME_ZONE) hour and midnight.
+Long range queries read the coarsest rollup which satisfies the requested resolution instead of raw records.
+
+Usage as module:
+    rollup.update(s)                                # After s.save(), in the same transaction.
+    rollup.backfill()                               # Rebuild all rollups from Sensors table.
+    rollup.history(since, resolution=86400)         # Daily rows: date and average per field.
+'''
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orchid_app import export, models
+
+FIELDS = ('t_amb', 't_obj', 'rh', 'hpa', 'lux', 'wind', 'water')
+RAW_PERIOD = 600  # seconds. Sensors records are written once in poll period of the runner.
+BATCH = 500       # Rows per SELECT and INSERT of backfill.
+
+
+def _local(date):
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, is_dst=False)
+    return timezone.localtime(date)
+
+
+def hour_start(date):
+    # DST changes on hour boundary, offset of the hour is the offset of its start.
+    return _local(date).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(date):
+    # Offset of midnight may differ from the offset of the date on DST change day.
+    return timezone.make_aware(_local(date).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0), is_dst=False)
+
+
+# Coarsest first: (period in seconds, model, start of period).
+LEVELS = (
+    (86400, models.SensorsDaily, day_start),
+    (3600, models.SensorsHourly, hour_start),
+)
+
+
+def _merge(row, sensors):
+    '''Add Sensors record to rollup row in place.'''
+
+    count = row.count + 1
+    for k in FIELDS:
+        v = getattr(sensors, k)
+        if v is None:
+            continue
+        v = float(v)
+        avg, lo, hi = [getattr(row, '%s_%s' % (k, a)) for a in ('avg', 'min', 'max')]
+        setattr(row, k + '_avg', v if avg is None else avg + (v - avg) / count)
+        setattr(row, k + '_min', v if lo is None else min(lo, v))
+        setattr(row, k + '_max', v if hi is None else max(hi, v))
+    row.count = count
+
+
+def update(sensors):
+    '''Merge new Sensors record into its hourly and daily rollups.
+    Errors are raised: the caller rolls back the Sensors record too, so rollups never miss a record.
+    '''
+
+    with transaction.atomic():
+        for _, model, start in LEVELS:
+            row, _ = model.objects.get_or_create(date=start(sensors.date))
+            _merge(row, sensors)
+            row.save()
+
+
+def backfill(since=None, stdout=None):
+    '''Rebuild rollups from Sensors records since given date (all records if None).
+    Periods are rebuilt entirely: records since start of the day of since are read.
+    Return dictionary of {model name: rows written}.
+    '''
+
+    qs = models.Sensors.objects.all()
+    if since:
+        since = day_start(since)
+        qs = qs.filter(date__gte=since)
+
+    result = {}
+    with transaction.atomic():
+        for _, model, _ in LEVELS:
+            model.objects.filter(**({'date__gte': since} if since else {})).delete()
+            result[model.__name__] = 0
+
+        rows = dict((model, None) for _, model, _ in LEVELS)
+        batches = dict((model, []) for _, model, _ in LEVELS)
+        # Memory stays flat: one chunk of records and one batch of rows per level.
+        for chunk in export.chunked(qs, BATCH):
+            for s in chunk:
+                for _, model, start in LEVELS:
+                    date = start(s.date)
+                    if rows[model] is None or rows[model].date != date:
+                        rows[model] = model(date=date)
+                        batches[model].append(rows[model])
+                    _merge(rows[model], s)
+                    # Keep the last (still growing) row in the batch.
+                    if len(batches[model]) > BATCH:
+                        model.objects.bulk_create(batches[model][:-1])
+                        result[model.__name__] += len(batches[model]) - 1
+                        batches[model] = batches[model][-1:]
+
+        for model, batch in batches.iteritems():
+            model.objects.bulk_create(batch)
+            result[model.__name__] += len(batch)
+
+    if stdout:
+        stdout.write('Rollups written: %s' % ', '.join('%s: %d' % i for i in sorted(result.items())))
+    return result
+
+
+def source(resolution):
+    '''Return (period in seconds, model) of the coarsest data which satisfies resolution in seconds.
+    Fall back to raw Sensors records for resolution finer than an hour.
+    '''
+
+    for period, model, _ in LEVELS:
+        if period <= resolution:
+            return period, model
+    return RAW_PERIOD, models.Sensors
+
+
+def history(since, until=None, resolution=RAW_PERIOD, fields=FIELDS):
+    '''Return QuerySet of dictionaries {'date': ..., field: average, ...} ordered by date,
+    read from the coarsest rollup which satisfies resolution in seconds.
+    '''
+
+    period, model = source(resolution)
+    qs = model.objects.filter(date__gte=since)
+    if until:
+        qs = qs.filter(date__lt=until)
+    if model is not models.Sensors:
+        qs = qs.annotate(**dict((k, F(k + '_avg')) for k in fields))
+    return qs.order_by('date').values('date', *fields)
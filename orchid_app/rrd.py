@@ -0,0 +1,214 @@
+'''
+Round robin archives of system health: CPU, memory, flash and network metrics of sysinfo.
+Lets throttling, SD card fill and network drops be correlated with missed sensor samples.
+
+Like RRDtool: one file of fixed size, disk usage never grows.
+The file holds several archives of different resolution. Every archive is a ring of slots,
+slot of time t is number (t // step) % rows. A slot keeps its start time, so stale slots of the ring are skipped on read.
+Every update is consolidated into the current slot of each archive: number of samples, average and max per source.
+
+Sources:
+    gauge:   value is stored as is (load, temperature, percent).
+    counter: growing counter (bytes sent etc.). Rate per second since previous update is stored.
+             The first update and counter reset (reboot) give no value.
+
+Usage as module:
+    store = rrd.get_rrd()                              # None if disabled by settings.HEALTH_RRD (default).
+    store.update(sysinfo.get_snapshot().data)          # Once in a minute.
+    step, rows = store.fetch(time.time() - 86400, resolution=300)
+'''
+
+import os
+import sys
+import json
+import time
+import struct
+import threading
+from django.conf import settings
+
+GAUGE = 'gauge'
+COUNTER = 'counter'
+
+# (name, type, path in sysinfo data structure)
+SOURCES = (
+    ('cpu_load', GAUGE, ('cpu', 'load', 'current')),             # %
+    ('cpu_temp', GAUGE, ('cpu', 'temp', 'current')),             # C
+    ('cpu_freq', GAUGE, ('cpu', 'frequency', 'current')),        # MHz. Drops on throttling.
+    ('ram', GAUGE, ('memory', 'RAM_MB', 'percent')),             # %
+    ('flash', GAUGE, ('memory', 'flash_GB', 'percent')),         # %
+    ('net_sent', COUNTER, ('network', 'counters', 'sent_B')),    # bytes/s
+    ('net_recv', COUNTER, ('network', 'counters', 'recv_B')),    # bytes/s
+    ('net_errors', COUNTER, ('network', 'counters', 'errors')),  # 1/s
+    ('net_drops', COUNTER, ('network', 'counters', 'drops')),    # 1/s
+)
+# (step seconds, rows), finest first. Slots are aligned to UTC: daily slots start at UTC midnight, not local one.
+ARCHIVES = (
+    (60, 1440),     # 1 day by minute
+    (600, 1008),    # 1 week by 10 minutes
+    (3600, 2160),   # 90 days by hour
+    (86400, 730),   # 2 years by day
+)
+MAGIC = b'ORCHRRD1'
+NAN = float('nan')
+
+
+class RRD(object):
+
+    def __init__(self, path, sources=SOURCES, archives=ARCHIVES):
+        self.path = path
+        self.sources = tuple(sources)
+        self.archives = tuple(archives)
+        self.record = struct.Struct('<d' + 'Hff' * len(self.sources))  # Slot: start time, per source: count, avg, max.
+        self._lock = threading.Lock()
+        self._file = None
+        self._offsets = []  # File offset of every archive.
+        self._last = {}     # Source name: (time, value) of previous update of counter.
+
+    def names(self):
+        return [s[0] for s in self.sources]
+
+    def update(self, data, ts=None):
+        '''Consolidate sample of sysinfo data structure (see sysinfo.get_sysinfo_d()) taken at ts epoch seconds.'''
+
+        ts = ts or time.time()
+        with self._lock:
+            values = [self._value(s, data, ts) for s in self.sources]
+            self._open()
+            for (step, rows), offset in zip(self.archives, self._offsets):
+                start = float(int(ts) - int(ts) % step)
+                pos = offset + int(start // step % rows) * self.record.size
+                self._file.seek(pos)
+                slot = list(self.record.unpack(self._file.read(self.record.size)))
+                if slot[0] != start:
+                    slot = [start] + [0, NAN, NAN] * len(self.sources)
+                for i, v in enumerate(values):
+                    if v != v:
+                        continue
+                    c, a, m = slot[1 + 3 * i:4 + 3 * i]
+                    if not c:
+                        slot[1 + 3 * i:4 + 3 * i] = [1, v, v]
+                    else:
+                        slot[1 + 3 * i:4 + 3 * i] = [min(c + 1, 0xFFFF), a + (v - a) / (c + 1), max(m, v)]
+                self._file.seek(pos)
+                self._file.write(self.record.pack(*slot))
+            self._file.flush()
+
+    def fetch(self, start, end=None, resolution=0, sources=None):
+        '''Return (step, list of (time, {source: (average, max, count)})) of slots in range [start, end) epoch seconds,
+        oldest first. Data is read from the finest archive with step not less than resolution which still keeps start.
+        Slots without samples are skipped, sources without samples in a slot are (None, None, 0).
+        '''
+
+        now = time.time()
+        end = end if end is not None else now
+        names = self.names()
+        sources = sources or names
+        idx = [names.index(s) for s in sources]
+
+        n = len(self.archives) - 1
+        for i, (step, rows) in enumerate(self.archives):
+            if step >= resolution and now - step * rows <= start:
+                n = i
+                break
+        step, rows = self.archives[n]
+
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return step, []
+        with f:
+            header = self._header()
+            if f.read(len(header)) != header:
+                return step, []
+            f.seek(len(header) + sum(r for _, r in self.archives[:n]) * self.record.size)
+            buf = f.read(rows * self.record.size)
+        if len(buf) < rows * self.record.size:
+            return step, []
+
+        res = []
+        t = float(int(start) - int(start) % step)
+        while t < end:
+            r = self.record.unpack_from(buf, int(t // step % rows) * self.record.size)
+            if r[0] == t:
+                res.append((t, dict((s, (r[2 + 3 * i], r[3 + 3 * i], r[1 + 3 * i]) if r[1 + 3 * i] else (None, None, 0))
+                                    for s, i in zip(sources, idx))))
+            t += step
+        return step, res
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = None
+
+    def _value(self, source, data, ts):
+        name, kind, path = source
+        try:
+            v = data
+            for k in path:
+                v = v[k]
+            v = float(v)
+        except (KeyError, TypeError, ValueError):
+            return NAN
+        if kind == COUNTER:
+            last = self._last.get(name)
+            self._last[name] = (ts, v)
+            if not last or ts <= last[0] or v < last[1]:
+                return NAN
+            return (v - last[1]) / (ts - last[0])
+        return v
+
+    def _header(self):
+        spec = json.dumps({'sources': [s[:2] for s in self.sources], 'archives': self.archives}, sort_keys=True)
+        return MAGIC + struct.pack('<H', len(spec)) + spec
+
+    def _open(self):
+        if self._file:
+            return
+        header = self._header()
+        size = len(header) + sum(rows for _, rows in self.archives) * self.record.size
+        f = None
+        if os.path.exists(self.path):
+            f = open(self.path, 'r+b')
+            if f.read(len(header)) != header or os.fstat(f.fileno()).st_size != size:
+                # Sources or archives are changed. Keep old file aside, don't mix layouts.
+                f.close()
+                f = None
+                os.rename(self.path, self.path + '.old')
+                sys.stderr.write('RRD %s layout is changed, old file is kept as .old\n' % self.path)
+        if f is None:
+            path = os.path.dirname(self.path)
+            if path and not os.path.isdir(path):
+                os.makedirs(path)
+            f = open(self.path, 'w+b')
+            f.write(header)
+            # Zero start time never matches a slot, so empty file has no data.
+            empty = b'\0' * self.record.size * 1024
+            left = size - len(header)
+            while left > 0:
+                f.write(empty[:left])
+                left -= len(empty)
+            f.flush()
+
+        self._file = f
+        self._offsets = []
+        offset = len(header)
+        for _, rows in self.archives:
+            self._offsets.append(offset)
+            offset += rows * self.record.size
+
+
+_rrd = None
+_rrd_lock = threading.Lock()
+
+
+def get_rrd():
+    '''Return RRD of system health shared by the process. Return None if it is disabled in settings.'''
+    global _rrd
+    path = getattr(settings, 'HEALTH_RRD', None)
+    if not path:
+        return None
+    with _rrd_lock:
+        if _rrd is None:
+            _rrd = RRD(path)
+        return _rrd
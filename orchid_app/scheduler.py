@@ -0,0 +1,119 @@
+'''
+Event driven scheduler of the control loop.
+Keep priority queue of next due actuator transitions. Sleep till the first of them is due or till something happens:
+- notify() is called (new Sensors record in the runner),
+- new action is written to the DB, e.g. manual action from web.
+Writes are detected by modification time of the DB file. This costs a stat, not a DB query.
+Only when the file is modified, the marker (last Actions id) is read: other writes (sessions, Sensors) don't wake.
+The baseline is taken by begin() at start of the tick, so actions written while the tick runs aren't missed.
+'''
+
+import os
+import time
+import heapq
+import threading
+from django.conf import settings
+
+MAX_SLEEP = 600     # seconds. Re-evaluate the state at least once in sensors poll period.
+WATCH_PERIOD = 1    # seconds. How often check the DB file for writes of other processes.
+DUE_LAG = 0.1       # seconds. Wake a bit after due time. Remaining time must be zero when checked.
+RETRY_PERIOD = 60   # seconds. Retry of overdue transitions, as often as the former 1 minute loop.
+
+
+class Scheduler(object):
+
+    def __init__(self, db_files=None, marker=None):
+        '''
+        :param db_files: files to watch. Default: files of SQLite DB of settings.
+        :param marker: function returning value which changes on watched writes. None wakes on any write of the files.
+        '''
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._queue = []  # Heap of (due_time, name, action)
+        if db_files is None:
+            db = settings.DATABASES['default']
+            db_files = [db['NAME'], db['NAME'] + '-wal'] if 'sqlite3' in db['ENGINE'] else []
+        self._db_files = db_files
+        self._marker = marker
+        self._db_mtime = self._get_db_mtime()
+        self._marker_value = None
+
+    def begin(self):
+        '''Take the baseline at start of the tick. Any watched write since then wakes next wait(), own writes too.'''
+
+        mtime = self._get_db_mtime()
+        value = self._get_marker()
+        with self._lock:
+            self._db_mtime = mtime
+            self._marker_value = value
+
+    def plan(self, transitions, now=None):
+        '''Replace the queue with list of (seconds_from_now, name, action).
+        Transitions which are due already weren't applied by last tick (overridden or failed).
+        They are retried in RETRY_PERIOD, not at once: nothing changed since the tick.
+        '''
+
+        now = now or time.time()
+        queue = [(now + (t if t > 0 else RETRY_PERIOD), n, a) for t, n, a in transitions]
+        heapq.heapify(queue)
+        with self._lock:
+            self._queue = queue
+
+    def next_due(self):
+        '''Return (due_time, name, action) of the first transition. Return None if nothing planned.'''
+
+        with self._lock:
+            return self._queue[0] if self._queue else None
+
+    def notify(self):
+        '''Wake the control loop now.'''
+        self._wake.set()
+
+    def wait(self):
+        '''Block till the first transition is due, notify() is called or the DB is written by another process.
+        Return reason of wake up: 'due', 'event', 'db' or 'idle' (MAX_SLEEP passed).
+        '''
+
+        deadline = time.time() + MAX_SLEEP
+        first = self.next_due()
+        reason = 'idle'
+        if first and first[0] + DUE_LAG < deadline:
+            deadline = first[0] + DUE_LAG
+            reason = 'due'
+
+        while True:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return reason
+            if self._wake.wait(min(timeout, WATCH_PERIOD)):
+                self._wake.clear()
+                return 'event'
+            if self._db_changed():
+                return 'db'
+
+    def _get_db_mtime(self):
+        mtime = []
+        for f in self._db_files:
+            try:
+                mtime.append(os.stat(f).st_mtime)
+            except OSError:
+                mtime.append(None)
+        return mtime
+
+    def _get_marker(self):
+        return self._marker() if self._marker else None
+
+    def _db_changed(self):
+        mtime = self._get_db_mtime()
+        with self._lock:
+            if mtime == self._db_mtime:
+                return False
+            self._db_mtime = mtime
+        if not self._marker:
+            return True
+
+        value = self._get_marker()
+        with self._lock:
+            changed = value != self._marker_value
+            self._marker_value = value
+        return changed
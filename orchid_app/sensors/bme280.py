@@ -18,16 +18,20 @@
 # http://www.raspberrypi-spy.co.uk/
 #
 #--------------------------------------
-import smbus
 import time
 from ctypes import c_short
 from ctypes import c_byte
 from ctypes import c_ubyte
 
+try:
+  from orchid_app.sensors import i2c
+except ImportError:  # Running standalone from this directory.
+  import i2c
+
 DEVICE = 0x76 # Default device I2C address
 
 
-bus = smbus.SMBus(1) # Rev 2 Pi, Pi 2 & Pi 3 uses bus 1
+bus = i2c.get_bus(1) # Rev 2 Pi, Pi 2 & Pi 3 uses bus 1. Shared with other sensors.
                      # Rev 1 Pi uses bus 0
 
 def getShort(data, index):
@@ -56,101 +60,153 @@ def readBME280ID(addr=DEVICE):
   (chip_id, chip_version) = bus.read_i2c_block_data(addr, REG_ID, 2)
   return (chip_id, chip_version)
 
+# Register Addresses
+REG_DATA = 0xF7
+REG_CONTROL = 0xF4
+REG_CONFIG  = 0xF5
+REG_CONTROL_HUM = 0xF2
+
+# Oversample settings - page 26, 27
+# 0 skips the measure, 1..5 are x1, x2, x4, x8, x16. More samples: less noise, longer measure.
+OVERSAMPLE_TEMP = 2
+OVERSAMPLE_PRES = 2
+OVERSAMPLE_HUM = 2
+
+# Modes - page 27
+MODE_SLEEP = 0
+MODE_FORCED = 1  # Single measure on every read, sleep between reads.
+MODE_NORMAL = 3  # Continuous measures, read returns the latest.
+
+class BME280(object):
+  '''BME280 driver. Calibration is read once per chip. Every read is a single 8 bytes data burst.
+  In forced mode the read starts a measure and waits its maximal time (datasheet page 51).
+  In normal mode the device measures continuously with standby time (register 0xF5: t_sb, filter) between measures.
+  '''
+
+  def __init__(self, addr=DEVICE, oversample_temp=OVERSAMPLE_TEMP, oversample_pres=OVERSAMPLE_PRES,
+               oversample_hum=OVERSAMPLE_HUM, mode=MODE_FORCED, config=0):
+    self.addr = addr
+    self.mode = mode
+    self.config = config
+    self.control_hum = oversample_hum
+    self.control = oversample_temp<<5 | oversample_pres<<2 | mode
+    # Max measure time in seconds.
+    samples = [0 if o == 0 else 1 << (o - 1) for o in (oversample_temp, oversample_pres, oversample_hum)]
+    self.measure_time = (1.25 + 2.3 * samples[0] + (2.3 * samples[1] + 0.575 if samples[1] else 0) +
+                         (2.3 * samples[2] + 0.575 if samples[2] else 0)) / 1000.0
+    self._calibrated = False
+
+  def calibrate(self):
+    '''Read blocks of calibration data from EEPROM. See Page 22 data sheet.'''
+    cal1 = bus.read_i2c_block_data(self.addr, 0x88, 24)
+    cal2 = bus.read_i2c_block_data(self.addr, 0xA1, 1)
+    cal3 = bus.read_i2c_block_data(self.addr, 0xE1, 7)
+
+    # Convert byte data to word values
+    self.dig_T1 = getUShort(cal1, 0)
+    self.dig_T2 = getShort(cal1, 2)
+    self.dig_T3 = getShort(cal1, 4)
+
+    self.dig_P1 = getUShort(cal1, 6)
+    self.dig_P2 = getShort(cal1, 8)
+    self.dig_P3 = getShort(cal1, 10)
+    self.dig_P4 = getShort(cal1, 12)
+    self.dig_P5 = getShort(cal1, 14)
+    self.dig_P6 = getShort(cal1, 16)
+    self.dig_P7 = getShort(cal1, 18)
+    self.dig_P8 = getShort(cal1, 20)
+    self.dig_P9 = getShort(cal1, 22)
+
+    self.dig_H1 = getUChar(cal2, 0)
+    self.dig_H2 = getShort(cal3, 0)
+    self.dig_H3 = getUChar(cal3, 2)
+
+    dig_H4 = getChar(cal3, 3)
+    dig_H4 = (dig_H4 << 24) >> 20
+    self.dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
+
+    dig_H5 = getChar(cal3, 5)
+    dig_H5 = (dig_H5 << 24) >> 20
+    self.dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
+
+    self.dig_H6 = getChar(cal3, 6)
+    self._calibrated = True
+
+  def read_raw(self):
+    '''Return raw (pressure, temperature, humidity) ADC values.'''
+    if not self._calibrated:
+      self.calibrate()
+
+    # Humidity setting is applied on next write of control register. Write it once. So the config.
+    bus.write_config(self.addr, REG_CONTROL_HUM, self.control_hum)
+    bus.write_config(self.addr, REG_CONFIG, self.config)
+
+    if self.mode == MODE_FORCED:
+      # Every write of control register starts a measure. The bus is free for other devices while measuring.
+      bus.write_byte_data(self.addr, REG_CONTROL, self.control)
+      time.sleep(self.measure_time)
+    else:
+      bus.write_config(self.addr, REG_CONTROL, self.control)
+
+    # Read temperature/pressure/humidity
+    data = bus.read_i2c_block_data(self.addr, REG_DATA, 8)
+
+    pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
+    temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
+    hum_raw = (data[6] << 8) | data[7]
+    return pres_raw, temp_raw, hum_raw
+
+  def read(self):
+    '''Return tuple of temperature (C), pressure (hPa), humidity (%).'''
+    pres_raw, temp_raw, hum_raw = self.read_raw()
+    return self.compensate(pres_raw, temp_raw, hum_raw)
+
+  def compensate(self, pres_raw, temp_raw, hum_raw):
+    dig_T1, dig_T2, dig_T3 = self.dig_T1, self.dig_T2, self.dig_T3
+    dig_P1, dig_P2, dig_P3, dig_P4, dig_P5 = self.dig_P1, self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5
+    dig_P6, dig_P7, dig_P8, dig_P9 = self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9
+    dig_H1, dig_H2, dig_H3, dig_H4, dig_H5, dig_H6 = self.dig_H1, self.dig_H2, self.dig_H3, self.dig_H4, self.dig_H5, self.dig_H6
+
+    #Refine temperature
+    var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
+    var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
+    t_fine = var1+var2
+    temperature = float(((t_fine * 5) + 128) >> 8);
+
+    # Refine pressure and adjust for temperature
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * dig_P6 / 32768.0
+    var2 = var2 + var1 * dig_P5 * 2.0
+    var2 = var2 / 4.0 + dig_P4 * 65536.0
+    var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * dig_P1
+    if var1 == 0:
+      pressure=0
+    else:
+      pressure = 1048576.0 - pres_raw
+      pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+      var1 = dig_P9 * pressure * pressure / 2147483648.0
+      var2 = pressure * dig_P8 / 32768.0
+      pressure = pressure + (var1 + var2 + dig_P7) / 16.0
+
+    # Refine humidity
+    humidity = t_fine - 76800.0
+    humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
+    humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
+    if humidity > 100:
+      humidity = 100
+    elif humidity < 0:
+      humidity = 0
+
+    return temperature/100.0, pressure/100.0, humidity
+
+_drivers = {}
+
 def readBME280All(addr=DEVICE):
-  # Register Addresses
-  REG_DATA = 0xF7
-  REG_CONTROL = 0xF4
-  REG_CONFIG  = 0xF5
-
-  REG_CONTROL_HUM = 0xF2
-  REG_HUM_MSB = 0xFD
-  REG_HUM_LSB = 0xFE
-
-  # Oversample setting - page 27
-  OVERSAMPLE_TEMP = 2
-  OVERSAMPLE_PRES = 2
-  MODE = 1
-
-  # Oversample setting for humidity register - page 26
-  OVERSAMPLE_HUM = 2
-  bus.write_byte_data(addr, REG_CONTROL_HUM, OVERSAMPLE_HUM)
-
-  control = OVERSAMPLE_TEMP<<5 | OVERSAMPLE_PRES<<2 | MODE
-  bus.write_byte_data(addr, REG_CONTROL, control)
-
-  # Read blocks of calibration data from EEPROM
-  # See Page 22 data sheet
-  cal1 = bus.read_i2c_block_data(addr, 0x88, 24)
-  cal2 = bus.read_i2c_block_data(addr, 0xA1, 1)
-  cal3 = bus.read_i2c_block_data(addr, 0xE1, 7)
-
-  # Convert byte data to word values
-  dig_T1 = getUShort(cal1, 0)
-  dig_T2 = getShort(cal1, 2)
-  dig_T3 = getShort(cal1, 4)
-
-  dig_P1 = getUShort(cal1, 6)
-  dig_P2 = getShort(cal1, 8)
-  dig_P3 = getShort(cal1, 10)
-  dig_P4 = getShort(cal1, 12)
-  dig_P5 = getShort(cal1, 14)
-  dig_P6 = getShort(cal1, 16)
-  dig_P7 = getShort(cal1, 18)
-  dig_P8 = getShort(cal1, 20)
-  dig_P9 = getShort(cal1, 22)
-
-  dig_H1 = getUChar(cal2, 0)
-  dig_H2 = getShort(cal3, 0)
-  dig_H3 = getUChar(cal3, 2)
-
-  dig_H4 = getChar(cal3, 3)
-  dig_H4 = (dig_H4 << 24) >> 20
-  dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
-
-  dig_H5 = getChar(cal3, 5)
-  dig_H5 = (dig_H5 << 24) >> 20
-  dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
-
-  dig_H6 = getChar(cal3, 6)
-
-  # Read temperature/pressure/humidity
-  data = bus.read_i2c_block_data(addr, REG_DATA, 8)
-  pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
-  temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
-  hum_raw = (data[6] << 8) | data[7]
-
-  #Refine temperature
-  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
-  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
-  t_fine = var1+var2
-  temperature = float(((t_fine * 5) + 128) >> 8);
-
-  # Refine pressure and adjust for temperature
-  var1 = t_fine / 2.0 - 64000.0
-  var2 = var1 * var1 * dig_P6 / 32768.0
-  var2 = var2 + var1 * dig_P5 * 2.0
-  var2 = var2 / 4.0 + dig_P4 * 65536.0
-  var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
-  var1 = (1.0 + var1 / 32768.0) * dig_P1
-  if var1 == 0:
-    pressure=0
-  else:
-    pressure = 1048576.0 - pres_raw
-    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-    var1 = dig_P9 * pressure * pressure / 2147483648.0
-    var2 = pressure * dig_P8 / 32768.0
-    pressure = pressure + (var1 + var2 + dig_P7) / 16.0
-
-  # Refine humidity
-  humidity = t_fine - 76800.0
-  humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
-  humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
-  if humidity > 100:
-    humidity = 100
-  elif humidity < 0:
-    humidity = 0
-
-  return temperature/100.0, pressure/100.0, humidity
+  # Keep driver per device: calibration is read once.
+  if addr not in _drivers:
+    _drivers[addr] = BME280(addr)
+  return _drivers[addr].read()
 
 def main():
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+'''
+Shared I2C bus manager.
+Keep single SMBus handle per bus for all sensors of the process. Serialize access to the bus by lock.
+Keep configuration registers written once: write_config() writes the register only if the value differs from last written.
+
+Usage as module:
+    bus = i2c.get_bus(1)
+    bus.write_config(0x4A, 0x02, 0x40)        # Written once.
+    data = bus.read_i2c_block_data(0x4A, 0x03, 2)
+    with bus.lock:                            # Keep several transfers together.
+        bus.write_byte_data(0x76, 0xF4, 0x49)
+        data = bus.read_i2c_block_data(0x76, 0xF7, 8)
+
+Author: iGrowing
+'''
+
+import threading
+
+import smbus
+
+
+class Bus(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.lock = threading.RLock()
+        self._bus = None
+        self._config = {}  # (address, register): value
+
+    def _handle(self):
+        if self._bus is None:
+            self._bus = smbus.SMBus(self.number)
+        return self._bus
+
+    def _call(self, addr, name, *args):
+        with self.lock:
+            try:
+                return getattr(self._handle(), name)(addr, *args)
+            except IOError:
+                # The device could be reset or replaced. Write its configuration again next time.
+                self.forget(addr)
+                raise
+
+    def read_byte_data(self, addr, reg):
+        return self._call(addr, 'read_byte_data', reg)
+
+    def write_byte_data(self, addr, reg, value):
+        return self._call(addr, 'write_byte_data', reg, value)
+
+    def read_word_data(self, addr, reg):
+        return self._call(addr, 'read_word_data', reg)
+
+    def write_word_data(self, addr, reg, value):
+        return self._call(addr, 'write_word_data', reg, value)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return self._call(addr, 'read_i2c_block_data', reg, length)
+
+    def write_config(self, addr, reg, value):
+        '''Write configuration byte to the register once. Return True if written now.'''
+        with self.lock:
+            if self._config.get((addr, reg)) == value:
+                return False
+            self.write_byte_data(addr, reg, value)
+            self._config[(addr, reg)] = value
+            return True
+
+    def forget(self, addr=None):
+        '''Drop known configuration of the device (all devices if addr is None).'''
+        with self.lock:
+            for k in self._config.keys():
+                if addr is None or k[0] == addr:
+                    del self._config[k]
+
+    def close(self):
+        with self.lock:
+            if self._bus is not None:
+                self._bus.close()
+            self._bus = None
+            self.forget()
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(number=1):
+    '''Return shared Bus. Rev 2 Pi, Pi 2 & Pi 3 uses bus 1. Rev 1 Pi uses bus 0.'''
+    with _buses_lock:
+        if number not in _buses:
+            _buses[number] = Bus(number)
+        return _buses[number]
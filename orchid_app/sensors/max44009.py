@@ -5,19 +5,23 @@
 # This code is designed to work with the MAX44009_I2CS I2C Mini Module available from ControlEverything.com.
 # https://www.controleverything.com/products
 
-import smbus
 import time
 
+try:
+    from orchid_app.sensors import i2c
+except ImportError:  # Running standalone from this directory.
+    import i2c
+
 def readLight():
-    # Get I2C bus
-    bus = smbus.SMBus(1)
+    # Get shared I2C bus
+    bus = i2c.get_bus(1)
 
     # MAX44009 address, 0x4A(74)
     # Select configuration register, 0x02(02)
     # 0x40(64) Continuous mode, Integration time = 800 ms
-    bus.write_byte_data(0x4A, 0x02, 0x40)
-
-    time.sleep(0.1)  # In continuous/automatic mode the integration time is defined internally => no sense to wait long.
+    # The device keeps measuring after configuration. Configure once, wait for the first measure only.
+    if bus.write_config(0x4A, 0x02, 0x40):
+        time.sleep(0.1)  # In continuous/automatic mode the integration time is defined internally => no sense to wait long.
 
     # MAX44009 address, 0x4A(74)
     # Read data back from 0x03(03), 2 bytes
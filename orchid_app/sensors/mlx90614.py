@@ -4,7 +4,11 @@
 # Import as module.
 
 import sys
-import Adafruit_GPIO.I2C as I2C
+
+try:
+    from orchid_app.sensors import i2c
+except ImportError:  # Running standalone from this directory.
+    import i2c
 
 class Melexis:
     ''' Data registers can be read only (access RAM).
@@ -13,7 +17,8 @@ class Melexis:
     '''
 
     def __init__(self, addr=0x5A, bus=1, c=True):
-        self._i2c = I2C.Device(addr, bus)
+        self._addr = addr
+        self._bus = i2c.get_bus(bus)  # Shared bus handle.
         self._c = c  # Celsius by default
 
     def readAmbient(self):
@@ -26,7 +31,9 @@ class Melexis:
         return self._readTemp(0x08)
 
     def readData(self, reg):
-        return self._i2c.readS16(reg)
+        # Signed 16 bit, little endian as SMBus word.
+        data = self._bus.read_word_data(self._addr, reg) & 0xFFFF
+        return data - 0x10000 if data > 0x7FFF else data
 
     def _readTemp(self, reg):
         temp = self.readData(reg)
@@ -37,7 +44,7 @@ class Melexis:
         return self.readData(reg | 0x20)
 
     def writeConfig(self, reg, data):
-        self._i2c.write16(reg | 0x20, data)
+        self._bus.write_word_data(self._addr, reg | 0x20, data & 0xFFFF)
         
 
 if  __name__ == "__main__":
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''
+Pulse counter for flow and wind sensors.
+Count falling edges by GPIO interrupt callbacks instead of waiting for every edge in a loop.
+No edge is missed at high rates and no thread is blocked per sensor.
+
+The counter is lock free: only the GPIO callback thread writes it, readers take the difference from their last read.
+Timestamps of recent edges are kept in a ring buffer. Rate is calculated by intervals between the edges.
+
+SimulatedGPIO replaces RPi.GPIO where it isn't installed (not a Raspberry Pi) or if ORCHID_SIMULATED_GPIO environment
+variable is set. The fallback is logged: simulated counters never count. RPi.GPIO errors on a Pi (e.g. no access to
+/dev/gpiomem) aren't hidden. Use it for tests without hardware:
+    gpio = pulse.SimulatedGPIO()
+    c = pulse.PulseCounter(25, gpio=gpio)
+    gpio.pulse(25, 10)
+    c.take()   # 10
+
+Author: iGrowing
+'''
+
+import os
+import sys
+import time
+from collections import deque
+
+HISTORY = 1024  # Keep timestamps of last edges.
+
+
+class SimulatedGPIO(object):
+    '''Stand-in for RPi.GPIO. Call pulse() to simulate edges on input pin.'''
+
+    BCM = 11
+    OUT = 0
+    IN = 1
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self._callbacks = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        pass
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+    def pulse(self, pin, count=1, interval=0):
+        '''Simulate count edges on the pin with interval in seconds between them.'''
+        for i in range(count):
+            if i and interval:
+                time.sleep(interval)
+            callback = self._callbacks.get(pin)
+            if callback:
+                callback(pin)
+
+
+if os.environ.get('ORCHID_SIMULATED_GPIO'):
+    sys.stderr.write('ORCHID_SIMULATED_GPIO is set: pulse counters use SimulatedGPIO.\n')
+    GPIO = SimulatedGPIO()
+else:
+    try:
+        import RPi.GPIO as GPIO
+    except ImportError:  # Not a Raspberry Pi.
+        sys.stderr.write('RPi.GPIO is not installed: pulse counters use SimulatedGPIO, no pulses are counted.\n')
+        GPIO = SimulatedGPIO()
+
+
+class PulseCounter(object):
+
+    def __init__(self, pin, gpio=None, edge=None, bouncetime=1, history=HISTORY):
+        self.pin = pin
+        self.gpio = gpio or GPIO
+        self.count = 0                          # Total edges. Written by GPIO callback only.
+        self.edges = deque(maxlen=history)      # Timestamps of last edges.
+        self._taken = 0
+        self.gpio.setwarnings(False)  # Disable warnings
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.gpio.add_event_detect(pin, self.gpio.FALLING if edge is None else edge, callback=self._edge, bouncetime=bouncetime)
+
+    def stop(self):
+        self.gpio.remove_event_detect(self.pin)
+
+    def _edge(self, channel):
+        self.edges.append(time.time())
+        self.count += 1
+
+    def take(self):
+        '''Return number of edges since last take().'''
+        count = self.count
+        ticks = count - self._taken
+        self._taken = count
+        return ticks
+
+    def rate(self, window=1.0, now=None):
+        '''Return edges per second by intervals between the edges in last window seconds.'''
+        now = now or time.time()
+        edges = [t for t in list(self.edges) if t >= now - window]
+        if len(edges) > 1 and edges[-1] > edges[0]:
+            return (len(edges) - 1) / (edges[-1] - edges[0])
+        return len(edges) / float(window)
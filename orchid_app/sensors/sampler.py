@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+'''
+Concurrent sensors sampling.
+Start read of every sensor in a small thread pool and collect results till each sensor's deadline.
+Sample takes time of the slowest sensor, not sum of all of them. Failed or late sensor is reported as missing,
+values of healthy sensors are kept.
+
+Usage as module:
+    s = sampler.Sampler({'lux': max44009.readLight, 't_obj': mlx90614.Melexis().readObject1}, timeout=5)
+    values, missing = s.sample()   # {'lux': 12.3}, {'t_obj': 'timeout'}
+
+Author: iGrowing
+'''
+
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+TIMEOUT = 5  # seconds. Default deadline of sensor read.
+
+
+class Sampler(object):
+
+    def __init__(self, readers, timeout=TIMEOUT, timeouts=None):
+        '''
+        :param readers: dict of sensor name: function returning the reading.
+        :param timeout: default deadline in seconds.
+        :param timeouts: dict of sensor name: deadline in seconds, overrides the default.
+        '''
+        self.readers = readers
+        self.timeouts = dict((k, (timeouts or {}).get(k, timeout)) for k in readers)
+        self._pool = ThreadPool(len(readers))
+        self._pending = {}  # Sensor name: result of read which is not finished yet.
+
+    def sample(self):
+        '''Return tuple of dicts: ({sensor: value}, {sensor: reason of missing value}).'''
+
+        values = {}
+        missing = {}
+        started = time.time()
+        results = {}
+        for name, read in self.readers.iteritems():
+            # Don't pile up reads of hanging sensor.
+            if name in self._pending and not self._pending[name].ready():
+                missing[name] = 'busy'
+                continue
+            results[name] = self._pool.apply_async(read)
+
+        for name, r in results.iteritems():
+            try:
+                values[name] = r.get(max(0, started + self.timeouts[name] - time.time()))
+                self._pending.pop(name, None)
+            except TimeoutError:
+                self._pending[name] = r
+                missing[name] = 'timeout'
+            except Exception as e:
+                self._pending.pop(name, None)
+                missing[name] = '%s (%s)' % (e, type(e))
+
+        return values, missing
+
+    def close(self):
+        self._pool.terminate()
@@ -0,0 +1,100 @@
+'''
+Compiled index of state_list criteria.
+Every axis (t_amb, rh, wind) is split by sorted breakpoints of all criteria into elementary intervals.
+Each interval keeps a bit mask of the states covering it. Bit number is the state index in the list.
+Classification is a bisect per axis, AND of 3 masks and the highest bit: the last matching state in the list wins,
+the same as reversed scan of state_list did.
+'''
+
+import sys
+from bisect import bisect_left, bisect_right
+
+# Sensors field, criteria low bound (inclusive), criteria high bound (exclusive).
+AXES = (('t_amb', 'tmin', 'tmax'), ('rh', 'hmin', 'hmax'), ('wind', 'wmin', 'wmax'))
+ALL = -1  # All bits set.
+
+
+class StateIndex(object):
+
+    def __init__(self, states):
+        self.states = states
+        self.axes = []
+        for field, lo, hi in AXES:
+            points = sorted(set([s['criteria'][lo] for s in states] + [s['criteria'][hi] for s in states]))
+            masks = [0] * (len(points) - 1)
+            for i, s in enumerate(states):
+                for j in range(bisect_left(points, s['criteria'][lo]), bisect_left(points, s['criteria'][hi])):
+                    masks[j] |= 1 << i
+            self.axes.append((field, points, masks))
+
+        # Averaging window in hours: mask of states using it.
+        self.windows = {}
+        for i, s in enumerate(states):
+            self.windows[s['avg']] = self.windows.get(s['avg'], 0) | 1 << i
+
+    def match(self, status, avg=None):
+        '''Return bit mask of states which criteria match the status.
+        If avg provided, only states averaged by this window are matched.
+        '''
+
+        mask = ALL if avg is None else self.windows.get(avg, 0)
+        for field, points, masks in self.axes:
+            if not mask:
+                break
+            j = bisect_right(points, status[field]) - 1
+            mask &= masks[j] if 0 <= j < len(masks) else 0
+        return mask
+
+    def lookup(self, status, avg=None):
+        '''Return tuple of (state, index) of the last state in the list matching the status.
+        Return (None, None) if no state matches.
+        '''
+
+        return self._last(self.match(status, avg))
+
+    def classify(self, statuses):
+        '''Choose the state by status averaged with the window of the state.
+        :param statuses: dict of {avg: status} for every window in self.windows.
+        Return tuple of (state, index). Return (None, None) if no state matches.
+        '''
+
+        mask = 0
+        for avg, status in statuses.iteritems():
+            mask |= self.match(status, avg)
+        return self._last(mask)
+
+    def _last(self, mask):
+        if not mask:
+            return None, None
+        i = mask.bit_length() - 1
+        return self.states[i], i
+
+    def check(self):
+        '''Return tuple of lists (overlaps, gaps) in the criteria table.
+        Every item is a tuple of (((field, low, high), ...), [names of states]).
+        Gaps are searched in the range covered by the table only.
+        '''
+
+        overlaps = []
+        gaps = []
+        (tf, tp, tm), (hf, hp, hm), (wf, wp, wm) = self.axes
+        for ti in range(len(tm)):
+            for hi in range(len(hm)):
+                for wi in range(len(wm)):
+                    mask = tm[ti] & hm[hi] & wm[wi]
+                    cell = ((tf, tp[ti], tp[ti + 1]), (hf, hp[hi], hp[hi + 1]), (wf, wp[wi], wp[wi + 1]))
+                    names = [s['name'] for i, s in enumerate(self.states) if mask >> i & 1]
+                    if not names:
+                        gaps.append((cell, names))
+                    elif len(names) > 1:
+                        overlaps.append((cell, names))
+        return overlaps, gaps
+
+    def report(self, out=sys.stderr):
+        '''Write overlaps and gaps of the criteria table. Return True if the table is clean.'''
+
+        overlaps, gaps = self.check()
+        for title, items in (('overlap', overlaps), ('gap', gaps)):
+            for cell, names in items:
+                out.write('State criteria %s: %s %s\n' % (title, ', '.join('%s [%s, %s)' % c for c in cell), ', '.join(names)))
+        return not overlaps and not gaps
@@ -1,3 +1,1062 @@
-from django.test import TestCase
+import os
+import csv
+import json
+import time
+import shutil
+import tempfile
+import StringIO
+import threading
+import BaseHTTPServer
+import SocketServer
+import urlparse
+import struct
+import cStringIO
+from decimal import Decimal
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from orchid_app import cache, checks, controller, db, export, metrics, models, paging, rawstore, rollup
+from orchid_app import rrd, scheduler, state_index, views
+from orchid_app.management.commands import runner
+from orchid_app.sensors import pulse
+from orchid_app.utils import notify, pushb, pushbullet, stats
+
+
+def baseline_avg(rows):
+    '''Averages of Sensors rows as the original calc_avg() sums them: Decimal / count, integer // count.'''
+    ed = {}
+    for d in rows:
+        for k in cache.SensorsWindows.FIELDS:
+            ed[k] = ed.get(k, 0) + getattr(d, k)
+    return dict((k, v / len(rows)) for k, v in ed.iteritems())
+
+
+def baseline_state(status):
+    '''Index of the state by the original linear scan of state_list.'''
+    for state in reversed(controller.state_list):
+        cr = state['criteria']
+        if cr['tmin'] <= status['t_amb'] < cr['tmax'] and cr['hmin'] <= status['rh'] < cr['hmax'] and cr['wmin'] <= status['wind'] < cr['wmax']:
+            return controller.state_list.index(state)
+
+
+class AveragesTest(TestCase):
+
+    def create(self, *rows):
+        now = timezone.now()
+        for i, (t_amb, rh, lux) in enumerate(rows):
+            models.Sensors.objects.create(date=now - timedelta(minutes=10 * (i + 1)), t_amb=t_amb, t_obj=Decimal('19.5'),
+                                          rh=rh, hpa=Decimal('1013.2'), lux=lux, wind=Decimal('0.33'), water=0)
+        return baseline_avg(list(models.Sensors.objects.all()))
+
+    def averages(self):
+        windows = cache.SensorsWindows([1])
+        windows.load()
+        return windows.average(1), controller.calc_avg_db([1])[1]
+
+    def test_as_baseline(self):
+        expected = self.create((Decimal('20.1'), 50, 4), (Decimal('20.2'), 51, 5), (Decimal('20.2'), 51, 5))
+        self.assertEqual(expected['lux'], 4)  # 4.67 is floor divided.
+        self.assertEqual(expected['rh'], 50)
+        for avg in self.averages():
+            for k in cache.SensorsWindows.FIELDS:
+                self.assertEqual(avg[k], expected[k], k)
+                self.assertEqual(type(avg[k]), type(expected[k]), k)
+
+    def test_threshold(self):
+        # 24.97 C and 39.67 % stay below the 25 C and 40 % bounds of state_list.
+        expected = self.create((Decimal('24.9'), 39, 100), (Decimal('25.0'), 40, 100), (Decimal('25.0'), 40, 100))
+        self.assertLess(expected['t_amb'], 25)
+        self.assertEqual(expected['rh'], 39)
+        for avg in self.averages():
+            self.assertEqual(avg['t_amb'], expected['t_amb'])
+            self.assertEqual(baseline_state(avg), baseline_state(expected))
+            self.assertEqual(controller.state_list[baseline_state(avg)]['name'], 't17h0w0')
+
+
+class SensorsWindowsTest(TestCase):
+
+    def create(self, date, rh):
+        return models.Sensors.objects.create(date=date, t_amb=Decimal('20.0'), t_obj=Decimal('19.5'), rh=rh,
+                                             hpa=Decimal('1013.2'), lux=100, wind=Decimal('0.33'), water=0)
+
+    def test_eviction(self):
+        t = timezone.now()
+        for minutes, rh in ((23 * 60, 10), (50, 20), (20, 30), (5, 40)):
+            self.create(t - timedelta(minutes=minutes), rh)
+        windows = cache.SensorsWindows([0.4, 1, 24])
+        windows.load()
+
+        rh = lambda hours, now: windows.average(hours, now=now)['rh']
+        self.assertEqual([rh(h, t) for h in (0.4, 1, 24)], [35, 30, 25])
+        # 0.4 hours window is empty: last record.
+        now = t + timedelta(minutes=30)
+        self.assertEqual([rh(h, now) for h in (0.4, 1, 24)], [40, 35, 25])
+        self.assertEqual(windows.average(0.4, now=now)['duration'], 0.4)
+        # The oldest record is out of all windows and is dropped.
+        now = t + timedelta(minutes=61)
+        self.assertEqual([rh(h, now) for h in (0.4, 1, 24)], [40, 40, 30])
+        self.assertEqual(len(windows._rows), 3)
+
+        # Emptied windows count new records from zero.
+        windows.update(self.create(now - timedelta(minutes=1), 50))
+        self.assertEqual([rh(h, now) for h in (0.4, 1, 24)], [50, 50, 35])
+        self.assertEqual(windows.average(0.4, now=now)['t_amb'], baseline_avg([models.Sensors.objects.last()])['t_amb'])
+
+    def test_no_records_in_window(self):
+        last = self.create(timezone.now() - timedelta(hours=30), 60)
+        windows = cache.SensorsWindows([1])
+        avg = windows.average(1)
+        expected = last.get_all_fields()
+        expected['duration'] = 1
+        self.assertEqual(dict(avg), expected)
+
+    def test_empty_db(self):
+        windows = cache.SensorsWindows([1])
+        self.assertEqual(dict(windows.average(1)), {'duration': 1})
+        self.assertEqual(dict(controller.calc_avg_db([1])[1]), {'duration': 1})
+
+
+class ActionsCacheTest(TestCase):
+    # (reason, actuators on). A timer turns actuators on, then they are turned off one by one.
+    ACTIONS = (
+        ('System startup', {}),
+        ('Automate for state: t17h40w0', {'mist': True}),
+        ('Manual with timer for 30 minutes', {'water': True, 'fan': True, 'mist': True}),
+        ('Automate for state: t17h40w0', {'water': True, 'fan': True}),
+        ('Manual', {'water': True}),
+        ('Automate for state: t25h40w2', {'water': True, 'heat': True}),
+        ('Manual timer off', {'heat': True}),
+        ('Automate for state: t25h40w2', {}),
+        ('Emergency shut off', {}),
+        ('Manual with timer for 5 minutes', {'light': True}),
+        ('Automate for state: t25h40w2', {'light': True, 'mist': True}),
+    )
+
+    def baseline(self):
+        '''The lookups by reason text of the original controller.'''
+        qs = models.Actions.objects
+        timer = qs.filter(reason__icontains='with timer').last()
+        was_on = [k for k, v in timer.get_all_fields().iteritems()
+                  if v and not qs.filter(**{k: False, 'id__gt': timer.id}).first()] if timer else []
+        on, off = {}, {}
+        for k in cache.ActionsCache.actuators():
+            a = qs.filter(**{k: True, 'reason__icontains': 'automate'}).last()
+            if a:
+                on[k] = a.date
+                a = qs.filter(**{'date__gt': a.date, k: False, 'reason__icontains': 'automate'}).first()
+                if a:
+                    off[k] = a.date
+        return {'automated': qs.filter(reason__icontains='automate').last(), 'timer_off': qs.filter(reason__icontains='timer off').last(),
+                'timer': timer, 'timer_on': sorted(was_on), 'automated_on': on, 'automated_off': off}
+
+    def state(self, c):
+        timer, was_on = c.get_timer_on()
+        return {'automated': c.last_automated, 'timer_off': c.last_timer_off, 'timer': timer, 'timer_on': sorted(was_on),
+                'automated_on': c.automated_on, 'automated_off': c.automated_off}
+
+    def test_as_baseline(self):
+        updated, synced = cache.ActionsCache(), cache.ActionsCache()
+        updated.load()
+        synced.load()
+        t = timezone.now() - timedelta(hours=1)
+        for i, (reason, on) in enumerate(self.ACTIONS):
+            a = models.Actions.objects.create(date=t + timedelta(minutes=i), reason=reason, **on)
+            updated.update(a)
+            synced.sync()
+            loaded = cache.ActionsCache()
+            loaded.load()
+            expected = self.baseline()
+            for c in (loaded, updated, synced):
+                self.assertEqual(self.state(c), expected, reason)
+                self.assertEqual(c.last, a)
+
+        # The last timer starts over: turn offs after the previous timer don't count.
+        self.assertEqual(self.state(loaded)['timer_on'], ['light'])
+
+    def test_partial_turn_off(self):
+        c = cache.ActionsCache()
+        c.load()
+        t = timezone.now() - timedelta(hours=1)
+        for i, (reason, on) in enumerate(self.ACTIONS[2:5]):
+            c.update(models.Actions.objects.create(date=t + timedelta(minutes=i), reason=reason, **on))
+            self.assertEqual(self.state(c)['timer_on'], [['fan', 'mist', 'water'], ['fan', 'water'], ['water']][i])
+
+    def test_empty(self):
+        c = cache.ActionsCache()
+        c.load()
+        self.assertTrue(c.loaded)
+        self.assertEqual(c.get_timer_on(), (None, []))
+        self.assertEqual(self.state(c), self.baseline())
+
+
+class SensorsSeriesTest(TestCase):
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.until = views._series_until
+        self.now = datetime(2026, 1, 1, 12, 10, tzinfo=timezone.utc)
+        views._series_until = lambda: self.now
+
+    def tearDown(self):
+        views._series_until = self.until
+
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_etag_follows_sliding_window(self):
+        r = self.get('/api/sensors/?fields=lux')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.get('/api/sensors/?fields=lux', r['ETag']).status_code, 304)
+        # The window moved forward by a period.
+        self.now += timedelta(minutes=10)
+        self.assertEqual(self.get('/api/sensors/?fields=lux', r['ETag']).status_code, 200)
+
+    def test_etag_of_fixed_window(self):
+        url = '/api/sensors/?fields=lux&until=2026-01-01T10:00:00Z'
+        r = self.get(url)
+        self.now += timedelta(minutes=10)
+        self.assertEqual(self.get(url, r['ETag']).status_code, 304)
+
+    def test_default_until_rounded_up(self):
+        until = self.until()
+        self.assertEqual(timezone.is_aware(until), True)
+        self.assertEqual(int((until - datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds()) % 600, 0)
+        self.assertTrue(timezone.now() < until <= timezone.now() + timedelta(minutes=10))
+
+
+class SchedulerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'db.sqlite3')
+        self.touch(0)
+        self.last_id = [1]
+        self.s = scheduler.Scheduler(db_files=[self.db], marker=lambda: self.last_id[0])
+        self.periods = scheduler.WATCH_PERIOD, scheduler.RETRY_PERIOD
+        scheduler.WATCH_PERIOD = 0.01
+
+    def tearDown(self):
+        scheduler.WATCH_PERIOD, scheduler.RETRY_PERIOD = self.periods
+        shutil.rmtree(self.dir)
+
+    def touch(self, t):
+        with open(self.db, 'a') as f:
+            f.write('x')
+        os.utime(self.db, (1000 + t, 1000 + t))
+
+    def test_action_written_during_tick_wakes(self):
+        self.s.begin()
+        # Tick runs: web writes an action.
+        self.touch(1)
+        self.last_id[0] = 2
+        self.s.plan([(60, 'fan', 'on')])
+        self.assertEqual(self.s.wait(), 'db')
+
+    def test_other_writes_dont_wake(self):
+        self.s.begin()
+        self.touch(1)  # Session or Sensors write: last Actions id is the same.
+        self.s.plan([(0.2, 'fan', 'on')])
+        self.assertEqual(self.s.wait(), 'due')
+
+    def test_overdue_retried(self):
+        scheduler.RETRY_PERIOD = 0.2
+        self.s.begin()
+        now = time.time()
+        self.s.plan([(-5, 'fan', 'on'), (0, 'mist', 'off'), (60, 'heat', 'on')], now=now)
+        self.assertEqual(self.s.next_due()[0], now + 0.2)
+        self.assertEqual(self.s.wait(), 'due')
+        self.assertGreaterEqual(time.time(), now + 0.2)
+        # The default retry is as often as the former 1 minute loop, not MAX_SLEEP.
+        self.assertEqual(self.periods[1], 60)
+
+    def test_notify(self):
+        self.s.begin()
+        self.s.plan([(60, 'fan', 'on')])
+        self.s.notify()
+        self.assertEqual(self.s.wait(), 'event')
+
+
+class PulseCounterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.gpio = pulse.SimulatedGPIO()
+        self.counter = pulse.PulseCounter(25, gpio=self.gpio)
+
+    def test_take(self):
+        self.assertEqual(self.counter.take(), 0)
+        self.gpio.pulse(25, 10)
+        self.assertEqual(self.counter.take(), 10)
+        self.assertEqual(self.counter.take(), 0)
+        self.gpio.pulse(25, 3)
+        self.assertEqual(self.counter.take(), 3)
+        self.assertEqual(self.counter.count, 13)
+
+    def test_stop(self):
+        self.counter.stop()
+        self.gpio.pulse(25, 5)
+        self.assertEqual(self.counter.take(), 0)
+
+    def test_rate(self):
+        self.counter.edges.extend([100.0, 100.5, 101.0, 101.5])
+        # 3 intervals in 1.5 seconds.
+        self.assertAlmostEqual(self.counter.rate(window=2, now=101.5), 2.0)
+        # Edges out of the window are ignored: 100.5 .. 101.5.
+        self.assertAlmostEqual(self.counter.rate(window=1, now=101.5), 2.0)
+
+    def test_rate_no_edges(self):
+        self.assertEqual(self.counter.rate(window=1, now=100.0), 0)
+        self.counter.edges.extend([90.0, 91.0])
+        self.assertEqual(self.counter.rate(window=1, now=100.0), 0)
+
+    def test_rate_single_edge(self):
+        self.counter.edges.append(99.5)
+        self.assertAlmostEqual(self.counter.rate(window=2, now=100.0), 0.5)
+
+
+class DispatcherTest(SimpleTestCase):
+
+    def wait(self, d):
+        deadline = time.time() + 5
+        while d.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(d.pending(), 0)
+        d.stop()
+
+    def test_retry_failed_channel_only(self):
+        sent = {'key1': [], 'key2': []}
+        failures = [1]
+
+        def key1(subject, body):
+            sent['key1'].append(subject)
+
+        def key2(subject, body):
+            if failures[0]:
+                failures[0] -= 1
+                raise IOError('Pushbullet is down')
+            sent['key2'].append(subject)
+
+        d = notify.Dispatcher([('pushbullet 1', key1), ('pushbullet 2', key2)], backoff=0.01)
+        d.start()
+        self.assertTrue(d.send('leak', 'body'))
+        self.wait(d)
+        self.assertEqual(sent, {'key1': ['leak'], 'key2': ['leak']})
+
+    def test_coalesce(self):
+        sent = []
+        d = notify.Dispatcher([('mail', lambda s, b: sent.append(b))], window=0.2)
+        d.start()
+        for i in range(3):
+            d.send('leak', 'liters %d' % i)
+        self.wait(d)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0], 'liters 0')
+        self.assertTrue(sent[1].startswith('liters 2') and 'Repeated 2 times' in sent[1])
+
+
+class PushbulletServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''Local stand-in of Pushbullet API. Counts connections and keeps requests.'''
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), PushbulletHandler)
+        self.connections = 0
+        self.requests = []  # (method, path, API key, data)
+        self.devices = [{'iden': 'phone1', 'icon': 'phone'}, {'iden': 'phone2', 'icon': 'phone'},
+                        {'iden': 'laptop', 'icon': 'desktop'}]
+
+    @property
+    def host(self):
+        return 'http://127.0.0.1:%d/v2' % self.server_address[1]
+
+
+class PushbulletHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive.
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, data):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        key = self.headers['Authorization'].split()[1].decode('base64').split(':')[0]
+        self.server.requests.append((self.command, self.path, key, body))
+        data = json.dumps(data)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply({'devices': self.server.devices})
+
+    def do_POST(self):
+        self._reply({'active': True})
+
+
+class PushbulletTest(SimpleTestCase):
+
+    def setUp(self):
+        self.server = PushbulletServer()
+        threading.Thread(target=self.server.serve_forever).start()
+        self.saved = pushb.HOST, pushb.private.PUSHBULLET_API_KEY
+        pushb.HOST = self.server.host
+        pushb._clients.clear()
+        pushb._phones.clear()
+
+    def tearDown(self):
+        for p in pushb._clients.values():
+            p.session.close()
+        pushb._clients.clear()
+        pushb._phones.clear()
+        pushb.HOST, pushb.private.PUSHBULLET_API_KEY = self.saved
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests(self, method):
+        return [r for r in self.server.requests if r[0] == method]
+
+    def test_burst_reuses_connection(self):
+        pushb.private.PUSHBULLET_API_KEY = 'key1'
+        for i in range(5):
+            pushb.send_note('leak', 'liters %d' % i)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.requests('GET')), 1)
+        self.assertEqual(len(self.requests('POST')), 10)  # 2 phones.
+
+    def test_devices_fetched_once_per_key_within_ttl(self):
+        pushb.private.PUSHBULLET_API_KEY = ['key1', 'key2']
+        for i in range(3):
+            pushb.send_note('leak', 'body')
+        self.assertEqual(sorted(r[2] for r in self.requests('GET')), ['key1', 'key2'])
+        self.assertEqual(self.server.connections, 2)
+
+        # TTL is over.
+        for key in pushb._phones:
+            pushb._phones[key] = (0, pushb._phones[key][1])
+        pushb.send_note('leak', 'body')
+        self.assertEqual(len(self.requests('GET')), 4)
+
+    def test_push_notes_posts_per_recipient(self):
+        p = pushbullet.PushBullet('key1', host=self.server.host)
+        p.pushNotes(['a', 'b', 'c'], 'leak', 'body')
+        p.session.close()
+        posts = self.requests('POST')
+        self.assertEqual([(r[1], r[3]['device_iden'], r[3]['title']) for r in posts],
+                         [('/v2/pushes', 'a', 'leak'), ('/v2/pushes', 'b', 'leak'), ('/v2/pushes', 'c', 'leak')])
+        self.assertEqual(self.server.connections, 1)
+
+
+class FrozenTime(object):
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class RRDTest(SimpleTestCase):
+    SOURCES = (('load', rrd.GAUGE, ('cpu', 'load')), ('sent', rrd.COUNTER, ('net', 'sent')))
+    T = 1500000000  # Aligned to both steps.
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'health.rrd')
+        self.rrd = rrd.RRD(self.path, sources=self.SOURCES, archives=((60, 10), (600, 10)))
+        self.time = rrd.time
+        rrd.time = FrozenTime(self.T + 300)
+
+    def tearDown(self):
+        rrd.time = self.time
+        self.rrd.close()
+        shutil.rmtree(self.dir)
+
+    def update(self, ts, load=None, sent=None, store=None):
+        data = {'cpu': {}, 'net': {}}
+        if load is not None:
+            data['cpu']['load'] = load
+        if sent is not None:
+            data['net']['sent'] = sent
+        (store or self.rrd).update(data, ts)
+
+    def test_consolidation(self):
+        T = self.T
+        self.update(T, load=10)
+        self.update(T + 20, load=30)
+        self.update(T + 40, load=20)
+        self.update(T + 60, load=50)  # Next minute.
+        step, rows = self.rrd.fetch(T, T + 120, sources=['load'])
+        self.assertEqual(step, 60)
+        self.assertEqual(rows, [(T, {'load': (20.0, 30.0, 3)}), (T + 60, {'load': (50.0, 50.0, 1)})])
+        # 10 minutes archive keeps all of them in one slot.
+        step, rows = self.rrd.fetch(T, T + 600, resolution=600, sources=['load'])
+        self.assertEqual(step, 600)
+        self.assertEqual(rows, [(T, {'load': (27.5, 50.0, 4)})])
+
+    def test_start_out_of_archive(self):
+        # Minutes ring keeps 10 minutes only, older start is read from 10 minutes archive.
+        self.update(self.T, load=10)
+        step, rows = self.rrd.fetch(self.T - 600, self.T + 60)
+        self.assertEqual(step, 600)
+
+    def test_stale_slot_skipped(self):
+        T = self.T
+        rrd.time.now = T
+        self.update(T - 600, load=10)
+        self.update(T, load=20)  # 10 rows later: the same slot of the minutes ring.
+        step, rows = self.rrd.fetch(T - 600, T + 60, sources=['load'])
+        self.assertEqual(step, 60)
+        self.assertEqual(rows, [(T, {'load': (20.0, 20.0, 1)})])
+
+    def test_missing_value(self):
+        self.update(self.T, load=10)
+        step, rows = self.rrd.fetch(self.T, self.T + 60)
+        self.assertEqual(rows, [(self.T, {'load': (10.0, 10.0, 1), 'sent': (None, None, 0)})])
+
+    def test_counter_rate_and_reset(self):
+        T = self.T
+        self.update(T, sent=1000)         # First update: no rate.
+        self.update(T + 60, sent=7000)    # 100 per second.
+        self.update(T + 120, sent=500)    # Reboot reset the counter.
+        self.update(T + 180, sent=1100)   # 10 per second.
+        step, rows = self.rrd.fetch(T, T + 240, sources=['sent'])
+        self.assertEqual(rows, [(T, {'sent': (None, None, 0)}), (T + 60, {'sent': (100.0, 100.0, 1)}),
+                                (T + 120, {'sent': (None, None, 0)}), (T + 180, {'sent': (10.0, 10.0, 1)})])
+
+    def test_disabled_by_default(self):
+        self.assertEqual(rrd.get_rrd(), None)
+        self.assertEqual(Client(HTTP_HOST='localhost').get('/api/sysinfo/').status_code, 404)
+
+    def test_layout_change(self):
+        T = self.T
+        self.update(T, load=10)
+        self.rrd.close()
+        store = rrd.RRD(self.path, sources=self.SOURCES, archives=((60, 20),))
+        self.update(T + 60, load=20, store=store)
+        store.close()
+        self.assertTrue(os.path.exists(self.path + '.old'))
+        self.assertEqual(store.fetch(T, T + 120, sources=['load'])[1], [(T + 60, {'load': (20.0, 20.0, 1)})])
+        # Old file is intact.
+        old = rrd.RRD(self.path + '.old', sources=self.SOURCES, archives=((60, 10), (600, 10)))
+        self.assertEqual(old.fetch(T, T + 60, sources=['load'])[1], [(T, {'load': (10.0, 10.0, 1)})])
+
+
+class MetricsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = metrics.enabled, metrics._dump
+        metrics._dump = cache.Snapshot(os.path.join(self.dir, 'metrics.json'), max_age=60)
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.enabled, metrics._dump = self.saved
+        metrics.reset()
+        shutil.rmtree(self.dir)
+
+    def histogram(self, *seconds):
+        h = metrics.Histogram()
+        for s in seconds:
+            h.observe(s)
+        return h
+
+    def test_quantile(self):
+        h = self.histogram(*([0.002] * 9 + [0.3]))
+        self.assertEqual(h.quantile(0), 0.005)
+        self.assertEqual(h.quantile(0.5), 0.005)
+        self.assertEqual(h.quantile(0.9), 0.005)
+        self.assertEqual(h.quantile(0.95), 0.3)  # Bucket bound 0.5 is above max.
+        self.assertEqual(h.quantile(1), 0.3)
+        self.assertEqual(self.histogram(0.002, 100).quantile(1), 100)  # Above all buckets.
+        self.assertEqual(self.histogram(0.001).quantile(0.5), 0.001)  # Bounds are inclusive.
+        self.assertEqual(metrics.Histogram().quantile(0.5), 0)
+
+    def test_render_buckets(self):
+        h = self.histogram(0.0005, 0.002, 0.002, 0.3, 100)
+        text = metrics.render({'runner': {'runner.i2c': h}})
+        buckets = [(l.split('le="')[1].split('"')[0], int(l.split()[-1])) for l in text.splitlines()
+                   if l.startswith('orchid_latency_seconds_bucket{process="runner",name="runner.i2c"')]
+        self.assertEqual(len(buckets), len(metrics.BUCKETS) + 1)
+        counts = [n for _, n in buckets]
+        self.assertEqual(counts, sorted(counts))  # Cumulative.
+        self.assertEqual(buckets[0], ('0.001', 1))
+        self.assertEqual(buckets[2], ('0.01', 3))
+        self.assertEqual(buckets[-2], ('60', 4))
+        self.assertEqual(buckets[-1], ('+Inf', h.count))
+        self.assertIn('orchid_latency_seconds_count{process="runner",name="runner.i2c"} 5', text)
+        self.assertIn('orchid_latency_seconds_max{process="runner",name="runner.i2c"} 100.000000', text)
+
+    def test_disabled(self):
+        metrics.enabled = False
+        metrics.timed('f')(lambda: None)()
+        with metrics.timer('t'):
+            pass
+        metrics.dump('runner')
+        self.assertEqual(metrics.snapshot(), {})
+        self.assertFalse(os.path.exists(metrics._dump.path))
+
+    def test_collect(self):
+        metrics.enabled = True
+        metrics.timed('f')(lambda: None)()
+        metrics.dump('runner')
+        self.assertEqual(list(metrics.collect()), ['web'])  # Own dump is not collected twice.
+        self.assertEqual(metrics.collect()['web']['f'].count, 1)
+
+        metrics._dump.put({'process': 'runner', 'pid': 0, 'metrics': {'g': self.histogram(0.02).to_dict()}})
+        processes = metrics.collect()
+        self.assertEqual(sorted(processes), ['runner', 'web'])
+        self.assertEqual(processes['runner']['g'].buckets, self.histogram(0.02).buckets)
+
+        metrics._dump.max_age = -1  # Runner is stopped.
+        self.assertEqual(list(metrics.collect()), ['web'])
+
+
+class AccumulatorTest(SimpleTestCase):
+    VALUES = [2, 4, 4, 4, 5, 5, 7, 9, 20.5, -3.25]
+
+    def assertStats(self, a, values):
+        # Reference: two pass mean and sample variance.
+        mean = sum(values) / float(len(values))
+        variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1) if len(values) > 1 else 0.0
+        self.assertEqual(a.count, len(values))
+        self.assertAlmostEqual(a.mean, mean)
+        self.assertAlmostEqual(a.variance, variance)
+        self.assertAlmostEqual(a.stddev, variance ** 0.5)
+        self.assertEqual(a.min, min(values))
+        self.assertEqual(a.max, max(values))
+
+    def test_add(self):
+        a = stats.Accumulator()
+        for v in self.VALUES[:8]:
+            a.add(v)
+        self.assertStats(a, self.VALUES[:8])
+        self.assertAlmostEqual(a.variance, 32 / 7.0)
+        a.extend(self.VALUES[8:])
+        self.assertStats(a, self.VALUES)
+        self.assertStats(stats.Accumulator(['20.5', '21.1']), [20.5, 21.1])
+
+    def test_merge(self):
+        for i in range(len(self.VALUES) + 1):
+            a = stats.Accumulator(self.VALUES[:i]).merge(stats.Accumulator(self.VALUES[i:]))
+            self.assertStats(a, self.VALUES)
+
+    def test_empty_and_single(self):
+        a = stats.Accumulator()
+        self.assertEqual((a.count, a.mean, a.min, a.max, a.variance, a.stddev), (0, 0.0, None, None, 0.0, 0.0))
+        self.assertEqual(len(a.merge(stats.Accumulator())), 0)
+        a.add(7)
+        self.assertEqual((a.count, a.mean, a.min, a.max, a.variance, a.stddev), (1, 7.0, 7.0, 7.0, 0.0, 0.0))
+
+
+class SaveSensorsTest(TestCase):
+
+    def setUp(self):
+        self.saved = controller.sensor_windows, runner.save_spread
+        controller.sensor_windows = cache.SensorsWindows([1])
+        controller.sensor_windows.load()
+        controller.scheduler._wake.clear()
+
+    def tearDown(self):
+        controller.sensor_windows, runner.save_spread = self.saved
+        controller.scheduler._wake.clear()
+
+    def save(self, rh):
+        data = runner.new_data()
+        for k in runner.AVERAGED:
+            data[k].extend([10, 20])
+        s = models.Sensors(date=timezone.now() - timedelta(minutes=5), t_amb=Decimal('20.0'), t_obj=Decimal('19.5'), rh=rh,
+                           hpa=Decimal('1013.2'), lux=100, wind=Decimal('0.33'), water=0)
+        runner.save_sensors(s, data)
+
+    def test_saved(self):
+        self.save(50)
+        self.assertEqual(models.Sensors.objects.count(), 1)
+        self.assertEqual(models.SensorsSpread.objects.count(), len(runner.AVERAGED))
+        self.assertEqual(models.SensorsHourly.objects.count(), 1)
+        self.assertEqual(models.SensorsDaily.objects.count(), 1)
+        self.assertEqual(controller.sensor_windows.average(1)['rh'], 50)
+        self.assertTrue(controller.scheduler._wake.is_set())
+
+    def test_all_or_nothing(self):
+        def fail(s, data):
+            raise ValueError('Bad spread')
+        runner.save_spread = fail
+        self.assertRaises(ValueError, self.save, 50)
+        self.assertEqual(models.Sensors.objects.count(), 0)
+        self.assertEqual(models.SensorsHourly.objects.count(), 0)
+        self.assertEqual(controller.sensor_windows.average(1), {'duration': 1})
+        self.assertFalse(controller.scheduler._wake.is_set())
+
+
+class StateIndexTest(SimpleTestCase):
+    T = [Decimal(x) / 2 for x in range(-4, 84)] + [Decimal('24.9'), Decimal('25.0'), Decimal('35.9'), Decimal('36.0')]
+    RH = [0, 20, 39, 40, 79, 80, 100, 100.1]
+    WIND = [0, Decimal('1.99'), 2, 50, 100]
+
+    def baseline(self, statuses):
+        '''Reversed scan of state_list with status averaged by the window of each state.'''
+        for state in reversed(controller.state_list):
+            status, cr = statuses[state['avg']], state['criteria']
+            if cr['tmin'] <= status['t_amb'] < cr['tmax'] and cr['hmin'] <= status['rh'] < cr['hmax'] and cr['wmin'] <= status['wind'] < cr['wmax']:
+                return state, controller.state_list.index(state)
+        return None, None
+
+    def test_classify(self):
+        index = state_index.StateIndex(controller.state_list)
+        windows = sorted(index.windows)
+        for t in self.T:
+            for rh in self.RH:
+                for w in self.WIND:
+                    status = {'t_amb': t, 'rh': rh, 'wind': w}
+                    self.assertEqual(index.lookup(status), self.baseline(dict((a, status) for a in windows)))
+                    # Every window averages to another temperature.
+                    statuses = dict((a, dict(status, t_amb=t + i * Decimal('0.7'))) for i, a in enumerate(windows))
+                    self.assertEqual(index.classify(statuses), self.baseline(statuses), statuses)
+
+    def test_check(self):
+        states = [{'name': 'cold', 'avg': 1, 'criteria': {'tmin': 0, 'tmax': 20, 'hmin': 0, 'hmax': 100, 'wmin': 0, 'wmax': 10}},
+                  {'name': 'warm', 'avg': 1, 'criteria': {'tmin': 15, 'tmax': 30, 'hmin': 0, 'hmax': 50, 'wmin': 0, 'wmax': 10}}]
+        overlaps, gaps = state_index.StateIndex(states).check()
+        self.assertEqual(overlaps, [((('t_amb', 15, 20), ('rh', 0, 50), ('wind', 0, 10)), ['cold', 'warm'])])
+        self.assertEqual(gaps, [((('t_amb', 20, 30), ('rh', 50, 100), ('wind', 0, 10)), [])])
+        out = StringIO.StringIO()
+        self.assertFalse(state_index.StateIndex(states).report(out))
+        self.assertEqual(out.getvalue(), 'State criteria overlap: t_amb [15, 20), rh [0, 50), wind [0, 10) cold, warm\n'
+                                         'State criteria gap: t_amb [20, 30), rh [50, 100), wind [0, 10) \n')
+
+    def test_state_list_is_clean(self):
+        self.assertTrue(controller.state_index.report(StringIO.StringIO()))
+        self.assertEqual(checks.state_criteria(None), [])
+
+
+class RawStoreTest(SimpleTestCase):
+    MIDNIGHT = 1767225600  # 2026-01-01 00:00 UTC
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = rawstore.RawStore(self.dir, keep_days=2)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def append(self, *timestamps):
+        for ts in timestamps:
+            self.store.append({'t_amb': ts % 3600 / 60 + 0.5, 'water': 0.25, 'unknown': 1}, ts)
+
+    def test_day_boundary(self):
+        t = self.MIDNIGHT
+        self.append(t - 120, t - 60, t, t + 60)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['raw-20251231.bin', 'raw-20260101.bin'])
+        rows = self.store.read(t - 90, t + 60)
+        self.assertEqual([ts for ts, _ in rows], [t - 60, t])
+        self.assertEqual(rows[0][1]['t_amb'], 59.5)
+        self.assertEqual(rows[0][1]['water'], 0.25)
+        self.assertIsNone(rows[0][1]['rh'])  # Missing value.
+        # Aware datetimes and a subset of fields.
+        rows = self.store.read(datetime(2025, 12, 31, 23, 58, tzinfo=timezone.utc), fields=('water',))
+        self.assertEqual(rows, [(t - 120, {'water': 0.25}), (t - 60, {'water': 0.25}), (t, {'water': 0.25}), (t + 60, {'water': 0.25})])
+
+    def test_range(self):
+        t = self.MIDNIGHT
+        self.append(*range(t, t + 100 * 60, 60))
+        for start, end in ((t, t + 60), (t + 30, t + 150), (t + 60 * 50, t + 60 * 53), (t - 60, t + 1), (t + 60 * 99, t + 86400)):
+            expected = [ts for ts in range(t, t + 100 * 60, 60) if start <= ts < end]
+            self.assertEqual([ts for ts, _ in self.store.read(start, end)], expected, (start, end))
+        self.assertEqual(self.store.read(t + 60 * 100, t + 86400), [])
+        self.assertEqual(self.store.read(t - 3600, t), [])
+
+    def test_clock_step_back(self):
+        t = self.MIDNIGHT
+        self.append(t + 60, t)
+        self.assertEqual([ts for ts, _ in self.store.read(t, t + 120)], [t + 60, t + 60])
+
+    def test_purge(self):
+        t = self.MIDNIGHT
+        self.append(t - 5 * 86400)
+        self.append(t - 2 * 86400)  # Older than keep_days are purged when a day is opened.
+        self.assertEqual(os.listdir(self.dir), ['raw-20251230.bin'])
+        self.append(t - 86400, t)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['raw-20251230.bin', 'raw-20251231.bin', 'raw-20260101.bin'])
+
+    def test_truncated_record(self):
+        t = self.MIDNIGHT
+        self.append(t, t + 60)
+        self.store.close()
+        name = self.store.filename(rawstore._day(t))
+        with open(name, 'ab') as f:
+            f.write(rawstore.RECORD.pack(t + 120, *[1] * len(rawstore.FIELDS))[:10])
+        self.assertEqual([ts for ts, _ in self.store.read(t, t + 300)], [t, t + 60])
+        # The partial record is cut before next append.
+        self.append(t + 180)
+        self.assertEqual([ts for ts, _ in self.store.read(t, t + 300)], [t, t + 60, t + 180])
+        self.assertEqual(os.path.getsize(name), len(rawstore.MAGIC) + 3 * rawstore.RECORD.size)
+
+    def test_bad_magic(self):
+        t = self.MIDNIGHT
+        name = self.store.filename(rawstore._day(t))
+        with open(name, 'wb') as f:
+            f.write(b'ORCHRAW0' + rawstore.RECORD.pack(t, *[1] * len(rawstore.FIELDS)))
+        self.assertEqual(self.store.read(t, t + 300), [])
+        self.append(t + 60)
+        self.assertEqual([ts for ts, _ in self.store.read(t, t + 300)], [t + 60])
+        self.assertTrue(os.path.exists(name[:-len('.bin')] + '.bad.bin'))
+
+
+class RollupTest(TestCase):
+    START = datetime(2026, 1, 1, 20, 0, tzinfo=timezone.utc)  # Local midnight (UTC+2) is in the range.
+
+    def setUp(self):
+        self.batch = rollup.BATCH
+        rollup.BATCH = 3  # Several chunks and INSERTs.
+        for i in range(30):
+            s = models.Sensors.objects.create(date=self.START + timedelta(minutes=10 * i), t_amb=Decimal(200 + i * 7 % 13) / 10,
+                                              t_obj=Decimal('19.5'), rh=40 + i % 7, hpa=Decimal('1013.2'), lux=i * 100,
+                                              wind=Decimal(i % 3) / 4, water=Decimal(i % 2) / 10)
+            rollup.update(s)
+
+    def tearDown(self):
+        rollup.BATCH = self.batch
+
+    def rows(self, model):
+        return [dict((k, round(v, 9) if isinstance(v, float) else v) for k, v in r.iteritems())
+                for r in model.objects.order_by('date').values(*[f.name for f in model._meta.fields if f.name != 'id'])]
+
+    def test_backfill_as_update(self):
+        updated = dict((model, self.rows(model)) for _, model, _ in rollup.LEVELS)
+        self.assertEqual(len(updated[models.SensorsHourly]), 5)
+        self.assertEqual([r['count'] for r in updated[models.SensorsDaily]], [12, 18])
+        self.assertEqual(updated[models.SensorsDaily][1]['date'], datetime(2026, 1, 1, 22, 0, tzinfo=timezone.utc))
+        self.assertEqual(updated[models.SensorsHourly][0]['lux_max'], 500)
+
+        self.assertEqual(rollup.backfill(), {'SensorsDaily': 2, 'SensorsHourly': 5})
+        for model, rows in updated.iteritems():
+            self.assertEqual(self.rows(model), rows, model.__name__)
+
+        # Since a date: the whole day of it is rebuilt, older days are kept.
+        self.assertEqual(rollup.backfill(since=self.START + timedelta(hours=3)), {'SensorsDaily': 1, 'SensorsHourly': 3})
+        for model, rows in updated.iteritems():
+            self.assertEqual(self.rows(model), rows, model.__name__)
+
+    def test_source(self):
+        self.assertEqual(rollup.source(60), (rollup.RAW_PERIOD, models.Sensors))
+        self.assertEqual(rollup.source(1800), (rollup.RAW_PERIOD, models.Sensors))
+        self.assertEqual(rollup.source(3600), (3600, models.SensorsHourly))
+        self.assertEqual(rollup.source(6 * 3600), (3600, models.SensorsHourly))
+        self.assertEqual(rollup.source(86400), (86400, models.SensorsDaily))
+        self.assertEqual(rollup.source(30 * 86400), (86400, models.SensorsDaily))
+
+    def test_history(self):
+        until = self.START + timedelta(hours=2)
+        raw = list(rollup.history(self.START, until, fields=('lux',)))
+        self.assertEqual(len(raw), 12)
+        self.assertEqual(raw[1], {'date': self.START + timedelta(minutes=10), 'lux': 100})
+        hourly = list(rollup.history(self.START, until, resolution=3600, fields=('lux',)))
+        self.assertEqual(hourly, [{'date': self.START, 'lux': 250.0}, {'date': self.START + timedelta(hours=1), 'lux': 850.0}])
+        daily = list(rollup.history(self.START - timedelta(days=1), resolution=86400, fields=('lux',)))
+        self.assertEqual([r['lux'] for r in daily], [550.0, 2050.0])
+
+
+class KeysetPageTest(TestCase):
+    # All records in one second: the cursor must keep microseconds not to skip or repeat records on page edges.
+    BASE = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        for i in range(10):
+            models.Actions.objects.create(date=self.BASE + timedelta(microseconds=i), reason='Manual')
+
+    def page(self, query=''):
+        return paging.KeysetPage(models.Actions.objects.all(), dict(urlparse.parse_qsl(query)), per_page=3, total=10)
+
+    def micros(self, page):
+        return [(a.date - self.BASE).microseconds for a in page]
+
+    def test_walk(self):
+        p = self.page()
+        pages = [self.micros(p)]
+        self.assertEqual((p.has_previous, p.has_next, p.number, p.num_pages), (False, True, 1, 4))
+        while p.has_next:
+            p = self.page(p.next_query)
+            pages.append(self.micros(p))
+        self.assertEqual(pages, [[9, 8, 7], [6, 5, 4], [3, 2, 1], [0]])
+        self.assertEqual((p.has_previous, p.number), (True, 4))
+
+        pages = []
+        while p.has_previous:
+            p = self.page(p.previous_query)
+            pages.append(self.micros(p))
+        self.assertEqual(pages, [[3, 2, 1], [6, 5, 4], [9, 8, 7]])
+        self.assertEqual(p.number, 1)
+
+    def test_last(self):
+        p = self.page('last=1')
+        self.assertEqual(self.micros(p), [2, 1, 0])
+        self.assertEqual((p.has_previous, p.has_next, p.number), (True, False, 4))
+        pages = []
+        while p.has_previous:
+            p = self.page(p.previous_query)
+            pages.append(self.micros(p))
+        self.assertEqual(pages, [[5, 4, 3], [8, 7, 6], [9]])
+        self.assertEqual(p.number, 1)
+
+    def test_edges(self):
+        # Beyond the oldest record.
+        p = self.page('before=%s&page=5' % paging.to_cursor(self.BASE))
+        self.assertEqual((len(p), p.has_previous, p.has_next, p.next_query), (0, True, False, 'last=1'))
+        # Beyond the newest record.
+        p = self.page('after=%s&page=2' % paging.to_cursor(self.BASE + timedelta(microseconds=9)))
+        self.assertEqual((len(p), p.has_previous, p.has_next, p.previous_query), (0, False, True, ''))
+        # Wrong cursors show the first page.
+        for query in ('before=abc', 'after=99999999999999999999999', 'page=x'):
+            p = self.page(query)
+            self.assertEqual((self.micros(p), p.number), ([9, 8, 7], 1), query)
+        self.assertEqual(paging.from_cursor(paging.to_cursor(self.BASE + timedelta(microseconds=7))),
+                         self.BASE + timedelta(microseconds=7))
+
+    def test_empty(self):
+        models.Actions.objects.all().delete()
+        p = paging.KeysetPage(models.Actions.objects.all(), {}, per_page=3, total=0)
+        self.assertEqual((list(p), p.has_previous, p.has_next, p.num_pages, p.previous_query), ([], False, False, 1, ''))
+
+    def test_unique_dates(self):
+        # Keyset paging relies on it: records of equal dates would be skipped on page edges.
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, models.Actions.objects.create, date=self.BASE, reason='Manual')
+
+
+class ExportTest(TestCase):
+    START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    BLOCK = 10
+    ROWS = 2 * BLOCK + 5  # Three chunks.
+
+    @classmethod
+    def setUpTestData(cls):
+        models.Sensors.objects.bulk_create(
+            models.Sensors(date=cls.START + timedelta(minutes=10 * i, microseconds=i), t_amb=Decimal(i % 400) / 10,
+                           t_obj=Decimal('19.5'), rh=i % 101, hpa=Decimal('1013.2'), lux=i * 7, wind=Decimal(i % 9) / 4,
+                           water=Decimal(i % 3) / 100)
+            for i in range(cls.ROWS))
+        models.Actions.objects.bulk_create(
+            models.Actions(date=cls.START + timedelta(minutes=i), mist=bool(i % 2), fan=bool(i % 3), reason=u'Manual \u05d0 %d' % i,
+                           kind=models.Actions.MANUAL)
+            for i in range(5))
+
+    def setUp(self):
+        self.block = export.BLOCK
+        export.BLOCK = self.BLOCK
+
+    def tearDown(self):
+        export.BLOCK = self.block
+
+    def source(self, model, since=None, until=None):
+        names = [c for c, _ in export.columns(model)]
+        qs = model.objects.order_by('date')
+        if since:
+            qs = qs.filter(date__gte=since)
+        if until:
+            qs = qs.filter(date__lt=until)
+        return names, list(qs.values_list(*names))
+
+    def test_col(self):
+        for name, model in export.MODELS.iteritems():
+            chunks = list(export.generate(name, 'col'))
+            data = export.read_columns(cStringIO.StringIO(b''.join(chunks)))
+            names, rows = self.source(model)
+            codes = dict(export.columns(model))
+            self.assertEqual(sorted(data), sorted(names))
+            for i, c in enumerate(names):
+                expected = [r[i] for r in rows]
+                if codes[c] == 'f':
+                    expected = [struct.unpack('<f', struct.pack('<f', float(v)))[0] for v in expected]
+                self.assertEqual(data[c], expected, c)
+        self.assertEqual(len(list(export.generate('sensors', 'col'))), 3 + 2)  # Schema, blocks and the end.
+
+    def test_csv(self):
+        since, until = self.START + timedelta(minutes=10 * 5), self.START + timedelta(minutes=10 * (self.ROWS - 3))
+        chunks = list(export.generate('sensors', 'csv', since, until))
+        self.assertEqual(len(chunks), 2)  # Header with the first block, the second block.
+        lines = list(csv.reader(cStringIO.StringIO(''.join(chunks))))
+        names, rows = self.source(models.Sensors, since, until)
+        self.assertEqual(lines[0], names)
+        self.assertEqual(len(lines) - 1, self.ROWS - 8)
+        self.assertEqual(lines[1:], [[v.isoformat() if isinstance(v, datetime) else str(v) for v in r] for r in rows])
+
+        lines = list(csv.reader(cStringIO.StringIO(''.join(export.generate('actions', 'csv')))))
+        self.assertEqual(lines[2][lines[0].index('reason')].decode('utf-8'), u'Manual \u05d0 1')
+        self.assertEqual([l[lines[0].index('mist')] for l in lines[1:]], ['0', '1', '0', '1', '0'])
+
+    def test_wrong_format(self):
+        self.assertRaises(ValueError, export.generate, 'sensors', 'xml')
+
+
+class ActionsKindTest(TestCase):
+    # Reasons written by the controller, the views and the runner.
+    REASONS = ('System startup', 'Automate for state: t25h40w2', 'Automate overridden by user', 'Manual', 'manual',
+               'Manual with timer for 30 minutes', 'MANUAL WITH TIMER FOR 5 MINUTES', 'Manual timer off', 'Emergency shut off',
+               'unknown', '', None)
+
+    def test_as_reason_checks(self):
+        for reason in self.REASONS:
+            kind = models.Actions.kind_of(reason)
+            r = (reason or '').lower()
+            # The substring checks of the original controller.
+            self.assertEqual(kind == models.Actions.AUTOMATE, 'automate' in r, reason)
+            self.assertEqual(kind == models.Actions.TIMER, 'with timer' in r or 'timer off' in r, reason)
+            self.assertEqual(kind == models.Actions.STARTUP, 'startup' in r, reason)
+            self.assertEqual(kind == models.Actions.EMERGENCY, 'emergency' in r, reason)
+            if r == 'manual':
+                self.assertEqual(kind, models.Actions.MANUAL)
+        self.assertEqual(models.Actions.kind_of('unknown'), models.Actions.MANUAL)
+
+    def test_save(self):
+        a = models.Actions.objects.create(date=timezone.now(), reason='Manual with timer for 30 minutes')
+        self.assertEqual(models.Actions.objects.get(id=a.id).kind, models.Actions.TIMER)
+        a = models.Actions.objects.create(date=timezone.now(), reason='Manual', kind=models.Actions.EMERGENCY)
+        self.assertEqual(a.kind, models.Actions.EMERGENCY)  # Explicit kind is kept.
+
+
+class ActionsKindMigrationTest(TransactionTestCase):
+    BEFORE = [('orchid_app', '0009_actions_kind')]
+    AFTER = [('orchid_app', '0010_actions_kind_backfill')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_backfill(self):
+        Actions = self.migrate(self.BEFORE).get_model('orchid_app', 'Actions')
+        now = timezone.now()
+        for i, reason in enumerate(ActionsKindTest.REASONS[:-1]):
+            Actions.objects.create(date=now + timedelta(seconds=i), reason=reason)
+        self.assertEqual(set(Actions.objects.values_list('kind', flat=True)), set(['']))
+        try:
+            self.migrate(self.AFTER)
+            for a in models.Actions.objects.all():
+                self.assertEqual(a.kind, models.Actions.kind_of(a.reason), a.reason)
+            # Reversed migration clears the kinds.
+            Actions = self.migrate(self.BEFORE).get_model('orchid_app', 'Actions')
+            self.assertEqual(set(Actions.objects.values_list('kind', flat=True)), set(['']))
+        finally:
+            self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+class PragmasTest(TestCase):
+
+    def test_default(self):
+        self.assertEqual(db.get_pragmas(), db.PRAGMAS)
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], dict(db.PRAGMAS)['busy_timeout'])
+
+    @override_settings(SQLITE_PRAGMAS=[('busy_timeout', 1234)])
+    def test_override(self):
+        self.assertEqual(db.get_pragmas(), [('busy_timeout', 1234)])
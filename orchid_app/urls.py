@@ -8,4 +8,8 @@ urlpatterns = [
     url(r'^$', views.list, name='list'),
     url(r'^actions/$', views.action_list, name='action_list'),
     url(r'^sysinfo/$', views.sysinfo_list, name='sysinfo_list'),
+    url(r'^api/sensors/$', views.sensors_series, name='sensors_series'),
+    url(r'^api/sysinfo/$', views.sysinfo_series, name='sysinfo_series'),
+    url(r'^metrics$', views.metrics_text, name='metrics'),
+    url(r'^export/(?P<model>\w+)\.(?P<fmt>\w+)$', views.export_data, name='export_data'),
 ]
\ No newline at end of file
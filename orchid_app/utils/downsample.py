@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''
+Downsampling of time series for charts.
+Both functions take list of (x, y) points sorted by x and return at most threshold of them.
+
+lttb: Largest-Triangle-Three-Buckets (Sveinn Steinarsson, 2013). Keeps visual shape of the line.
+minmax: min and max point of every bucket. Keeps peaks and dips, e.g. short water leak.
+
+Usage as module:
+    downsample.lttb([(0, 1.0), (1, 3.0), ...], 500)
+
+Author: iGrowing
+'''
+
+
+def lttb(data, threshold):
+    n = len(data)
+    if threshold >= n or threshold < 3:
+        return list(data)
+
+    sampled = [data[0]]
+    every = (n - 2) / float(threshold - 2)  # Bucket size. First and last points are kept as is.
+    a = 0
+    for i in range(threshold - 2):
+        # Average point of next bucket is the third vertex of the triangle.
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        length = avg_end - avg_start
+        avg_x = sum(p[0] for p in data[avg_start:avg_end]) / float(length)
+        avg_y = sum(p[1] for p in data[avg_start:avg_end]) / float(length)
+
+        # Choose point of this bucket with the largest triangle area.
+        ax, ay = data[a]
+        max_area = -1
+        next_a = int(i * every) + 1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (data[j][1] - ay) - (ax - data[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(data[next_a])
+        a = next_a
+
+    sampled.append(data[-1])
+    return sampled
+
+
+def minmax(data, threshold):
+    n = len(data)
+    if threshold >= n or threshold < 2:
+        return list(data)
+
+    sampled = []
+    buckets = threshold // 2
+    every = n / float(buckets)
+    for i in range(buckets):
+        bucket = data[int(i * every):int((i + 1) * every)]
+        if not bucket:
+            continue
+        lo = min(bucket, key=lambda p: p[1])
+        hi = max(bucket, key=lambda p: p[1])
+        # Keep time order of the two points.
+        sampled.extend(sorted(set([lo, hi]), key=lambda p: p[0]))
+    return sampled
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
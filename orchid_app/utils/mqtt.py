@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+'''
+Long living MQTT clients. Keep single broker connection per process instead of connection per message.
+
+Subscriber keeps latest values and bounded history per topic. Main loop reads them without blocking.
+Publisher keeps bounded outbound queue. Messages wait in the queue while the broker is not connected.
+
+Usage as module:
+    s = mqtt.Subscriber('shm/orchid/#')
+    s.start()
+    s.latest('shm/orchid/wind/last_min')   # Latest value or None.
+    s.pop('shm/orchid/water/last_min')     # List of values received since last pop.
+
+    p = mqtt.get_publisher()               # Shared by all sensors of the process.
+    p.publish_many([('shm/orchid/wind/last_sec', 1.2), ('shm/orchid/wind/last_min', 0.8)])
+
+Usage as standalone:
+    python mqtt.py 'shm/orchid/#'
+
+Requirements:
+    sudo pip install paho-mqtt
+
+Author: iGrowing
+'''
+
+import sys
+import time
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+HOSTNAME = 'localhost'
+PORT = 1883
+KEEPALIVE = 65
+HISTORY = 1440  # Keep last day of per minute data per topic.
+QUEUE = 1000    # Keep outbound messages while broker is disconnected. Oldest are dropped.
+
+
+def _value(payload):
+    try:
+        return float(payload)
+    except (TypeError, ValueError):
+        return payload
+
+
+class Subscriber(object):
+    '''Subscribe once and keep receiving in the network thread of paho.
+    All read methods are thread safe and never block on the network.
+    '''
+
+    def __init__(self, topic, hostname=HOSTNAME, port=PORT, keepalive=KEEPALIVE, history=HISTORY):
+        self.topic = topic
+        self.hostname = hostname
+        self.port = port
+        self.keepalive = keepalive
+        self._history = history
+        self._lock = threading.Lock()
+        self._data = {}    # topic: deque of (sequence, timestamp, value)
+        self._read = {}    # topic: last sequence returned by pop()
+        self._seq = 0
+        self._client = mqtt.Client()
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
+
+    def start(self):
+        '''Connect in background and keep reconnecting.'''
+        self._client.connect_async(self.hostname, self.port, self.keepalive)
+        self._client.loop_start()
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def topics(self):
+        with self._lock:
+            return sorted(self._data.keys())
+
+    def latest(self, topic, default=None):
+        '''Return latest value of the topic.'''
+        with self._lock:
+            d = self._data.get(topic)
+            return d[-1][2] if d else default
+
+    def history(self, topic):
+        '''Return list of (timestamp, value) kept for the topic, oldest first.'''
+        with self._lock:
+            return [(t, v) for _, t, v in self._data.get(topic, [])]
+
+    def pop(self, topic):
+        '''Return list of values received since last pop for the topic, oldest first.'''
+        with self._lock:
+            last = self._read.get(topic, 0)
+            values = [v for s, _, v in self._data.get(topic, []) if s > last]
+            self._read[topic] = self._seq
+            return values
+
+    def _on_connect(self, client, userdata, flags, rc):
+        # Subscribe on every (re)connect. Clean session drops subscriptions.
+        client.subscribe(self.topic)
+
+    def _on_message(self, client, userdata, msg):
+        with self._lock:
+            self._seq += 1
+            if msg.topic not in self._data:
+                self._data[msg.topic] = deque(maxlen=self._history)
+            self._data[msg.topic].append((self._seq, time.time(), _value(msg.payload)))
+
+
+class Publisher(object):
+    '''Publish via single connection. Reconnect automatically in the network thread of paho.'''
+
+    def __init__(self, hostname=HOSTNAME, port=PORT, keepalive=KEEPALIVE, queue=QUEUE):
+        self.hostname = hostname
+        self.port = port
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._queue = deque(maxlen=queue)  # (topic, payload, retain)
+        self._connected = False
+        self._client = mqtt.Client()
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+
+    def start(self):
+        '''Connect in background and keep reconnecting.'''
+        self._client.connect_async(self.hostname, self.port, self.keepalive)
+        self._client.loop_start()
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def publish(self, topic, payload, retain=False):
+        self.publish_many([(topic, payload)], retain=retain)
+
+    def publish_many(self, messages, retain=False):
+        '''Queue list of (topic, payload) and send all queued messages if connected. Never blocks on the network.'''
+        with self._lock:
+            self._queue.extend((t, p, retain) for t, p in messages)
+            self._flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue)
+
+    def _flush(self):
+        while self._connected and self._queue:
+            topic, payload, retain = self._queue[0]
+            if self._client.publish(topic, payload, retain=retain)[0] != mqtt.MQTT_ERR_SUCCESS:
+                break
+            self._queue.popleft()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        with self._lock:
+            self._connected = rc == 0
+            self._flush()
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self._connected = False
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    '''Return Publisher shared by the process. Start it on first call.'''
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = Publisher()
+            _publisher.start()
+        return _publisher
+
+
+# Use this trick to execute the file. Normally, it's a module to be imported.
+if __name__ == "__main__":
+    s = Subscriber(sys.argv[1] if len(sys.argv) > 1 else '#')
+    s.start()
+    while True:
+        time.sleep(10)
+        for t in s.topics():
+            print t, s.latest(t)
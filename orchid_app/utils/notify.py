@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+'''
+Asynchronous notifications dispatcher.
+send() puts the message into bounded queue and returns immediately. Background thread delivers it by every channel
+(mail, Pushbullet). Slow or failing server doesn't stall the caller: sensors sampling or actuation.
+
+- SMTP connection is kept logged in between messages.
+- Messages of the same subject within COALESCE_WINDOW are coalesced: the first one goes out at once,
+  the next ones are held and sent as one message with the last body and number of repeats at the end of the window.
+- Failed delivery by a channel is retried with exponential backoff, other channels aren't affected.
+  Every Pushbullet API key is a channel: retry doesn't send the note again to accounts which got it.
+
+Usage as module:
+    d = notify.get_dispatcher()   # Shared by the process. Started on first call.
+    d.send('Test-icles', 'Perfect body')
+
+Usage as standalone:
+    python notify.py 'Test-icles' 'Perfect body'
+
+Author: iGrowing
+'''
+
+import sys
+import time
+import heapq
+import threading
+import Queue
+from functools import partial
+
+import pushb
+import sendmail
+
+QUEUE = 100             # Messages waiting for delivery. New messages are dropped when full.
+COALESCE_WINDOW = 300   # seconds.
+RETRIES = 5             # Attempts per channel after the first one.
+BACKOFF = 10            # seconds. Delay before first retry, doubled for every next one.
+
+
+class Dispatcher(object):
+
+    def __init__(self, channels, queue=QUEUE, window=COALESCE_WINDOW, retries=RETRIES, backoff=BACKOFF):
+        '''
+        :param channels: list of (name, function(subject, body)). Function raises on delivery failure.
+        '''
+        self.channels = channels
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = Queue.Queue(queue)
+        self._subjects = {}  # subject: [time sent, number of held messages, last held body]
+        self._retry = []     # Heap of (due time, attempt, channel index, subject, body)
+        self._busy = False   # Message is taken from the queue and being delivered.
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='notify')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        '''Stop the thread. Held messages and retries are dropped.'''
+        self._stopped = True
+        try:
+            self._queue.put_nowait(None)
+        except Queue.Full:
+            pass
+        self._thread.join(1)
+
+    def send(self, subject, body):
+        '''Queue the message. Never blocks. Return False if the queue is full and the message is dropped.'''
+        try:
+            self._queue.put_nowait((subject, body))
+            return True
+        except Queue.Full:
+            sys.stderr.write('Notification queue is full, dropped: %s\n' % subject)
+            return False
+
+    def pending(self):
+        return self._queue.qsize() + len(self._retry) + sum(1 for s in self._subjects.values() if s[1]) + self._busy
+
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self._next_wake())
+            except Queue.Empty:
+                message = None
+            if self._stopped:
+                return
+            self._busy = True
+            try:
+                if message:
+                    self._accept(*message)
+                self._flush_held()
+                self._flush_retries()
+            finally:
+                self._busy = False
+
+    def _next_wake(self):
+        now = time.time()
+        due = [s[0] + self.window for s in self._subjects.values() if s[1]]
+        if self._retry:
+            due.append(self._retry[0][0])
+        return max(0.01, min(due) - now) if due else self.window
+
+    def _accept(self, subject, body):
+        now = time.time()
+        s = self._subjects.get(subject)
+        if s and now - s[0] < self.window:
+            s[1] += 1
+            s[2] = body
+            return
+        self._subjects[subject] = [now, 0, None]
+        self._deliver(subject, body)
+
+    def _flush_held(self):
+        now = time.time()
+        for subject, s in self._subjects.items():
+            if now - s[0] < self.window:
+                continue
+            if s[1]:
+                body = '%s\n\nRepeated %d times in last %d minutes.' % (s[2], s[1], self.window / 60)
+                self._subjects[subject] = [now, 0, None]
+                self._deliver(subject, body)
+            else:
+                del self._subjects[subject]
+
+    def _flush_retries(self):
+        now = time.time()
+        while self._retry and self._retry[0][0] <= now:
+            _, attempt, i, subject, body = heapq.heappop(self._retry)
+            self._deliver(subject, body, [i], attempt)
+
+    def _deliver(self, subject, body, channels=None, attempt=0):
+        for i in channels or range(len(self.channels)):
+            name, func = self.channels[i]
+            try:
+                func(subject, body)
+            except Exception as e:
+                if attempt < self.retries:
+                    heapq.heappush(self._retry, (time.time() + self.backoff * 2 ** attempt, attempt + 1, i, subject, body))
+                sys.stderr.write('On %s notification (attempt %d): %s (%s)\n' % (name, attempt + 1, e, type(e)))
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    '''Return Dispatcher of mail and Pushbullet shared by the process. Start it on first call.'''
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            mailer = sendmail.Mailer()
+            channels = [('mail', mailer.send)]
+            for i, key in enumerate(pushb.get_keys()):
+                channels.append(('pushbullet %d' % (i + 1), partial(pushb.send_note, keys=[key])))
+            _dispatcher = Dispatcher(channels)
+            _dispatcher.start()
+        return _dispatcher
+
+
+# Use this trick to execute the file. Normally, it's a module to be imported.
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print "Usage as standalone:\n    python notify.py 'Test-icles' 'Perfect body'"
+        sys.exit(1)
+
+    d = get_dispatcher()
+    d.send(sys.argv[1], sys.argv[2])
+    while d.pending():
+        time.sleep(1)
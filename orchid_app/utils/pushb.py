@@ -20,23 +20,53 @@ Author: iGrowing
 '''
 
 import sys
+import time
 import private
-from pushbullet import PushBullet
+import pushbullet
 
-def send_note(title, body):
+HOST = getattr(private, 'PUSHBULLET_HOST', pushbullet.HOST)
+DEVICES_TTL = 3600  # seconds. Keep list of phones per API key instead of fetching it for every note.
+_clients = {}       # API key: PushBullet. Keeps its HTTP connection alive between notes.
+_phones = {}        # API key: (expiration time, list of device idens)
+
+
+def get_client(key):
+    if key not in _clients:
+        _clients[key] = pushbullet.PushBullet(key, HOST)
+    return _clients[key]
+
+
+def get_phones(p, key):
+    '''Return idens of phones linked to the account. Fetch them once in DEVICES_TTL.'''
+    expires, phones = _phones.get(key, (0, None))
+    if expires < time.time():
+        phones = [d['iden'] for d in p.getDevices() if d.get('icon') == 'phone']
+        _phones[key] = (time.time() + DEVICES_TTL, phones)
+    return phones
+
+
+def get_keys():
+    '''Return list of API keys of PUSHBULLET_API_KEY provided in private.py. It can be a key or list of keys.'''
+    if isinstance(private.PUSHBULLET_API_KEY, basestring):
+        private.PUSHBULLET_API_KEY = [private.PUSHBULLET_API_KEY]
+    return private.PUSHBULLET_API_KEY
+
+
+def send_note(title, body, keys=None):
     '''Sends Pushbullet notification to all mobile devices linked to your account.
     The account details are derived from PUSHBULLET_API_KEY provided in private.py.
     Title and body text must be provided.
+    :param keys: send by these API keys only. Default: all keys.
     '''
-    if type(private.PUSHBULLET_API_KEY) != iter:
-        private.PUSHBULLET_API_KEY = [private.PUSHBULLET_API_KEY]
-
-    for key in private.PUSHBULLET_API_KEY:
-        p = PushBullet(key)
-        devices = p.getDevices()
-        for d in devices:
-            if d['icon'] == 'phone':
-                p.pushNote(d['iden'], title=title, body=body)
+    for key in keys or get_keys():
+        p = get_client(key)
+        try:
+            p.pushNotes(get_phones(p, key), title=title, body=body)
+        except Exception:
+            # The device could be removed or the connection broken. Start fresh on retry.
+            _phones.pop(key, None)
+            _clients.pop(key, None)
+            raise
 
 
 # Use this trick to execute the file. Normally, it's a module to be imported.
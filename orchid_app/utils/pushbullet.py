@@ -24,24 +24,25 @@ HOST = "https://api.pushbullet.com/v2"
 
 
 class PushBullet():
-    def __init__(self, apiKey):
+    def __init__(self, apiKey, host=HOST):
         self.apiKey = apiKey
+        self.host = host
+        # Keep-alive session: requests of the same client reuse one TLS connection.
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(self.apiKey, "")
+        self.session.headers.update({"Accept": "application/json",
+                                     "Content-Type": "application/json",
+                                     "User-Agent": "pyPushBullet"})
 
     def _request(self, method, url, postdata=None, params=None, files=None):
-        headers = {"Accept": "application/json",
-                   "Content-Type": "application/json",
-                   "User-Agent": "pyPushBullet"}
-
         if postdata:
             postdata = json.dumps(postdata)
 
-        r = requests.request(method,
-                             url,
-                             data=postdata,
-                             params=params,
-                             headers=headers,
-                             files=files,
-                             auth=HTTPBasicAuth(self.apiKey, ""))
+        r = self.session.request(method,
+                                 url,
+                                 data=postdata,
+                                 params=params,
+                                 files=files)
 
         r.raise_for_status()
         return r.json()
@@ -59,7 +60,7 @@ class PushBullet():
         data = {"nickname": device_name,
                 "type": "stream"
                 }
-        return self._request("POST", HOST + "/devices", data)
+        return self._request("POST", self.host + "/devices", data)
 
     def getDevices(self):
         """ Get devices
@@ -68,7 +69,7 @@ class PushBullet():
             Get a list of devices, and data about them.
         """
 
-        return self._request("GET", HOST + "/devices")["devices"]
+        return self._request("GET", self.host + "/devices")["devices"]
 
     def deleteDevice(self, device_iden):
         """ Delete a device
@@ -78,7 +79,7 @@ class PushBullet():
             device_iden -- iden of device to push to
         """
 
-        return self._request("DELETE", HOST + "/devices/" + device_iden)
+        return self._request("DELETE", self.host + "/devices/" + device_iden)
 
     def pushNote(self, recipient, title, body, recipient_type="device_iden"):
         """ Push a note
@@ -97,7 +98,24 @@ class PushBullet():
 
         data[recipient_type] = recipient
 
-        return self._request("POST", HOST + "/pushes", data)
+        return self._request("POST", self.host + "/pushes", data)
+
+    def pushNotes(self, recipients, title, body, recipient_type="device_iden"):
+        """ Push a note to several recipients
+            https://docs.pushbullet.com/v2/pushes
+
+            Just a loop over pushNote(): the API takes one recipient per
+            push, so this is one POST per recipient. The POSTs reuse the
+            keep-alive connection of the session.
+
+            Arguments:
+            recipients -- list of recipients
+            title -- a title for the note
+            body -- the body of the note
+            recipient_type -- a type of recipient (device, email, channel or client)
+        """
+
+        return [self.pushNote(r, title, body, recipient_type) for r in recipients]
 
     def pushAddress(self, recipient, name, address, recipient_type="device_iden"):
         """ Push an address
@@ -116,7 +134,7 @@ class PushBullet():
 				
         data[recipient_type] = recipient
 				
-        return self._request("POST", HOST + "/pushes", data)
+        return self._request("POST", self.host + "/pushes", data)
 
     def pushList(self, recipient, title, items, recipient_type="device_iden"):
         """ Push a list
@@ -135,7 +153,7 @@ class PushBullet():
 				
         data[recipient_type] = recipient
 
-        return self._request("POST", HOST + "/pushes", data)
+        return self._request("POST", self.host + "/pushes", data)
 
     def pushLink(self, recipient, title, url, recipient_type="device_iden"):
         """ Push a link
@@ -154,7 +172,7 @@ class PushBullet():
 				
         data[recipient_type] = recipient
 				
-        return self._request("POST", HOST + "/pushes", data)
+        return self._request("POST", self.host + "/pushes", data)
 
     def pushFile(self, recipient, file_name, body, file, file_type=None, recipient_type="device_iden"):
         """ Push a file
@@ -193,7 +211,7 @@ class PushBullet():
                 "file_type": file_type}
 
         upload_request = self._request("GET",
-                                       HOST + "/upload-request",
+                                       self.host + "/upload-request",
                                        None,
                                        data)
 
@@ -212,7 +230,7 @@ class PushBullet():
 				
         data[recipient_type] = recipient
 
-        return self._request("POST", HOST + "/pushes", data)
+        return self._request("POST", self.host + "/pushes", data)
 
     def getPushHistory(self, modified_after=0, cursor=None):
         """ Get Push History
@@ -227,7 +245,7 @@ class PushBullet():
         data = {"modified_after": modified_after}
         if cursor:
             data["cursor"] = cursor
-        return self._request("GET", HOST + "/pushes", None, data)["pushes"]
+        return self._request("GET", self.host + "/pushes", None, data)["pushes"]
 
     def deletePush(self, push_iden):
         """ Delete push
@@ -236,7 +254,7 @@ class PushBullet():
             Arguments:
             push_iden -- the iden of the push to delete
         """
-        return self._request("DELETE", HOST + "/pushes/" + push_iden)
+        return self._request("DELETE", self.host + "/pushes/" + push_iden)
 
     def getContacts(self):
         """ Gets your contacts
@@ -244,7 +262,7 @@ class PushBullet():
 
             returns a list of contacts
         """
-        return self._request("GET", HOST + "/contacts")["contacts"]
+        return self._request("GET", self.host + "/contacts")["contacts"]
 
     def deleteContact(self, contact_iden):
         """ Delete a contact
@@ -253,13 +271,13 @@ class PushBullet():
             Arguments:
             contact_iden -- the iden of the contact to delete
         """
-        return self._request("DELETE", HOST + "/contacts/" + contact_iden)
+        return self._request("DELETE", self.host + "/contacts/" + contact_iden)
 
     def getUser(self):
         """ Get this users information
             https://docs.pushbullet.com/v2/users
         """
-        return self._request("GET", HOST + "/users/me")
+        return self._request("GET", self.host + "/users/me")
 
     def dismissEphemeral(self, notification_id, notification_tag, package_name, source_user_iden):
         """ Marks an ephemeral notification as dismissed
@@ -278,7 +296,7 @@ class PushBullet():
                          "type": "dismissal"},
                 "type": "push"}
 
-        return self._request("POST", HOST + "/ephemerals", data)
+        return self._request("POST", self.host + "/ephemerals", data)
 
     def realtime(self, callback):
         """ Opens a Realtime Event Stream
@@ -16,6 +16,10 @@ Usage as module:
     import sendmail  # private.py must be ready.
     sendmail.sendmail('Test-icles', 'Perfect body')
 
+    m = sendmail.Mailer()  # Keeps logged in SMTP connection for next messages.
+    m.send('Test-icles', 'Perfect body')
+    m.close()
+
 Usage as standalone:
     python sendmail.py 'Test-icles' 'Perfect body'
 
@@ -29,27 +33,67 @@ import private
 from email.MIMEText import MIMEText
 from email.MIMEMultipart import MIMEMultipart
 
-def sendmail(subject, body):
-    '''Sends mail from your account to list of recipients provided in private.py.
-    Subject and body text must be provided.
-    '''
 
+def _message(subject, body):
     msg = MIMEMultipart()
     msg['From'] = private.EMAIL_HOST_USER
     # Create recipient list as string for the MIME object. Pass actual contacts as list in sendmail().
     msg['To'] = '; '.join(private.CONTACTS)
     msg['Subject'] = subject
     msg.attach(MIMEText(body, 'plain'))
+    return msg
 
+
+def _connect():
     server = smtplib.SMTP(private.EMAIL_HOST, private.EMAIL_PORT)
     if private.EMAIL_USE_TLS:
         server.starttls()
-    server.login(msg['From'], private.EMAIL_HOST_PASSWORD)
+    server.login(private.EMAIL_HOST_USER, private.EMAIL_HOST_PASSWORD)
+    return server
+
+
+def sendmail(subject, body):
+    '''Sends mail from your account to list of recipients provided in private.py.
+    Subject and body text must be provided.
+    '''
+
+    msg = _message(subject, body)
+    server = _connect()
     # Raise mail sending error.
     server.sendmail(msg['From'], private.CONTACTS, msg.as_string())
     server.quit()
 
 
+class Mailer(object):
+    '''Keep SMTP connection (STARTTLS and login done once) for next messages. Not thread safe.'''
+
+    def __init__(self):
+        self._server = None
+
+    def send(self, subject, body):
+        '''Send the mail. Reconnect once if the server dropped idle connection. Raise mail sending error.'''
+
+        msg = _message(subject, body)
+        for attempt in (0, 1):
+            if self._server is None:
+                self._server = _connect()
+            try:
+                self._server.sendmail(msg['From'], private.CONTACTS, msg.as_string())
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                pass
+        self._server = None
+
+
 # Use this trick to execute the file. Normally, it's a module to be imported.
 if __name__ == "__main__":
     if len(sys.argv) < 3:
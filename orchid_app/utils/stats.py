@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+'''
+Streaming statistics.
+Accumulator keeps count, mean, min, max and variance of a series in constant memory (Welford's algorithm).
+Values are added one by one, nothing is stored. Accumulators of parts of the series can be merged (Chan et al).
+
+Usage as module:
+    a = stats.Accumulator()
+    a.add(20.5)
+    a.add('21.1')          # Strings of numbers are accepted.
+    a.mean, a.min, a.max, a.stddev
+    a.merge(other)         # a covers both series now.
+
+Author: iGrowing
+'''
+
+import math
+
+
+class Accumulator(object):
+
+    __slots__ = ('count', 'mean', 'min', 'max', '_m2')
+
+    def __init__(self, values=()):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0  # Sum of squares of differences from the mean.
+        for v in values:
+            self.add(v)
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return 'Accumulator(count=%d, mean=%s, min=%s, max=%s, stddev=%s)' % (
+            self.count, self.mean, self.min, self.max, self.stddev)
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def extend(self, values):
+        for v in values:
+            self.add(v)
+
+    def merge(self, other):
+        '''Add series of other Accumulator to this one. Return self.'''
+
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.min, self.max, self._m2 = \
+                other.count, other.mean, other.min, other.max, other._m2
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        '''Sample variance. Zero for less than 2 values.'''
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
@@ -43,11 +43,31 @@ Out[49]:
 
 '''
 
+import os
+import sys
 import time
 import psutil
 import pprint
+import threading
+import collections
 from __init__ import memoize
 
+PERIOD = 10     # seconds. Background sampler refreshes the snapshot once in period.
+HISTORY = 360   # samples. 1 hour of CPU load and temperature trends.
+
+# Read the template once. The module can be called from different locations, so the path is relative to the module.
+try:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sysinfo_template.html'), 'r') as f:
+        TEMPLATE = f.read()
+except IOError:
+    TEMPLATE = None
+
+# Immutable result of one sample. Replaced as a whole, so readers get consistent data without locking.
+# data: dictionary of get_sysinfo_d() structure. Don't modify it.
+# html: data rendered by the template.
+# history: tuple of (time, CPU load, CPU temperature), oldest first.
+Snapshot = collections.namedtuple('Snapshot', 'time data html history')
+
 
 def read_cpu_temp():
     try:
@@ -111,6 +131,8 @@ def read_network():
     d['counters'] = {
         'sent_MB': int(s.bytes_sent/1024/1024),
         'recv_MB': int(s.bytes_recv/1024/1024),
+        'sent_B': s.bytes_sent,
+        'recv_B': s.bytes_recv,
         'errors': s.errin + s.errout,
         'drops': s.dropin + s.dropout,
     }
@@ -132,19 +154,13 @@ def get_sysinfo_s():
 
 
 def get_sysinfo_html():
-    # TODO: Rewrite. This is ugly brute-force implementation. Build dynamic page generator.
-    # Reconsidering data structure can help.
-    # TODO: Add chart generation and output.
+    return get_snapshot().html
 
-    d = get_sysinfo_d()
 
-    # Get the template from file in relative path. The module can be called from different locations. So the template must be always available.
-    tmp_file = '/'.join(__file__.split('/')[:-1]) + '/sysinfo_template.html'
-    try:
-        f = open(tmp_file, 'r')
-        template = f.read()
-        f.close()
-    except Exception as e:
+def render_html(d):
+    # TODO: Rewrite. This is ugly brute-force implementation. Build dynamic page generator.
+    # Reconsidering data structure can help.
+    if TEMPLATE is None:
         return 'Error occurred on opening template.'
 
     datetime = d['system']['datetime']
@@ -171,13 +187,67 @@ def get_sysinfo_html():
     rx = d['network']['counters']['recv_MB']
     errors = d['network']['counters']['errors']
     drops = d['network']['counters']['drops']
-    e_speed = d['network']['eth0']['speed']
-    e_mtu = d['network']['eth0']['mtu']
-    w_speed = d['network']['wlan0']['speed']
-    w_mtu = d['network']['wlan0']['mtu']
+    eth0 = d['network'].get('eth0', {})
+    wlan0 = d['network'].get('wlan0', {})
+    e_speed = eth0.get('speed', 'N/A')
+    e_mtu = eth0.get('mtu', 'N/A')
+    w_speed = wlan0.get('speed', 'N/A')
+    w_mtu = wlan0.get('mtu', 'N/A')
     pct = '%'
 
-    return template % locals()
+    return TEMPLATE % locals()
+
+
+class Sampler(object):
+    '''Refresh sysinfo Snapshot in background thread. Readers (runner, views) take the snapshot without sampling.'''
+
+    def __init__(self, period=PERIOD, history=HISTORY):
+        self.period = period
+        self.snapshot = None
+        self._history = collections.deque(maxlen=history)
+        self._thread = None
+
+    def start(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='sysinfo')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def sample(self):
+        d = {
+            'system': read_system(_refresh=True),
+            'cpu': read_cpu(_refresh=True),
+            'memory': read_memory(_refresh=True),
+            'network': read_network(_refresh=True),
+        }
+        now = time.time()
+        self._history.append((now, d['cpu']['load']['current'], d['cpu']['temp']['current']))
+        self.snapshot = Snapshot(now, d, render_html(d), tuple(self._history))
+        return self.snapshot
+
+    def _run(self):
+        while True:
+            time.sleep(self.period)
+            try:
+                self.sample()
+            except Exception as e:
+                sys.stderr.write('On sysinfo sample: %s (%s)' % (e.message, type(e)))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_snapshot():
+    '''Return last Snapshot of the process. Start background sampler on first call.'''
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            sampler = Sampler()
+            sampler.start()
+            _sampler = sampler
+    return _sampler.snapshot
+
 
 keys = []
 values = []
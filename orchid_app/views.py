@@ -1,13 +1,20 @@
 import re
 import os
+import time
+import calendar
+import hashlib
 import django_tables2 as tables
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.core import exceptions
 from django.contrib import messages
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_GET
 
-from . import models
+from . import cache, export, metrics, models, paging, rollup, rrd, utils
+from orchid_app.utils import downsample
 from forms import ActionsForm, SystemForm
 import orchid_app.controller as controller
 import orchid_app.utils.sysinfo as sysinfo
@@ -15,6 +22,10 @@ import orchid_app.utils.sysinfo as sysinfo
 import warnings
 warnings.filterwarnings('ignore')
 
+SERIES_POINTS = 500        # Default number of points per field in sensors_series().
+SERIES_MAX_POINTS = 5000
+SERIES_RANGE = 24          # hours. Default time range of sensors_series().
+
 
 class SensorTable(tables.Table):
     date = tables.DateTimeColumn(short=True)  # still doesn't work.
@@ -43,58 +54,32 @@ class ActionTable(tables.Table):
 def list(request):
     # Use auto_id for further form changes
     form = ActionsForm(request.POST or None, auto_id=True)
-    # Get actions template
-    a = controller.get_last_action()
 
     if request.method == "POST":
         if form.is_valid():
-            a = parse_user_input(a, request)
+            # Get actions template
+            cache.actions.sync()
+            parse_user_input(controller.get_last_action(), request)
             return redirect('/')
     else:
         form = ActionsForm()
 
-    for k, v in a.iteritems():
-        a[k] = _verb(v)
-
-    form.water = a.water
+    context = _get_dashboard(form)
 
-    qs = models.Sensors.objects.all().order_by('-date')  # filter(date=request.date
-    paginator = Paginator(qs, 30)
-    page = request.GET.get('page')
-    try:
-        table = paginator.page(page)
-    except PageNotAnInteger:
-        table = paginator.page(1)
-    except EmptyPage:
-        table = paginator.page(paginator.num_pages)
-
-    # Keep reference to page. Dirty trick. TODO: improve.
-    pp = table
+    # Keyset pagination by date: no OFFSET and no COUNT per page.
+    pp = paging.KeysetPage(models.Sensors.objects.all(), request.GET)
     # Convert current page into table.
-    table = SensorTable(table)
-    total = qs.count()
-
-    statuses = [False for i in range(len(controller.state_list))]
-    i = controller.get_current_state()[1]
-    if i != controller.NO_DATA:
-        statuses[i] = True
-
-    al = _get_next_actions_parsed()
-    tl = _get_timer_actions_parsed()
-
-    context = {'form': form, 'paginator': pp, 'total': total, 'table': table, 'actuators': a, 'statuses': statuses,
-               'actionList': al, 'timerList': tl,
-               }
+    context.update({'paginator': pp, 'total': pp.total, 'table': SensorTable(pp.object_list)})
 
     return render(request, 'orchid_app/sensor_list.html', context)
 
 
 def action_list(request):
     form = ActionsForm(request.POST or None, auto_id=True)
-    a = controller.get_last_action()
     if request.method == "POST":
         if form.is_valid():
-            a = parse_user_input(a, request)
+            cache.actions.sync()
+            parse_user_input(controller.get_last_action(), request)
             # Use POST-Redirect-GET concept (PRG). This avoids "form resubmission" from browser on page refresh (F5).
             # Huge notice: The redirection path is RELATIVE. It relates to the page the form is loaded.
             # Therefore, an argument for every redirect must start with slash /, which means 'absolute path from root of the app'.
@@ -102,39 +87,12 @@ def action_list(request):
     else:
         form = ActionsForm()
 
-    # Standartize/verbose actuator form values.
-    for k, v in a.iteritems():
-        a[k] = _verb(v)
+    context = _get_dashboard(form)
 
-    form.water = a.water
-    qs = models.Actions.objects.all().order_by('-date')  # filter(date=request.date
-    paginator = Paginator(qs, 30)
-    page = request.GET.get('page')
-    try:
-        table = paginator.page(page)
-    except PageNotAnInteger:
-        table = paginator.page(1)
-    except EmptyPage:
-        table = paginator.page(paginator.num_pages)
-
-    # Keep reference to page. Dirty trick. TODO: improve.
-    pp = table
+    # Keyset pagination by date: no OFFSET and no COUNT per page.
+    pp = paging.KeysetPage(models.Actions.objects.all(), request.GET)
     # Convert current page into table.
-    table = ActionTable(table)
-
-    total = qs.count()
-
-    statuses = [False for i in range(len(controller.state_list))]
-    i = controller.get_current_state()[1]
-    if i != controller.NO_DATA:
-        statuses[i] = True
-
-    al = _get_next_actions_parsed()
-    tl = _get_timer_actions_parsed()
-
-    context = {'form': form, 'paginator': pp, 'total': total, 'table': table, 'actuators': a, 'statuses': statuses,
-               'actionList': al, 'timerList': tl,
-               }
+    context.update({'paginator': pp, 'total': pp.total, 'table': ActionTable(pp.object_list)})
 
     return render(request, 'orchid_app/action_list.html', context)
 
@@ -160,16 +118,179 @@ def sysinfo_list(request):
     else:
         form = SystemForm()
 
-    si = sysinfo.get_sysinfo_html()
-    chart_data = sysinfo.get_sysinfo_d()
+    snapshot = sysinfo.get_snapshot()
+    chart_data = snapshot.data
     charts = {
         'CPU': chart_data['cpu']['load']['current'],
         'RAM': chart_data['memory']['RAM_MB']['percent'],
         'Flash': chart_data['memory']['flash_GB']['percent'],
         'Temp': chart_data['cpu']['temp']['current'],
     }
+    # CPU load and temperature trends: (milliseconds since epoch, load, temperature).
+    trends = [(int(t * 1000), load, temp) for t, load, temp in snapshot.history]
+
+    return render(request, 'orchid_app/sysinfo_list.html',
+                  {'form': form, 'sysinfo': snapshot.html, 'charts': charts, 'trends': trends})
+
+
+def _series_until():
+    '''Default until of sensors_series(): now rounded up to sensors poll period.
+    The sliding window moves by whole periods, so the response is the same within a period.
+    '''
+    now = int(time.time())
+    return datetime.fromtimestamp(now - now % rollup.RAW_PERIOD + rollup.RAW_PERIOD, timezone.utc)
+
+
+def _series_last_modified(request):
+    # Date of last Sensors record. Rollups and raw data change together with it.
+    # Without until in the query the window slides: it's modified on every move too.
+    if not hasattr(request, '_series_last'):
+        last = models.Sensors.objects.order_by('-date').values_list('date', flat=True).first()
+        if not request.GET.get('until'):
+            moved = _series_until() - timedelta(seconds=rollup.RAW_PERIOD)
+            last = max(last, moved) if last else moved
+        request._series_last = last
+    return request._series_last
+
 
-    return render(request, 'orchid_app/sysinfo_list.html', {'form': form, 'sysinfo': si, 'charts': charts})
+def _series_etag(request):
+    last = _series_last_modified(request)
+    until = '' if request.GET.get('until') else _series_until()
+    return hashlib.md5('%s|%s|%s' % (request.GET.urlencode(), last, until)).hexdigest()
+
+
+def _parse_time(value, default):
+    '''Parse epoch seconds, ISO date or datetime (naive is local time) into aware datetime.'''
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        pass
+    d = parse_datetime(value)
+    if d is None and parse_date(value):
+        d = datetime.combine(parse_date(value), datetime.min.time())
+    if d is None:
+        raise ValueError('Wrong time: %s' % value)
+    return timezone.make_aware(d) if timezone.is_naive(d) else d
+
+
+@require_GET
+@condition(etag_func=_series_etag, last_modified_func=_series_last_modified)
+def sensors_series(request):
+    '''JSON time series of sensors data for charts. Parameters of query string:
+        fields:  comma separated Sensors fields. Default: all.
+        since, until:  epoch seconds, ISO date or datetime. Default: last SERIES_RANGE hours,
+                       until now rounded up to sensors poll period.
+        points:  maximal number of points per field. Default: SERIES_POINTS.
+        method:  downsampling 'lttb' (default) or 'minmax'.
+    Data is read from the coarsest rollup which gives enough points and downsampled to the points.
+    Response: {'since': ..., 'until': ..., 'resolution': seconds, 'series': {field: {'t': [epoch seconds], 'v': [values]}}}
+    '''
+
+    try:
+        fields = [f for f in request.GET.get('fields', ','.join(rollup.FIELDS)).split(',') if f]
+        wrong = [f for f in fields if f not in rollup.FIELDS]
+        if wrong:
+            raise ValueError('Wrong fields: %s' % ', '.join(wrong))
+        until = _parse_time(request.GET.get('until'), None) or _series_until()
+        since = _parse_time(request.GET.get('since'), until - timedelta(hours=SERIES_RANGE))
+        if since >= until:
+            raise ValueError('Empty time range')
+        points = min(max(int(request.GET.get('points', SERIES_POINTS)), 3), SERIES_MAX_POINTS)
+        method = downsample.METHODS.get(request.GET.get('method', 'lttb'))
+        if not method:
+            raise ValueError('Wrong method: %s' % request.GET['method'])
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    resolution = (until - since).total_seconds() / points
+    period, _ = rollup.source(resolution)
+    rows = rollup.history(since, until, resolution=resolution, fields=fields)
+
+    series = dict((f, []) for f in fields)
+    for r in rows.iterator():
+        t = calendar.timegm(r['date'].utctimetuple())
+        for f in fields:
+            if r[f] is not None:
+                series[f].append((t, float(r[f])))
+
+    data = {'since': calendar.timegm(since.utctimetuple()), 'until': calendar.timegm(until.utctimetuple()),
+            'resolution': period, 'series': {}}
+    for f, s in series.iteritems():
+        s = method(s, points)
+        data['series'][f] = {'t': [p[0] for p in s], 'v': [round(p[1], 2) for p in s]}
+
+    return JsonResponse(data)
+
+
+@require_GET
+def sysinfo_series(request):
+    '''JSON time series of system health for charts. Parameters of query string:
+        sources:  comma separated sources of rrd.SOURCES. Default: all.
+        since, until:  the same as in sensors_series(). Default: last SERIES_RANGE hours.
+        points:  maximal number of points per source. Default: SERIES_POINTS.
+    Data is read from the finest round robin archive which gives not more than the points.
+    Slots are aligned to UTC: points of daily archive (ranges over 90 days) are UTC days, not local ones.
+    Response: {'since': ..., 'until': ..., 'resolution': seconds,
+               'series': {source: {'t': [epoch seconds], 'v': [averages], 'max': [maximums]}}}
+    Not found if the archives are disabled by settings.HEALTH_RRD (default).
+    '''
+
+    health = rrd.get_rrd()
+    if not health:
+        raise Http404('System health archives are disabled')
+    try:
+        sources = [s for s in request.GET.get('sources', ','.join(health.names())).split(',') if s]
+        wrong = [s for s in sources if s not in health.names()]
+        if wrong:
+            raise ValueError('Wrong sources: %s' % ', '.join(wrong))
+        until = _parse_time(request.GET.get('until'), timezone.now())
+        since = _parse_time(request.GET.get('since'), until - timedelta(hours=SERIES_RANGE))
+        if since >= until:
+            raise ValueError('Empty time range')
+        points = min(max(int(request.GET.get('points', SERIES_POINTS)), 3), SERIES_MAX_POINTS)
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    since = calendar.timegm(since.utctimetuple())
+    until = calendar.timegm(until.utctimetuple())
+    step, rows = health.fetch(since, until, resolution=float(until - since) / points, sources=sources)
+
+    series = dict((s, {'t': [], 'v': [], 'max': []}) for s in sources)
+    for t, values in rows:
+        for s, (a, m, _) in values.iteritems():
+            if a is not None:
+                series[s]['t'].append(int(t))
+                series[s]['v'].append(round(a, 4))
+                series[s]['max'].append(round(m, 4))
+
+    return JsonResponse({'since': since, 'until': until, 'resolution': step, 'series': series})
+
+
+@require_GET
+def export_data(request, model, fmt):
+    '''Stream records of model ('sensors' or 'actions') in format fmt ('csv' or 'col').
+    Time range is given by since and until in query string, the same way as in sensors_series(). Default: all records.
+    '''
+
+    if model not in export.MODELS or fmt not in export.FORMATS:
+        raise Http404('Unknown export')
+    try:
+        since = _parse_time(request.GET.get('since'), None)
+        until = _parse_time(request.GET.get('until'), None)
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(export.generate(model, fmt, since, until), content_type=export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (model, fmt)
+    return response
+
+
+@require_GET
+def metrics_text(request):
+    '''Latency histograms of the runner and this process in Prometheus text format.'''
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def parse_user_input(a, request):
@@ -211,40 +332,41 @@ def parse_user_input(a, request):
     return a
 
 
-def _get_next_actions_parsed():
-    '''Return list of actions and times in format per item:
+def _get_dashboard(form):
+    '''Return context of the control panel: actuators, current state, next and timer actions.
+    Read from dashboard snapshot of the control loop, not from the DB.
+    '''
+
+    d = controller.get_dashboard()
+    # Standartize/verbose actuator form values.
+    a = utils.Dict((k, _verb(v)) for k, v in d['actuators'].iteritems())
+    form.water = a.water
+
+    statuses = [False for i in range(len(controller.state_list))]
+    if d['state'] != controller.NO_DATA:
+        statuses[d['state']] = True
+
+    return {'form': form, 'actuators': a, 'statuses': statuses,
+            'actionList': _get_next_actions_parsed(d['next']), 'timerList': _get_timer_actions_parsed(d['timer']),
+            }
+
+
+def _get_next_actions_parsed(actions):
+    '''Convert list of (actuator, due_time, action) into list of actions and times in format per item:
     ['actuator', 'action', 'remaining_time']
     '''
-    al = controller.get_next_action()
-    if al:
-        for i in range(len(al)):
-            al[i] = (al[i][0].capitalize(), _verb(al[i][2]).capitalize(), 'Now' if al[i][1] < 1 else _humanize(al[i][1]))
-    return al
+    now = time.time()
+    return [(act.capitalize(), _verb(todo).capitalize(), 'Now' if due - now < 60 else _humanize((due - now) / 60))
+            for act, due, todo in actions]
 
 
-def _get_timer_actions_parsed():
-    '''Return list of actions and times in format per item:
+def _get_timer_actions_parsed(actions):
+    '''Convert list of (actuator, due_time, action) into list of actions and times in format per item:
     ['actuator', 'action', 'remaining_time']
     '''
-    # Process timer
-    res = []
-    tr = controller.get_timer_order(seconds=True)
-
-    if tr:
-        ad, t_rem = tr  # Unpack timer results
-        # filt = {'reason__icontains': 'timer off'}
-        # qs = models.Actions.objects.filter(**filt).last()
-        # dt = (datetime.now() - qs.date.replace(tzinfo=None)).total_seconds() / 60
-
-        # Do not follow automated rules if timer is active.
-        # if dt < dt + t_rem:
-        if 0 < t_rem:
-            for i in ad:
-                # t_rem = max(0, t_rem)
-                if ad[i]:
-                    res.append((i.capitalize(), _verb(not ad[i]).capitalize(), 'Now' if t_rem < 1 else _humanize(t_rem, with_secs=True)))
-
-    return res
+    now = time.time()
+    return [(act.capitalize(), _verb(todo).capitalize(), 'Now' if due - now < 1 else _humanize(due - now, with_secs=True))
+            for act, due, todo in actions]
 
 
 def _verb(b):
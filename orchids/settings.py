@@ -137,3 +137,21 @@ LOGOUT_REDIRECT_URL = '/'
 SHORT_DATETIME_FORMAT = u'Y N j, H:i'
 DATETIME_FORMAT = u'Y N j, H:i'
 
+
+# Store of raw per-minute sensor samples (see orchid_app/rawstore.py). Optional: it adds SD card writes every minute.
+# Empty value disables the store. To enable, set a directory, e.g. os.path.join(BASE_DIR, 'raw').
+RAW_STORE_DIR = ''
+RAW_STORE_KEEP_DAYS = 30
+
+# Dashboard data built by the control loop and read by the views (see controller.get_dashboard()).
+DASHBOARD_SNAPSHOT = os.path.join(BASE_DIR, 'dashboard.json')
+
+# Round robin archives of system health written by the runner (see orchid_app/rrd.py). Optional: it rewrites
+# a slot of every archive on the SD card every minute. Empty value disables the archives and /api/sysinfo/.
+# To enable, set a file, e.g. os.path.join(BASE_DIR, 'health.rrd').
+HEALTH_RRD = ''
+
+# Timing of runner and controller hot paths (see orchid_app/metrics.py). Served by /metrics and the metrics command.
+# Disabled by default: the runner writes METRICS_FILE on the SD card every long cycle. Set True to profile.
+METRICS_ENABLED = False
+METRICS_FILE = os.path.join(BASE_DIR, 'metrics.json')